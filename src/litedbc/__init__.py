@@ -4,25 +4,39 @@ import os.path
 import sys
 import atexit
 import threading
+import contextlib
 import sqlite3 as sqlite
 import pathlib
-from collections import namedtuple
-from litedbc import misc, errors
+import weakref
+from litedbc import (misc, errors, bulk, transfer, statement, cache, catalog,
+                     dump, blob, advisor)
+from litedbc.backup import BackupManager
+from litedbc.catalog import Catalog, ColumnInfo
+from litedbc.checkpoint import CheckpointManager
 from litedbc.cursor import Cursor
+from litedbc.locking import InstrumentedRLock
+from litedbc.metrics import Metrics
+from litedbc.pool import ConnectionPool
+from litedbc.retry import RetryPolicy
+from litedbc.prepared import PreparedStatement
+from litedbc.session import Session
+from litedbc.slowlog import SlowQueryLog
+from litedbc.writequeue import WriteQueue, WriteResult
 from litedbc.transaction import Transaction
-from litedbc.const import TransactionMode, LockingMode, JournalMode, SyncMode
+from litedbc.const import (TransactionMode, LockingMode, JournalMode, SyncMode,
+                           Profile)
 
 
-__all__ = ["LiteDBC", "ColumnInfo", "LockingMode", "JournalMode",
-           "SyncMode", "TransactionMode", "Transaction",
-           "Cursor", "sqlite"]
+__all__ = ["LiteDBC", "ColumnInfo", "Catalog", "LockingMode", "JournalMode",
+           "SyncMode", "TransactionMode", "Profile", "Transaction",
+           "Cursor", "Session", "PreparedStatement",
+           "WriteQueue", "WriteResult", "BackupManager", "CheckpointManager",
+           "RetryPolicy", "sqlite"]
 
 
 CLOSED_DATABASE_MSG = "Cannot operate on a closed database."
-ColumnInfo = namedtuple("ColumnInfo", ["cid", "name", "type",
-                                       "not_null", "default",
-                                       "primary_key", "foreign_key",
-                                       "index_info"])
+# maximum time in seconds spent waiting to capture the plan of a slow query
+EXPLAIN_TIMEOUT = 0.1
 
 
 class LiteDBC:
@@ -34,7 +48,14 @@ class LiteDBC:
                  timeout=5.0, detect_types=0,
                  cached_statements=128,
                  on_create_db=None, on_create_conn=None,
-                 row_factory=None, text_factory=None):
+                 row_factory=None, text_factory=None,
+                 read_pool_size=0, write_batch_size=256,
+                 write_batch_delay=0.005,
+                 query_cache_size=cache.MAX_ENTRIES,
+                 query_cache_bytes=cache.MAX_BYTES,
+                 metrics=False, lock_profiling=False,
+                 slow_query_ms=None, slow_query_file=None,
+                 slow_query_redact=False, profile=None, retry_policy=None):
         """
         Init
 
@@ -49,6 +70,44 @@ class LiteDBC:
         - on_create_conn: callback called just after the connection to the database
             and the execution of on_create_db.
             This callback must accept the dbc instance as argument
+        - read_pool_size: maximum number of read-only connections used to run
+            SELECT statements outside of transactions. Set it to 0 (default)
+            to run everything on a single connection. This is intended for
+            databases in WAL mode, where readers don't block the writer.
+            Note that temporary tables and connection-specific functions
+            such as last_insert_rowid() aren't shared with pooled connections.
+            Ignored for in-memory databases
+        - write_batch_size: maximum number of statements submitted with
+            the 'submit' method that are committed in a single transaction
+        - write_batch_delay: time in seconds the write queue waits for more
+            statements once it has received the first statement of a batch
+        - query_cache_size: maximum number of results kept by 'cached_query'
+        - query_cache_bytes: maximum size in bytes of the results
+            kept by 'cached_query'
+        - metrics: set it to True, or to a litedbc.metrics.Metrics instance,
+            to record per-statement latencies, write lock waits and
+            transaction durations. See the 'metrics' method
+        - lock_profiling: set it to True to use a
+            litedbc.locking.InstrumentedRLock as write lock. It records
+            wait and hold times per call site (see 'lock_report') and
+            can run a watchdog (see 'write_lock.start_watchdog')
+        - slow_query_ms: threshold in milliseconds above which statements
+            run through a Cursor are recorded with their query plan.
+            See the 'slow_queries' method and litedbc.slowlog
+        - slow_query_file: filename of a JSONL file where slow statements
+            are also written
+        - slow_query_redact: set it to True to hide the parameters of slow
+            statements, or to a function that accepts and returns them
+        - profile: litedbc.const.Profile (or its name, or a dict
+            {pragma: value}) applied to every connection, right after
+            it is opened. Pragmas that change the database file
+            (journal_mode, page_size) are only set by the main connection
+            of a dbc that isn't read-only. See also the 'profile' method
+        - retry_policy: litedbc.retry.RetryPolicy used to retry, with
+            backoff, the operations that fail because the database is
+            busy once 'timeout' has expired: statements executed outside
+            of a transaction, BEGIN and COMMIT statements of transactions,
+            and the bodies passed to 'run_transaction'
         """
         self._filename = misc.ensure_db_filename(filename)
         self._init_script = init_script
@@ -61,7 +120,23 @@ class LiteDBC:
         self._on_create_conn = on_create_conn
         self._row_factory = row_factory
         self._text_factory = str if text_factory is None else text_factory
-        self._write_lock = threading.RLock()
+        self._read_pool_size = read_pool_size
+        self._write_batch_size = write_batch_size
+        self._write_batch_delay = write_batch_delay
+        self._query_cache = cache.QueryCache(query_cache_size, query_cache_bytes)
+        self._metrics = Metrics() if metrics is True else (metrics or None)
+        self._lock_profiling = lock_profiling
+        self._profile = profile
+        self._retry_policy = retry_policy
+        self._profile_pragmas = None
+        self._slow_query_log = None
+        if slow_query_ms is not None:
+            self._slow_query_log = SlowQueryLog(slow_query_ms,
+                                                filename=slow_query_file,
+                                                redact=slow_query_redact,
+                                                explain=self._explain)
+        self._write_lock = (InstrumentedRLock() if lock_profiling
+                            else threading.RLock())
         self._vars_lock = threading.RLock()
         self._in_memory = True if self._filename == ":memory:" else False
         self._is_closed = False
@@ -70,6 +145,20 @@ class LiteDBC:
         self._context_count = 0
         self._transaction_context_count = 0
         self._conn = None
+        self._read_pool = None
+        self._write_queue = None
+        self._catalog = None
+        self._explain_conn = None
+        self._explain_lock = threading.Lock()
+        self._backup_managers = list()
+        self._checkpoint_manager = None
+        self._conn_hooks = dict()
+        self._write_sites = set()  # call sites of AUTO transactions that wrote
+        self._savepoints = 0  # depth of the nested transactions, see Transaction
+        self._sessions = weakref.WeakSet()
+        self._thread_local = threading.local()
+        if profile is not None:
+            self._profile_pragmas = misc.get_profile_pragmas(profile)
         self._setup()
 
     # ====================================
@@ -120,6 +209,68 @@ class LiteDBC:
     def text_factory(self):
         return self._conn.text_factory
 
+    @property
+    def read_pool_size(self):
+        return self._read_pool_size
+
+    @property
+    def read_pool(self):
+        """The pool of read-only connections, or None"""
+        return self._read_pool
+
+    @property
+    def write_batch_size(self):
+        return self._write_batch_size
+
+    @property
+    def write_batch_delay(self):
+        return self._write_batch_delay
+
+    @property
+    def write_queue(self):
+        """The WriteQueue used by 'submit', created on first access"""
+        with self._vars_lock:
+            if self._write_queue is None:
+                if self._is_closed:
+                    raise errors.ProgrammingError(CLOSED_DATABASE_MSG)
+                self._write_queue = WriteQueue(self,
+                                               max_batch=self._write_batch_size,
+                                               max_delay=self._write_batch_delay)
+            return self._write_queue
+
+    @property
+    def query_cache(self):
+        """The QueryCache used by 'cached_query'"""
+        return self._query_cache
+
+    @property
+    def metrics_registry(self):
+        """The litedbc.metrics.Metrics instance, or None if metrics are disabled"""
+        return self._metrics
+
+    @property
+    def profile_pragmas(self):
+        """The (pragma, value) pairs of the profile set at construction
+        time, or None"""
+        return self._profile_pragmas
+
+    @property
+    def write_sites(self):
+        """Call sites ("filename:lineno in function") of the transactions
+        in TransactionMode.AUTO that were found to write"""
+        with self._vars_lock:
+            return frozenset(self._write_sites)
+
+    @property
+    def retry_policy(self):
+        """The litedbc.retry.RetryPolicy instance, or None"""
+        return self._retry_policy
+
+    @property
+    def slow_query_log(self):
+        """The litedbc.slowlog.SlowQueryLog instance, or None if disabled"""
+        return self._slow_query_log
+
     @property
     def in_memory(self):
         return self._in_memory
@@ -136,6 +287,10 @@ class LiteDBC:
     def write_lock(self):
         return self._write_lock
 
+    @property
+    def lock_profiling(self):
+        return self._lock_profiling
+
     @property
     def is_new(self):
         """
@@ -171,12 +326,67 @@ class LiteDBC:
         """Returns a context manager"""
         return Transaction(self, self._conn, mode=TransactionMode.EXCLUSIVE)
 
+    def write_transaction(self):
+        """Returns a context manager for a transaction that is known to write.
+        It starts in IMMEDIATE mode, so that it can't fail with SQLITE_BUSY
+        when its read lock would be upgraded to a write lock"""
+        return Transaction(self, self._conn, mode=TransactionMode.IMMEDIATE)
+
+    def run_transaction(self, func, /, *, retries=None,
+                        transaction_mode=TransactionMode.DEFERRED):
+        """
+        Run func(cursor) in a transaction. When the transaction fails
+        because the database is busy, it is rolled back and func is run
+        again in a new transaction, with the backoff of the retry policy.
+        Thus, func should have no side effects outside of the database
+
+        [parameters]
+        - func: function that accepts a Cursor
+        - retries: maximum number of retries,
+            defaults to the one of the retry policy
+        - transaction_mode: mode of the transaction
+
+        [return]
+        Returns the result of func. Without a retry policy (see the
+        'retry_policy' parameter of the constructor), a default
+        RetryPolicy is used
+        """
+        policy = self._retry_policy
+        policy = RetryPolicy() if policy is None else policy
+
+        def attempt():
+            with self.transaction(transaction_mode) as cur:
+                return func(cur)
+
+        return policy.run(attempt, retries=retries)
+
+    def session(self):
+        """
+        Returns the session of the calling thread, creating it if needed.
+        A session owns a dedicated connection, thus its transaction state
+        isn't shared with other threads.
+        Sessions aren't available for in-memory databases
+        """
+        session = getattr(self._thread_local, "session", None)
+        if session is not None and not session.is_closed:
+            return session
+        if self._in_memory:
+            raise errors.Error("Sessions aren't available for in-memory databases.")
+        with self._vars_lock:
+            if self._is_closed:
+                raise errors.ProgrammingError(CLOSED_DATABASE_MSG)
+            conn = self._create_secondary_connection(query_only=self._is_readonly)
+            session = Session(self, conn)
+            self._sessions.add(session)
+        self._thread_local.session = session
+        return session
+
     def cursor(self):
         """Returns a context manager"""
-        return Cursor(self, self._conn)
+        return Cursor(self, self._conn, pool=self._read_pool)
 
     def execute(self, sql, params=None, /):
-        cur = Cursor(self, self._conn)
+        cur = Cursor(self, self._conn, pool=self._read_pool)
         return cur.execute(sql, params)
 
     def executemany(self, sql, params=None, /):
@@ -187,15 +397,227 @@ class LiteDBC:
         cur = Cursor(self, self._conn)
         return cur.executescript(sql_script, transaction_mode=transaction_mode)
 
+    def prepare(self, sql, /):
+        """Returns a PreparedStatement, to efficiently run
+        the same statement many times"""
+        return PreparedStatement(self, self._conn, sql, pool=self._read_pool)
+
+    def submit(self, sql, params=None, /):
+        """
+        Queue a write statement, to be committed along with other
+        submitted statements in a single transaction (group commit)
+
+        [return]
+        Returns a concurrent.futures.Future that resolves with
+        a WriteResult(lastrowid, rowcount)
+        """
+        return self.write_queue.submit(sql, params)
+
+    def flush(self, timeout=None):
+        """Block until every submitted statement is committed"""
+        with self._vars_lock:
+            write_queue = self._write_queue
+        if write_queue is not None:
+            write_queue.flush(timeout)
+
+    def cached_query(self, sql, params=None, /, *, ttl=None):
+        """
+        Run a query, or return its cached result. A cached result is
+        discarded as soon as the database is modified, either by this
+        connection or by another one (see PRAGMA data_version).
+        Results aren't cached within transactions
+
+        [parameters]
+        - sql: the SELECT statement
+        - params: parameters of the query
+        - ttl: optional time in seconds after which the result expires
+
+        [return]
+        Returns a tuple of rows
+        """
+        key = None
+        if not self._conn.in_transaction:
+            key = cache.make_key(statement.normalize(sql), params)
+        if key is None:
+            with self.cursor() as cur:
+                cur.execute(sql, params)
+                return tuple(cur.fetchall())
+        token = self._get_state_token()
+        rows = self._query_cache.get(key, token)
+        if rows is None:
+            with self.cursor() as cur:
+                cur.execute(sql, params)
+                rows = tuple(cur.fetchall())
+            self._query_cache.put(key, token, rows, ttl)
+        return rows
+
+    def bulk_insert(self, table, columns, rows, *, chunk_rows=None,
+                    commit_every=None, on_conflict=None):
+        """
+        Insert rows with multi-row INSERT statements sized to the
+        limit of variables of the connection
+
+        [parameters]
+        - table: name of the table
+        - columns: sequence of column names
+        - rows: iterable (or generator) of sequences of values
+        - chunk_rows: maximum number of rows per statement
+        - commit_every: number of rows per transaction, None to insert
+            all rows in a single transaction
+        - on_conflict: optional upsert clause,
+            e.g. "ON CONFLICT(name) DO UPDATE SET size=excluded.size"
+
+        [return]
+        Returns the number of rows inserted or updated
+        """
+        return bulk.bulk_insert(self, table, columns, rows,
+                                chunk_rows=chunk_rows,
+                                commit_every=commit_every,
+                                on_conflict=on_conflict)
+
+    def import_csv(self, table, src, columns=None, **kwargs):
+        """
+        Import CSV data into an existing table, in chunked transactions.
+        See litedbc.transfer.import_csv for the keyword arguments
+
+        [return]
+        Returns the number of imported rows
+        """
+        return transfer.import_csv(self, table, src, columns, **kwargs)
+
+    def import_jsonl(self, table, src, columns=None, **kwargs):
+        """
+        Import JSON Lines data into an existing table, in chunked transactions.
+        See litedbc.transfer.import_jsonl for the keyword arguments
+
+        [return]
+        Returns the number of imported rows
+        """
+        return transfer.import_jsonl(self, table, src, columns, **kwargs)
+
+    def export_csv(self, query, dst, params=None, **kwargs):
+        """
+        Stream the result of a query, or a whole table, to a CSV file.
+        See litedbc.transfer.export_csv for the keyword arguments
+
+        [return]
+        Returns the number of exported rows
+        """
+        return transfer.export_csv(self, query, dst, params, **kwargs)
+
+    def export_jsonl(self, query, dst, params=None, **kwargs):
+        """
+        Stream the result of a query, or a whole table, to a JSON Lines file.
+        See litedbc.transfer.export_jsonl for the keyword arguments
+
+        [return]
+        Returns the number of exported rows
+        """
+        return transfer.export_jsonl(self, query, dst, params, **kwargs)
+
+    def get_catalog(self):
+        """
+        Returns the Catalog of the main database, that is, its tables,
+        views and the ColumnInfo of their columns. The catalog is loaded
+        with a few set-based queries, then reused until
+        PRAGMA schema_version changes
+        """
+        if self._is_closed:
+            raise errors.ProgrammingError(CLOSED_DATABASE_MSG)
+        conn = self._conn
+        with self._vars_lock:
+            result = self._catalog
+        if (result is not None
+                and result.schema_version == catalog.get_schema_version(conn)):
+            return result
+        result = catalog.load(conn)
+        # the schema_version of an uncommitted transaction might be reused
+        # by a different schema after a rollback
+        if not conn.in_transaction:
+            with self._vars_lock:
+                self._catalog = result
+        return result
+
+    def metrics(self):
+        """
+        Returns a litedbc.metrics.MetricsSnapshot of the metrics recorded
+        so far, or None if metrics are disabled. It can be passed to
+        the 'export' method of an exporter such as
+        litedbc.metrics.LoggingExporter or litedbc.metrics.PrometheusExporter
+        """
+        if self._metrics is None:
+            return None
+        return self._metrics.snapshot()
+
+    def slow_queries(self, full_scans_only=False):
+        """
+        Returns a tuple of litedbc.slowlog.SlowQuery namedtuples, the slow
+        statements recorded so far from the oldest to the newest, or None
+        if the slow query log is disabled
+
+        [parameters]
+        - full_scans_only: set it to True to only return the statements
+            whose plan contains a full table scan
+        """
+        if self._slow_query_log is None:
+            return None
+        return self._slow_query_log.entries(full_scans_only)
+
+    def lock_report(self, top=10):
+        """
+        Returns a tuple of litedbc.locking.LockSiteStats namedtuples,
+        the 'top' call sites by total hold time of the write lock,
+        or None if lock profiling is disabled
+        """
+        if not self._lock_profiling:
+            return None
+        return self._write_lock.report(top)
+
+    def advise_indexes(self, workload=None, *, what_if=False, top=10):
+        """
+        Propose indexes that would avoid the full table scans and the
+        automatic indexes of the workload. Candidates are single-column,
+        composite (equality columns, then a range or the ORDER BY columns)
+        or partial (for IS NOT NULL predicates) indexes.
+        See litedbc.advisor
+
+        [parameters]
+        - workload: dict {sql: weight}, or iterable of SQL strings or
+            (sql, weight) tuples. Defaults to the statements recorded by
+            the metrics, or else by the slow query log
+        - what_if: set it to True to create each candidate on an in-memory
+            copy of the schema and compare the plans before and after
+        - top: maximum number of candidates returned
+
+        [return]
+        Returns a tuple of litedbc.advisor.IndexCandidate namedtuples:
+            - table, columns, where: definition of the index
+            - kind: "single", "composite" or "partial"
+            - sql: CREATE INDEX statement
+            - score: estimated number of scans avoided, i.e., the total
+                weight of the statements that would use the index
+            - statements: shapes of these statements
+            - plans_before: their plans, as tuples of 'detail' lines
+            - plans_after: their plans with the index (what-if mode only)
+            - scans_removed: weight of the statements whose scan of the table
+                disappears with the index (what-if mode only)
+        Candidates are sorted by scans_removed in what-if mode,
+        otherwise by score
+        """
+        if self._is_closed:
+            raise errors.ProgrammingError(CLOSED_DATABASE_MSG)
+        if workload is None:
+            workload = advisor.get_workload(self)
+        catalog = self.get_catalog()
+        # the write lock is only held while the schema is copied
+        return advisor.advise(self._conn, catalog, workload, what_if=what_if,
+                              top=top, lock=self._write_lock)
+
     def list_tables(self):
         """
         Returns a tuple list of tables names.
         """
-        with self.cursor() as cur:
-            query = ("SELECT name FROM sqlite_master "
-                     "WHERE type='table' AND name NOT LIKE 'sqlite_%'")
-            cur.execute(query)
-            return tuple([item[0] for item in cur.fetch()])
+        return self.get_catalog().list_tables()
 
     def inspect(self, table):
         """
@@ -209,6 +631,11 @@ class LiteDBC:
         A ColumnInfo instance is a namedtuple:
             namedtuple(col_id, name, type, not_null, default, primary_key, foreign_key, index_info)
         """
+        result = self.get_catalog().get_columns(table)
+        if result is not None:
+            return result
+        # temporary tables and tables of attached databases
+        # aren't part of the catalog
         with self.cursor() as cur:
             result = list()
             foreign_keys = self._get_foreign_keys(table)
@@ -225,39 +652,78 @@ class LiteDBC:
                 raise errors.Error("Non-existent table ({})".format(table))
             return tuple(result)
 
-    def dump(self, dst=None):
+    def dump(self, dst=None, *, workers=1, compression=None):
         """
-        Export the database:
+        Export the database. In WAL mode, the dump is read from separate
+        read-only connections, so writers aren't blocked while it is written.
+        In other journal modes, readers would make commits fail with
+        SQLITE_BUSY, so the write lock is held during the dump and the
+        writers of this process wait for it.
+        In-memory databases are dumped from the main connection
 
-        [parameter]
-        - dst_filename: destination filename
+        [parameters]
+        - dst: destination filename or file object
+        - workers: number of threads dumping tables in parallel.
+            All of them read the same snapshot of the database
+            as long as no other process writes to it meanwhile
+        - compression: one of "gzip", "lzma" and "zstd".
+            By default, it is guessed from the extension of the filename
 
         [return]
         it returns a string of sql code if dst isn't set
         """
+        if self._is_closed:
+            raise errors.ProgrammingError(CLOSED_DATABASE_MSG)
+        if self._in_memory:
+            with self._write_lock:
+                return dump.dump((self._conn, ), dst, compression)
+        if self.get_journal_mode() is not JournalMode.WAL:
+            with self._write_lock:
+                return self._dump_snapshots(workers, dst, compression)
+        return self._dump_snapshots(workers, dst, compression)
+
+    def restore(self, src, *, compression=None, bulk_load=True,
+                defer_indexes=True, progress=None,
+                progress_every=None):
+        """
+        Execute a SQL dump (see the 'dump' method), statement by statement.
+        By default, the restore runs with synchronous=OFF, an in-memory
+        journal (unless the database is in WAL mode) and a large page cache,
+        then the original settings are restored
+
+        [parameters]
+        - src: filename or file object
+        - compression: one of "gzip", "lzma" and "zstd".
+            By default, it is guessed from the extension of the filename
+        - bulk_load: boolean, False to keep the current settings
+        - defer_indexes: boolean, True to create indexes once
+            the tables are filled
+        - progress: callback called with the number of executed statements
+            and the number of characters read so far
+        - progress_every: number of statements between two calls of 'progress',
+            defaults to dump.PROGRESS_EVERY
+
+        [return]
+        Returns the number of executed statements
+        """
+        if self._is_closed:
+            raise errors.ProgrammingError(CLOSED_DATABASE_MSG)
         with self._write_lock:
-            if dst is None:
-                return "\n".join(self._conn.iterdump())
-            with open(dst, "w", encoding="utf-8") as file:
-                for line in self._conn.iterdump():
-                    file.write(line + "\n")
+            return dump.restore(self._conn, src, compression,
+                                bulk_load=bulk_load,
+                                defer_indexes=defer_indexes,
+                                progress=progress,
+                                progress_every=progress_every)
 
     def match(self, target_dbc):
         """Match two database via their connectors.
         All tables defined in alpha_dbc should be in beta_dbc that might have additional tables."""
-        for ref_table in self.list_tables():
-            alpha_cols = self.inspect(ref_table)
-            try:
-                beta_cols = target_dbc.inspect(ref_table)
-            except errors.Error as e:
-                return False
-            n = len(alpha_cols)
-            if n != len(beta_cols):
-                return False
-            for i in range(n):
-                if alpha_cols[i] != beta_cols[i]:
-                    return False
-        return True
+        return misc.match(self, target_dbc)
+
+    def schema_fingerprint(self):
+        """Returns the SHA-256 hex digest of the tables and their columns,
+        stable across databases with the same schema"""
+        return self.get_catalog().fingerprint
 
     def backup(self, dst, *, pages=-1,
                progress=None, name="main",
@@ -283,6 +749,59 @@ class LiteDBC:
             if closable_conn:
                 dst_conn.close()
 
+    def backup_manager(self, directory, **kwargs):
+        """
+        Start a BackupManager that backs up the database every 'interval'
+        seconds into 'directory', without long pauses for writers.
+        The manager is closed along with this connector
+
+        [parameters]
+        - directory: directory where the copies are stored
+        - **kwargs: keyword arguments of BackupManager
+            (interval, pages, pause, generations, check, ...)
+
+        [return]
+        Returns the started BackupManager
+        """
+        manager = BackupManager(self, directory, **kwargs)
+        with self._vars_lock:
+            if self._is_closed:
+                raise errors.ProgrammingError(CLOSED_DATABASE_MSG)
+            self._backup_managers.append(manager)
+        manager.start()
+        return manager
+
+    def checkpoint_manager(self, **kwargs):
+        """
+        Start a CheckpointManager that checkpoints the WAL in a background
+        thread, on a schedule or when the WAL reaches a size threshold.
+        The automatic checkpoints of the connections are disabled meanwhile.
+        There is a single manager per dbc, closed along with it
+
+        [parameters]
+        - **kwargs: keyword arguments of CheckpointManager
+            (interval, wal_size, escalate, escalate_size, ...)
+
+        [return]
+        Returns the started CheckpointManager
+        """
+        manager = CheckpointManager(self, **kwargs)
+        with self._vars_lock:
+            if self._is_closed:
+                raise errors.ProgrammingError(CLOSED_DATABASE_MSG)
+            current = self._checkpoint_manager
+            if current is not None and not current.is_closed:
+                msg = "A checkpoint manager is already running."
+                raise errors.ProgrammingError(msg)
+            self._checkpoint_manager = manager
+        try:
+            manager.start()
+        except BaseException:
+            with self._vars_lock:
+                self._checkpoint_manager = None
+            raise
+        return manager
+
     def vacuum(self):
         with self.cursor() as cur:
             cur.execute("VACUUM")
@@ -305,6 +824,30 @@ class LiteDBC:
         with self.exclusive_transaction():
             pass
 
+    @contextlib.contextmanager
+    def profile(self, profile):
+        """
+        Context manager that applies a profile to the main connection
+        and restores the previous values of its pragmas on exit.
+        The journal mode of a database in WAL mode isn't changed,
+        a database that enters the WAL mode leaves it on exit
+
+        with dbc.profile(Profile.BULK_LOAD):
+            dbc.executemany(...)
+
+        [parameters]
+        - profile: litedbc.const.Profile, its name, or a dict {pragma: value}
+        """
+        pragmas = misc.get_profile_pragmas(profile)
+        with self._write_lock:
+            previous = misc.apply_pragmas(self._conn, pragmas,
+                                          persistent=not self._is_readonly)
+        try:
+            yield
+        finally:
+            with self._write_lock:
+                misc.restore_pragmas(self._conn, previous)
+
     def get_locking_mode(self):
         with self.cursor() as cur:
             cur.execute("PRAGMA locking_mode")
@@ -343,36 +886,78 @@ class LiteDBC:
                   name ="main"):
         """From Python 3.11"""
         if readonly:
-           return self._conn.blob_open(table, column, row,
-                                       readonly=readonly, name=name)
+           return self._conn.blobopen(table, column, row,
+                                      readonly=readonly, name=name)
         else:
            with self._write_lock:
                return self._conn.blobopen(table, column, row,
                                            readonly=readonly, name=name)
 
+    def blob_reader(self, table, column, rowid, /, *, name="main"):
+        """
+        Open a BLOB for streaming reads (from Python 3.11)
+
+        [parameters]
+        - table, column, rowid: location of the BLOB
+        - name: name of the database (main, temp or an attached database)
+
+        [return]
+        Returns a BlobReader, a binary file object with a 'readinto' method
+        and chunked iteration
+        """
+        return blob.open_reader(self._conn, table, column, rowid, name)
+
+    def blob_writer(self, table, column, rowid, /, *, size=None,
+                    name="main"):
+        """
+        Open a BLOB for streaming writes (from Python 3.11).
+        The writes are committed in a single transaction when the BlobWriter
+        is closed. The write lock is held until then
+
+        [parameters]
+        - table, column, rowid: location of the BLOB
+        - size: if set, the value is first replaced with a zeroblob
+            of 'size' bytes, since a BLOB can't grow once opened
+        - name: name of the database (main, temp or an attached database)
+
+        [return]
+        Returns a BlobWriter, a binary file object
+        """
+        transaction = self.immediate_transaction()
+        return blob.open_writer(self._conn, transaction, table, column,
+                                rowid, size, name)
+
     def create_function(self, name, n_args, func, /, *, deterministic=False):
-        return self._conn.create_function(name, n_args, func, deterministic=deterministic)
+        hook = lambda conn: conn.create_function(name, n_args, func,
+                                                 deterministic=deterministic)
+        return self._register_conn_hook(("function", name, n_args), hook)
 
     def create_aggregate(self, name, n_args, aggregate_cls, /):
-        return self._conn.create_aggregate(name, n_args, aggregate_cls)
+        hook = lambda conn: conn.create_aggregate(name, n_args, aggregate_cls)
+        return self._register_conn_hook(("aggregate", name, n_args), hook)
 
     def create_window_function(self, name, n_args, aggregate_cls, /):
-        return self._conn.create_window_function(name, n_args, aggregate_cls)
+        hook = lambda conn: conn.create_window_function(name, n_args, aggregate_cls)
+        return self._register_conn_hook(("window_function", name, n_args), hook)
 
     def create_collation(self, name, func, /):
-        return self._conn.create_collation(name, func)
+        hook = lambda conn: conn.create_collation(name, func)
+        return self._register_conn_hook(("collation", name), hook)
 
     def interrupt(self):
         return self._conn.interrupt()
 
     def set_authorizer(self, callback):
-        return self._conn.set_authorizer(callback)
+        hook = lambda conn: conn.set_authorizer(callback)
+        return self._register_conn_hook(("authorizer", ), hook)
 
     def set_progress_handler(self, callback, n):
-        return self._conn.set_progress_handler(callback, n)
+        hook = lambda conn: conn.set_progress_handler(callback, n)
+        return self._register_conn_hook(("progress_handler", ), hook)
 
     def set_trace_callback(self, callback):
-        return self._conn.set_trace_callback(callback)
+        hook = lambda conn: conn.set_trace_callback(callback)
+        return self._register_conn_hook(("trace_callback", ), hook)
 
     def enable_load_extension(self, enabled, /):
         return self._conn.enable_load_extension(enabled)
@@ -412,12 +997,38 @@ class LiteDBC:
         [return]
         Returns a boolean
         """
+        # the write queue is closed first since its thread
+        # needs the write lock to commit pending statements.
+        # Backup and checkpoint managers complete their work in progress.
+        # The lock watchdog, if any, is stopped
+        with self._vars_lock:
+            write_queue = self._write_queue
+            backup_managers = tuple(self._backup_managers)
+            checkpoint_manager = self._checkpoint_manager
+        if write_queue is not None:
+            write_queue.close()
+        for manager in backup_managers:
+            manager.close()
+        if checkpoint_manager is not None:
+            checkpoint_manager.close()
+        if self._lock_profiling:
+            self._write_lock.stop_watchdog()
         with self._write_lock:
             with self._vars_lock:
                 is_destroyed, is_closed = self._is_destroyed, self._is_closed
             if is_closed or is_destroyed:
                 return False
             try:
+                with self._vars_lock:
+                    sessions = tuple(self._sessions)
+                for session in sessions:
+                    session.close()
+                if self._read_pool is not None:
+                    self._read_pool.close()
+                with self._explain_lock:
+                    if self._explain_conn is not None:
+                        self._explain_conn.close()
+                        self._explain_conn = None
                 if self._conn is not None:
                     self._conn.close()
             except Exception as e:
@@ -467,6 +1078,9 @@ class LiteDBC:
         if self._is_readonly:
             with self.cursor() as cur:
                 cur.execute("PRAGMA query_only=1")
+        if self._read_pool_size and not self._in_memory:
+            factory = lambda: self._create_secondary_connection(query_only=True)
+            self._read_pool = ConnectionPool(factory, self._read_pool_size)
 
     def _connect(self):
         self._conn = self._create_connection()
@@ -488,8 +1102,73 @@ class LiteDBC:
         atexit.register(self.close)
         conn.row_factory = self._row_factory
         conn.text_factory = self._text_factory
+        if self._profile_pragmas:
+            misc.apply_pragmas(conn, self._profile_pragmas,
+                               persistent=not self._is_readonly)
         return conn
 
+    def _create_secondary_connection(self, query_only=False):
+        # connection for the read pool or a session, not registered
+        # with 'atexit' since it is closed along with the main connection
+        conn = sqlite.connect(**self._create_conn_config())
+        conn.row_factory = self._row_factory
+        conn.text_factory = self._text_factory
+        if self._profile_pragmas:
+            misc.apply_pragmas(conn, self._profile_pragmas, persistent=False)
+        if query_only:
+            conn.execute("PRAGMA query_only=1")
+        for hook in tuple(self._conn_hooks.values()):
+            hook(conn)
+        return conn
+
+    def _explain(self, sql, params):
+        # EXPLAIN QUERY PLAN for the slow query log, run on a side read
+        # connection. The waits are bounded so that a slow statement
+        # never blocks on the lock held by a transaction
+        sql = "EXPLAIN QUERY PLAN " + sql
+        if self._in_memory:
+            # a side connection would open another database
+            if not self._write_lock.acquire(timeout=EXPLAIN_TIMEOUT):
+                return None
+            try:
+                return self._conn.execute(sql, params).fetchall()
+            finally:
+                self._write_lock.release()
+        if not self._explain_lock.acquire(timeout=EXPLAIN_TIMEOUT):
+            return None
+        try:
+            if self.is_closed:
+                return None
+            if self._explain_conn is None:
+                conn = self._create_secondary_connection(query_only=True)
+                conn.execute("PRAGMA busy_timeout={}".format(
+                    int(EXPLAIN_TIMEOUT * 1000)))
+                self._explain_conn = conn
+            return self._explain_conn.execute(sql, params).fetchall()
+        finally:
+            self._explain_lock.release()
+
+    def _is_write_site(self, site):
+        with self._vars_lock:
+            return site in self._write_sites
+
+    def _add_write_site(self, site):
+        with self._vars_lock:
+            self._write_sites.add(site)
+
+    def _register_conn_hook(self, key, hook):
+        # the hook is applied to the main connection and replayed
+        # on every secondary connection, present and future
+        with self._vars_lock:
+            self._conn_hooks[key] = hook
+            sessions = tuple(self._sessions)
+        result = hook(self._conn)
+        if self._read_pool is not None:
+            self._read_pool.apply(hook)
+        for session in sessions:
+            session.apply(hook)
+        return result
+
     def _create_conn_config(self):
         # isolation_level is set to None and autocommit is set to True
         # therefore, no transactions are implicitly opened at all.
@@ -509,6 +1188,41 @@ class LiteDBC:
             conn_config["autocommit"] = True
         return conn_config
 
+    def _dump_snapshots(self, workers, dst, compression):
+        conns = self._open_snapshots(max(1, workers))
+        try:
+            return dump.dump(conns, dst, compression)
+        finally:
+            for conn in conns:
+                conn.close()
+
+    def _open_snapshots(self, n):
+        # open n read-only connections, each in a read transaction
+        # started while no thread of this process can commit,
+        # so that they all see the same snapshot of the database
+        conns = list()
+        try:
+            with self._write_lock:
+                for _ in range(n):
+                    conn = self._create_secondary_connection(query_only=True)
+                    conns.append(conn)
+                    conn.execute("BEGIN")
+                    conn.execute("SELECT count(*) FROM sqlite_master").fetchall()
+        except BaseException:
+            for conn in conns:
+                conn.close()
+            raise
+        return conns
+
+    def _get_state_token(self):
+        # changes made by this connection are tracked by 'total_changes',
+        # commits from other connections by 'data_version'
+        with self._write_lock:
+            cur = self._conn.execute("SELECT * FROM pragma_data_version, "
+                                     "pragma_schema_version")
+            data_version, schema_version = cur.fetchone()
+            return self._conn.total_changes, data_version, schema_version
+
     def _get_foreign_keys(self, table):
         # this function assumes that 'table' really exists !
         result = dict()
@@ -523,14 +1237,13 @@ class LiteDBC:
         # this function assumes that 'table' really exists !
         result = dict()
         with self.cursor() as cur:
-            cur.execute('PRAGMA index_list("{}")'.format(table))
-            for row_a in cur.fetch():
-                rank1, name, unique, spec, _ = row_a
-                cur.execute('PRAGMA index_info("{}")'.format(name))
-                for row_b in cur.fetch():
-                    rank2, rank3, colname = row_b
-                    if colname:
-                        result[colname] = (rank1, rank2, rank3, bool(unique), spec)
+            cur.execute("SELECT il.seq, il.\"unique\", il.origin, "
+                        "ii.seqno, ii.cid, ii.name FROM pragma_index_list(?) AS il "
+                        "JOIN pragma_index_info(il.name) AS ii", (table, ))
+            for row in cur.fetch():
+                rank1, unique, spec, rank2, rank3, colname = row
+                if colname:
+                    result[colname] = (rank1, rank2, rank3, bool(unique), spec)
         return result
 
     def __enter__(self):
@@ -540,6 +1253,7 @@ class LiteDBC:
         self.close()
 
     def __copy__(self):
+        log = self._slow_query_log
         return LiteDBC(self._filename,
                        init_script=self._init_script,
                        is_readonly=self._is_readonly,
@@ -549,7 +1263,19 @@ class LiteDBC:
                        on_create_db=self._on_create_db,
                        on_create_conn=self._on_create_conn,
                        row_factory=self._row_factory,
-                       text_factory=self._text_factory)
+                       text_factory=self._text_factory,
+                       read_pool_size=self._read_pool_size,
+                       write_batch_size=self._write_batch_size,
+                       write_batch_delay=self._write_batch_delay,
+                       query_cache_size=self._query_cache.max_entries,
+                       query_cache_bytes=self._query_cache.max_bytes,
+                       metrics=self._metrics is not None,
+                       lock_profiling=self._lock_profiling,
+                       slow_query_ms=None if log is None else log.threshold_ms,
+                       slow_query_file=None if log is None else log.filename,
+                       slow_query_redact=False if log is None else log.redact,
+                       profile=self._profile,
+                       retry_policy=self._retry_policy)
 
     def __del__(self):
         self.close()
@@ -0,0 +1,374 @@
+"""Index advisor driven by the observed workload"""
+import contextlib
+import sqlite3 as sqlite
+from collections import namedtuple
+from litedbc import bulk, errors, statement, slowlog
+
+
+IndexCandidate = namedtuple("IndexCandidate", ["table", "columns", "where",
+                                               "kind", "sql", "score",
+                                               "statements", "plans_before",
+                                               "plans_after", "scans_removed"])
+
+# statements whose plan is examined
+KEYWORDS = frozenset(("SELECT", "UPDATE", "DELETE"))
+# words that end the FROM clause or can't be an alias
+STOP_WORDS = frozenset(("WHERE", "GROUP", "ORDER", "LIMIT", "HAVING", "WINDOW",
+                        "UNION", "EXCEPT", "INTERSECT", "ON", "USING", "SET",
+                        "RETURNING", "JOIN", "LEFT", "RIGHT", "FULL", "INNER",
+                        "OUTER", "CROSS", "NATURAL", "INDEXED", "NOT", "AS"))
+# words that start a clause
+CLAUSE_WORDS = frozenset(("WHERE", "ON", "ORDER", "GROUP", "HAVING", "LIMIT",
+                          "SELECT", "SET", "FROM"))
+RANGE_WORDS = frozenset(("BETWEEN", "LIKE", "GLOB"))
+
+
+def get_workload(dbc):
+    """Returns a dict {shape: weight} built from the metrics and the slow
+    query log of the dbc. The weight of a shape is its number of executions"""
+    workload = dict()
+    snapshot = dbc.metrics()
+    if snapshot is not None:
+        for item in snapshot.statements:
+            workload[item.shape] = workload.get(item.shape, 0) + item.count
+    entries = dbc.slow_queries()
+    # slow statements are already counted by the metrics
+    if entries is not None and snapshot is None:
+        for entry in entries:
+            shape = statement.get_shape(entry.sql)
+            workload[shape] = workload.get(shape, 0) + 1
+    if snapshot is None and entries is None:
+        msg = ("No workload to sample. Enable the metrics or the slow "
+               "query log, or pass the workload explicitly.")
+        raise errors.ProgrammingError(msg)
+    return workload
+
+
+def advise(conn, catalog, workload, what_if=False, top=10, lock=None):
+    """
+    Propose indexes for the statements of a workload
+
+    [parameters]
+    - conn: connection to the database
+    - catalog: litedbc.catalog.Catalog of the database
+    - workload: dict {sql: weight}, or iterable of SQL strings
+        or (sql, weight) tuples
+    - what_if: set it to True to create each candidate on an in-memory
+        copy of the schema and compare the plans before and after
+    - top: maximum number of candidates returned
+    - lock: lock held while the schema is copied from 'conn'.
+        The plans are computed on the copy, without the lock
+
+    [return]
+    Returns a tuple of IndexCandidate namedtuples
+    """
+    workload = _get_shapes(workload)
+    with contextlib.nullcontext() if lock is None else lock:
+        conn = copy_schema(conn)
+    try:
+        candidates = dict()
+        for shape, weight in workload.items():
+            for key in _get_candidate_keys(conn, catalog, shape):
+                item = candidates.get(key)
+                if item is None:
+                    item = candidates[key] = [0, list()]
+                item[0] += weight
+                item[1].append((shape, weight))
+        indexes = _get_existing_indexes(conn)
+        result = list()
+        for (table, columns, where), (score, shapes) in candidates.items():
+            if where is None and _is_covered(columns,
+                                             indexes.get(table.lower(), ())):
+                continue
+            result.append(_make_candidate(conn, table, columns, where,
+                                          score, shapes, what_if))
+    finally:
+        conn.close()
+    if what_if:
+        result.sort(key=lambda item: (item.scans_removed, item.score),
+                    reverse=True)
+    else:
+        result.sort(key=lambda item: item.score, reverse=True)
+    return tuple(result[:top])
+
+
+def copy_schema(src):
+    """Returns an in-memory connection holding a copy of the schema of the
+    main database of the 'src' connection and its statistics (sqlite_stat1
+    and sqlite_stat4). Since the planner only relies on them, plans
+    of the copy match the plans of the database, without copying the data"""
+    cur = src.execute("SELECT name, sql FROM sqlite_master "
+                      "WHERE sql IS NOT NULL ORDER BY rowid")
+    rows = cur.fetchall()
+    stats = dict()
+    for table, sql in rows:
+        if table in ("sqlite_stat1", "sqlite_stat4"):
+            stats[table] = src.execute("SELECT * FROM {}".format(table)).fetchall()
+    conn = sqlite.connect(":memory:", isolation_level=None)
+    try:
+        for table, sql in rows:
+            if table.startswith("sqlite_"):
+                continue
+            try:
+                conn.execute(sql)
+            except sqlite.Error:
+                pass  # e.g. virtual table whose module is missing
+        if stats:
+            conn.execute("ANALYZE sqlite_master")
+            for table, stat_rows in stats.items():
+                if not stat_rows:
+                    continue
+                sql = "INSERT INTO {} VALUES ({})".format(
+                    table, ", ".join(["?"] * len(stat_rows[0])))
+                try:
+                    conn.execute("DELETE FROM {}".format(table))
+                    conn.executemany(sql, stat_rows)
+                except sqlite.Error:
+                    pass  # sqlite_stat4 requires SQLITE_ENABLE_STAT4
+            conn.execute("ANALYZE sqlite_master")  # reload the statistics
+    except BaseException:
+        conn.close()
+        raise
+    return conn
+
+
+def explain(conn, sql):
+    """Returns the 'detail' lines of EXPLAIN QUERY PLAN, with NULL bound
+    to the parameters of the SQL statement"""
+    n = len([kind for kind, text in statement.tokenize(sql)
+             if kind == "parameter"])
+    cur = conn.execute("EXPLAIN QUERY PLAN " + sql, (None, ) * n)
+    return tuple([row[-1] for row in cur.fetchall()])
+
+
+def _get_shapes(workload):
+    if isinstance(workload, dict):
+        items = workload.items()
+    else:
+        items = [(item, 1) if isinstance(item, str) else item
+                 for item in workload]
+    shapes = dict()
+    for sql, weight in items:
+        shape = statement.get_shape(sql)
+        if statement.get_stmt_info(shape).keyword in KEYWORDS:
+            shapes[shape] = shapes.get(shape, 0) + weight
+    return shapes
+
+
+def _get_candidate_keys(conn, catalog, shape):
+    # yields (table, columns, where) for each scan the statement could avoid
+    try:
+        plan = explain(conn, shape)
+    except sqlite.Error:
+        return
+    tokens = list(statement.tokenize(shape))
+    aliases = _get_aliases(tokens)
+    tables = {name.lower(): name for name in catalog.tables}
+    for name in slowlog.get_full_scans(plan):
+        table = tables.get(aliases.get(name.lower(), name.lower()))
+        if table is None:
+            continue
+        key = _get_key(tokens, table, catalog.get_columns(table), aliases)
+        if key is not None:
+            yield key
+    # automatic indexes are built anew by each execution of the statement
+    for detail in plan:
+        words = detail.split()
+        if (len(words) < 3 or words[0] != "SEARCH"
+                or "AUTOMATIC" not in words or "(" not in detail):
+            continue
+        table = tables.get(aliases.get(words[1].lower(), words[1].lower()))
+        if table is None:
+            continue
+        names = {info.name.lower(): info.name
+                 for info in catalog.get_columns(table)}
+        terms = detail[detail.index("(") + 1:detail.rindex(")")]
+        selected = list()
+        for term in terms.split(" AND "):
+            column = term.split("=")[0].split(">")[0].split("<")[0].strip()
+            if column.lower() in names:
+                selected.append(names[column.lower()])
+        if selected:
+            yield table, tuple(selected), None
+
+
+def _get_aliases(tokens):
+    # returns a dict {alias or table name: table name}, in lowercase
+    aliases = dict()
+    in_from = expect_table = False
+    i, n = 0, len(tokens)
+    while i < n:
+        kind, text = tokens[i]
+        upper = text.upper() if kind == "word" else text
+        if kind == "word" and upper in ("FROM", "JOIN", "UPDATE"):
+            in_from = expect_table = True
+        elif kind == "word" and upper in STOP_WORDS and upper != "AS":
+            in_from = upper in ("JOIN", "LEFT", "RIGHT", "FULL", "INNER",
+                                "OUTER", "CROSS", "NATURAL")
+        elif upper == "," and in_from:
+            expect_table = True
+        elif expect_table and kind in ("word", "identifier"):
+            expect_table = False
+            if i + 2 < n and tokens[i + 1][1] == ".":
+                i += 2  # schema name
+            table = _unquote(tokens[i][1])
+            aliases[table] = table
+            j = i + 1
+            if j < n and tokens[j][0] == "word" and tokens[j][1].upper() == "AS":
+                j += 1
+            if (j < n and tokens[j][0] in ("word", "identifier")
+                    and tokens[j][1].upper() not in STOP_WORDS):
+                aliases[_unquote(tokens[j][1])] = table
+                i = j
+        elif expect_table:
+            expect_table = False  # subquery
+        i += 1
+    return aliases
+
+
+def _get_key(tokens, table, columns, aliases):
+    # columns of the predicates on 'table': equality columns first,
+    # then the first range column or else the ORDER BY columns
+    names = {info.name.lower(): info.name for info in columns}
+    equal, ranges, order, not_null = list(), list(), list(), list()
+    clause = None
+    n = len(tokens)
+    for i, (kind, text) in enumerate(tokens):
+        if kind == "word" and text.upper() in CLAUSE_WORDS:
+            clause = text.upper()
+            continue
+        if kind not in ("word", "identifier"):
+            continue
+        name = _unquote(text)
+        if name not in names or clause not in ("WHERE", "ON", "ORDER"):
+            continue
+        if i + 1 < n and tokens[i + 1][1] == ".":
+            continue  # qualifier
+        if i >= 2 and tokens[i - 1][1] == ".":
+            qualifier = _unquote(tokens[i - 2][1])
+            if aliases.get(qualifier) != table.lower():
+                continue
+        column = names[name]
+        if clause == "ORDER":
+            order.append(column)
+            continue
+        op = _get_operator(tokens, i)
+        if op == "equal":
+            equal.append(column)
+        elif op == "range":
+            ranges.append(column)
+        elif op == "not_null":
+            not_null.append(column)
+    selected = list()
+    for column in equal:
+        if column not in selected:
+            selected.append(column)
+    if ranges and ranges[0] not in selected:
+        selected.append(ranges[0])
+    elif not ranges:
+        selected.extend([column for column in order if column not in selected])
+    where = None
+    if not_null:
+        if not selected:
+            selected.append(not_null[0])
+        where = "{} IS NOT NULL".format(bulk.quote_identifier(not_null[0]))
+    if not selected:
+        return None
+    return table, tuple(selected), where
+
+
+def _get_operator(tokens, i):
+    # classify the comparison that follows the column at index i
+    following = [text.upper() for kind, text in tokens[i + 1:i + 4]]
+    following += [""] * (3 - len(following))
+    first, second, third = following
+    if first == "=":
+        return "equal"
+    if first in ("<", ">"):
+        return None if second == ">" else "range"
+    if first == "IN":
+        return "equal"
+    if first in RANGE_WORDS:
+        return "range"
+    if first == "IS":
+        if second == "NOT":
+            return "not_null" if third == "NULL" else None
+        return "equal"
+    if i >= 1 and tokens[i - 1][1] == "=":
+        return "equal"
+    return None
+
+
+def _get_existing_indexes(conn):
+    # returns {table (lowercase): [columns (lowercase tuple), ...]}
+    # of the indexes that aren't partial
+    indexes = dict()
+    cur = conn.execute("SELECT m.name, il.name, ii.name "
+                       "FROM sqlite_master AS m "
+                       "JOIN pragma_index_list(m.name) AS il "
+                       "JOIN pragma_index_info(il.name) AS ii "
+                       "WHERE m.type = 'table' AND il.partial = 0 "
+                       "ORDER BY m.name, il.name, ii.seqno")
+    columns = dict()
+    for table, index, column in cur.fetchall():
+        columns.setdefault((table.lower(), index), list()).append(
+            (column or "").lower())
+    for (table, index), names in columns.items():
+        indexes.setdefault(table, list()).append(tuple(names))
+    return indexes
+
+
+def _is_covered(columns, indexes):
+    columns = tuple([column.lower() for column in columns])
+    for names in indexes:
+        if names[:len(columns)] == columns:
+            return True
+    return False
+
+
+def _make_candidate(conn, table, columns, where, score, shapes, what_if):
+    name = "idx_{}_{}".format(table, "_".join(columns))
+    name += "_partial" if where else ""
+    sql = "CREATE INDEX {} ON {} ({})".format(
+        bulk.quote_identifier(name), bulk.quote_identifier(table),
+        ", ".join([bulk.quote_identifier(column) for column in columns]))
+    sql += " WHERE {}".format(where) if where else ""
+    if where:
+        kind = "partial"
+    else:
+        kind = "single" if len(columns) == 1 else "composite"
+    statements = tuple([shape for shape, weight in shapes])
+    plans_before = tuple([explain(conn, shape) for shape in statements])
+    plans_after = scans_removed = None
+    if what_if:
+        conn.execute(sql)
+        try:
+            plans_after = tuple([explain(conn, shape) for shape in statements])
+        finally:
+            conn.execute("DROP INDEX {}".format(bulk.quote_identifier(name)))
+        scans_removed = 0
+        for (shape, weight), before, after in zip(shapes, plans_before,
+                                                  plans_after):
+            if before != after and not _scans(shape, after, table):
+                scans_removed += weight
+    return IndexCandidate(table, columns, where, kind, sql, score, statements,
+                          plans_before, plans_after, scans_removed)
+
+
+def _scans(shape, plan, table):
+    aliases = _get_aliases(list(statement.tokenize(shape)))
+    for name in slowlog.get_full_scans(plan):
+        if aliases.get(name.lower(), name.lower()) == table.lower():
+            return True
+    for detail in plan:
+        if "AUTOMATIC" in detail and detail.split()[0] == "SEARCH":
+            name = detail.split()[1].lower()
+            if aliases.get(name, name) == table.lower():
+                return True
+    return False
+
+
+def _unquote(text):
+    if text[:1] in ("\"", "`", "[") and len(text) > 1:
+        text = text[1:-1]
+    return text.lower()
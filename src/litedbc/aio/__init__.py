@@ -0,0 +1,438 @@
+"""Asyncio front-end for LiteDBC"""
+import asyncio
+import itertools
+import functools
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+from litedbc import LiteDBC, statement
+from litedbc.const import TransactionMode
+
+
+__all__ = ["AsyncLiteDBC", "AsyncCursor", "AsyncTransaction", "connect"]
+
+
+# default number of rows fetched per round trip by AsyncCursor.fetch
+BUFFER_SIZE = 256
+
+
+async def connect(filename=None, **kwargs):
+    """Create an AsyncLiteDBC without blocking the event loop.
+    Accepts the same arguments as AsyncLiteDBC"""
+    loop = asyncio.get_running_loop()
+    func = functools.partial(AsyncLiteDBC, filename, **kwargs)
+    return await loop.run_in_executor(None, func)
+
+
+class AsyncLiteDBC:
+    """
+    Asyncio database connector.
+
+    Every SQLite call runs on a dedicated writer thread that owns the
+    connection of the underlying LiteDBC. When 'readers' is set, SELECT
+    statements executed outside of a transaction run on reader threads,
+    each one with its own session (see LiteDBC.session). A reader cursor
+    stays on the thread that created it, the one that owns its session.
+    Operations on the writer thread are serialized with an asyncio lock,
+    that is held for the whole duration of a transaction. Within a
+    transaction, the task that owns it doesn't wait for the lock:
+    its statements and nested transactions join the transaction
+    """
+    def __init__(self, filename=None, *, readers=0, **kwargs):
+        """
+        Init
+
+        [parameters]
+        - filename: path to SQLite file, either string or a pathlib.Path instance.
+            Leave this parameter to None if you want to create an in-memory database
+        - readers: number of reader threads. Ignored for in-memory databases
+        - **kwargs: keywords-arguments to pass to LiteDBC
+
+        Note that the database is opened synchronously,
+        use the 'connect' coroutine to avoid blocking the event loop
+        """
+        self._writer = ThreadPoolExecutor(max_workers=1,
+                                          thread_name_prefix="litedbc-writer")
+        try:
+            self._dbc = self._writer.submit(LiteDBC, filename, **kwargs).result()
+        except BaseException:
+            self._writer.shutdown(wait=False)
+            raise
+        self._readers = 0 if self._dbc.in_memory else readers
+        # one single-thread executor per reader thread,
+        # assigned in turn to the reader cursors
+        self._reader_executors = tuple([
+            ThreadPoolExecutor(max_workers=1,
+                               thread_name_prefix="litedbc-reader-{}".format(i))
+            for i in range(self._readers)])
+        self._next_reader = itertools.count()
+        self._lock = None
+        self._owner = None  # task of the pending transaction
+
+    @property
+    def dbc(self):
+        """The underlying LiteDBC instance"""
+        return self._dbc
+
+    @property
+    def readers(self):
+        return self._readers
+
+    @property
+    def filename(self):
+        return self._dbc.filename
+
+    @property
+    def in_memory(self):
+        return self._dbc.in_memory
+
+    @property
+    def in_transaction(self):
+        return self._dbc.in_transaction
+
+    @property
+    def is_closed(self):
+        return self._dbc.is_closed
+
+    @property
+    def lock(self):
+        """asyncio lock that serializes operations on the writer thread"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    def transaction(self, transaction_mode=TransactionMode.DEFERRED):
+        """Returns an asynchronous context manager"""
+        return AsyncTransaction(self, mode=transaction_mode)
+
+    def deferred_transaction(self):
+        """Returns an asynchronous context manager"""
+        return AsyncTransaction(self, mode=TransactionMode.DEFERRED)
+
+    def immediate_transaction(self):
+        """Returns an asynchronous context manager"""
+        return AsyncTransaction(self, mode=TransactionMode.IMMEDIATE)
+
+    def exclusive_transaction(self):
+        """Returns an asynchronous context manager"""
+        return AsyncTransaction(self, mode=TransactionMode.EXCLUSIVE)
+
+    def write_transaction(self):
+        """Returns an asynchronous context manager for a transaction
+        that is known to write (IMMEDIATE mode)"""
+        return AsyncTransaction(self, mode=TransactionMode.IMMEDIATE)
+
+    def cursor(self):
+        """Returns an asynchronous context manager"""
+        return AsyncCursor(self)
+
+    async def execute(self, sql, params=None, /):
+        cur = AsyncCursor(self)
+        return await cur.execute(sql, params)
+
+    async def executemany(self, sql, params=None, /):
+        cur = AsyncCursor(self)
+        return await cur.executemany(sql, params)
+
+    async def executescript(self, sql_script, /,
+                            transaction_mode=TransactionMode.DEFERRED):
+        cur = AsyncCursor(self)
+        return await cur.executescript(sql_script,
+                                       transaction_mode=transaction_mode)
+
+    async def run(self, func, /, *args, **kwargs):
+        """Run func(dbc, *args, **kwargs) on the writer thread,
+        where dbc is the underlying LiteDBC instance"""
+        async with self._writer_lock():
+            return await self._run_writer(func, self._dbc, *args, **kwargs)
+
+    async def list_tables(self):
+        return await self.run(LiteDBC.list_tables)
+
+    async def inspect(self, table):
+        return await self.run(LiteDBC.inspect, table)
+
+    async def dump(self, dst=None):
+        return await self.run(LiteDBC.dump, dst)
+
+    async def backup(self, dst, **kwargs):
+        return await self.run(LiteDBC.backup, dst, **kwargs)
+
+    async def vacuum(self):
+        return await self.run(LiteDBC.vacuum)
+
+    async def close(self):
+        """
+        Closes the connection then stops the threads
+
+        [return]
+        Returns a boolean
+        """
+        try:
+            return await self.run(LiteDBC.close)
+        finally:
+            self._writer.shutdown(wait=False)
+            for executor in self._reader_executors:
+                executor.shutdown(wait=False)
+
+    def _is_owner(self):
+        # True if the current task runs the pending transaction
+        return (self._owner is not None
+                and self._owner is asyncio.current_task())
+
+    @contextlib.asynccontextmanager
+    async def _writer_lock(self):
+        if self._is_owner():
+            yield  # the transaction already holds the lock
+            return
+        async with self.lock:
+            yield
+
+    async def _run_writer(self, func, /, *args, **kwargs):
+        return await self._run_in(self._writer, func, *args, **kwargs)
+
+    def _get_reader_executor(self):
+        i = next(self._next_reader) % self._readers
+        return self._reader_executors[i]
+
+    async def _run_in(self, executor, func, /, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        func = functools.partial(func, *args, **kwargs)
+        return await loop.run_in_executor(executor, func)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+
+class AsyncCursor:
+    """Asynchronous counterpart of Cursor. The underlying cursor is
+    created on the thread that runs the statement"""
+    def __init__(self, adbc, cursor=None):
+        self._adbc = adbc
+        self._cursor = cursor
+        # a cursor provided by a transaction runs on the writer thread,
+        # under the lock already held by the transaction
+        self._in_transaction = cursor is not None
+        self._on_reader = False
+        self._reader_executor = None  # executor of the reader thread
+        self._arraysize = 1 if cursor is None else cursor.arraysize
+
+    @property
+    def adbc(self):
+        return self._adbc
+
+    @property
+    def arraysize(self):
+        return self._arraysize
+
+    @arraysize.setter
+    def arraysize(self, val):
+        self._arraysize = val
+        if self._cursor is not None:
+            self._cursor.arraysize = val
+
+    @property
+    def description(self):
+        return None if self._cursor is None else self._cursor.description
+
+    @property
+    def lastrowid(self):
+        return None if self._cursor is None else self._cursor.lastrowid
+
+    @property
+    def rowcount(self):
+        return -1 if self._cursor is None else self._cursor.rowcount
+
+    def get_columns(self):
+        return tuple() if self._cursor is None else self._cursor.get_columns()
+
+    async def execute(self, sql, params=None, /):
+        # the task of a transaction reads its own uncommitted changes
+        on_reader = (self._adbc.readers and not self._in_transaction
+                     and not self._adbc._is_owner()
+                     and statement.is_query(sql))
+        if on_reader:
+            await self._close_cursor()
+            self._on_reader = True
+            self._reader_executor = self._adbc._get_reader_executor()
+            self._cursor = await self._run_on(True, self._new_reader_cursor)
+        else:
+            await self._ensure_writer_cursor()
+        await self._run(self._cursor.execute, sql, params)
+        return self
+
+    async def executemany(self, sql, params=None, /):
+        await self._ensure_writer_cursor()
+        await self._run(self._cursor.executemany, sql, params)
+        return self
+
+    async def executescript(self, sql_script, /,
+                            transaction_mode=TransactionMode.DEFERRED):
+        await self._ensure_writer_cursor()
+        await self._run(self._cursor.executescript, sql_script,
+                        transaction_mode=transaction_mode)
+        return self
+
+    async def fetch(self, limit=None, buffer_size=None):
+        """Asynchronous generator that yields the rows.
+        Rows are fetched from the database thread in batches of 'buffer_size'"""
+        if self._cursor is None:
+            return
+        limit = -1 if limit is None else limit
+        buffer_size = BUFFER_SIZE if buffer_size is None else buffer_size
+        i = 0
+        while True:
+            rows = await self._run(self._cursor.fetchmany, buffer_size)
+            if not rows:
+                return
+            for r in rows:
+                if limit == i:
+                    return
+                yield r
+                i += 1
+
+    async def fetchone(self):
+        if self._cursor is None:
+            return None
+        return await self._run(self._cursor.fetchone)
+
+    async def fetchmany(self, size=None):
+        if self._cursor is None:
+            return list()
+        size = self._arraysize if size is None else size
+        return await self._run(self._cursor.fetchmany, size)
+
+    async def fetchall(self):
+        if self._cursor is None:
+            return list()
+        return await self._run(self._cursor.fetchall)
+
+    async def close(self):
+        if self._in_transaction:
+            # the transaction closes its own cursor
+            return
+        await self._close_cursor()
+
+    async def _ensure_writer_cursor(self):
+        if self._cursor is None or self._on_reader:
+            await self._close_cursor()
+            self._on_reader = False
+            self._reader_executor = None
+            self._cursor = await self._run_on(False, self._new_cursor,
+                                              self._adbc.dbc)
+
+    async def _close_cursor(self):
+        if self._cursor is None:
+            return
+        cursor, self._cursor = self._cursor, None
+        await self._run_on(self._on_reader, cursor.close)
+
+    async def _run(self, func, /, *args, **kwargs):
+        return await self._run_on(self._on_reader, func, *args, **kwargs)
+
+    async def _run_on(self, on_reader, func, /, *args, **kwargs):
+        if on_reader:
+            return await self._adbc._run_in(self._reader_executor, func,
+                                            *args, **kwargs)
+        if self._in_transaction:
+            return await self._adbc._run_writer(func, *args, **kwargs)
+        async with self._adbc._writer_lock():
+            return await self._adbc._run_writer(func, *args, **kwargs)
+
+    def _new_reader_cursor(self):
+        # runs on a reader thread
+        return self._new_cursor(self._adbc.dbc.session())
+
+    def _new_cursor(self, source):
+        cursor = source.cursor()
+        cursor.arraysize = self._arraysize
+        return cursor
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    def __aiter__(self):
+        return self.fetch()
+
+
+class AsyncTransaction:
+    """Asynchronous counterpart of Transaction.
+    The lock of the AsyncLiteDBC is held until the transaction ends.
+    A transaction opened by the task that owns the pending transaction
+    is nested, see Transaction"""
+    def __init__(self, adbc, mode):
+        self._adbc = adbc
+        self._mode = mode
+        self._transaction = None
+        self._cur = None
+        self._is_nested = False
+
+    @property
+    def adbc(self):
+        return self._adbc
+
+    @property
+    def mode(self):
+        return self._mode
+
+    @property
+    def cursor(self):
+        return self._cur
+
+    async def __aenter__(self):
+        self._is_nested = self._adbc._is_owner()
+        if not self._is_nested:
+            await self._adbc.lock.acquire()
+            self._adbc._owner = asyncio.current_task()
+        try:
+            self._transaction = self._adbc.dbc.transaction(self._mode)
+            future = asyncio.ensure_future(
+                self._adbc._run_writer(self._transaction.__enter__))
+            try:
+                cursor = await asyncio.shield(future)
+            except asyncio.CancelledError as e:
+                await self._abort(future, e)
+                raise
+        except BaseException:
+            self._release()
+            raise
+        self._cur = AsyncCursor(self._adbc, cursor)
+        return self._cur
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        try:
+            await self._adbc._run_writer(self._transaction.__exit__,
+                                         exc_type, exc_val, exc_tb)
+        finally:
+            self._release()
+
+    async def _abort(self, future, error):
+        # the transaction keeps starting on the writer thread after
+        # a cancellation, it must end there before the lock is released
+        async def abort():
+            try:
+                await future
+            except BaseException:
+                return  # the transaction didn't start
+            try:
+                await self._adbc._run_writer(self._transaction.__exit__,
+                                             type(error), error,
+                                             error.__traceback__)
+            except Exception:
+                pass  # the write lock is released anyway
+        cleanup = asyncio.ensure_future(abort())
+        while not cleanup.done():
+            try:
+                await asyncio.shield(cleanup)
+            except asyncio.CancelledError:
+                pass  # cancelled again, the cleanup goes on
+
+    def _release(self):
+        if not self._is_nested:
+            self._adbc._owner = None
+            self._adbc.lock.release()
@@ -0,0 +1,293 @@
+"""Scheduled online backups"""
+import os
+import time
+import datetime
+import threading
+import sqlite3 as sqlite
+from collections import namedtuple
+from litedbc import errors
+
+
+BackupInfo = namedtuple("BackupInfo", ["backups", "failures", "pages",
+                                       "progress", "last_duration",
+                                       "last_filename", "last_error", "lag"])
+
+CLOSED_MANAGER_MSG = "Cannot operate on a closed backup manager."
+CHECKS = ("quick_check", "integrity_check")
+STAMP_FORMAT = "%Y%m%d-%H%M%S-%f"
+STAMP_SIZE = len("YYYYmmdd-HHMMSS-ffffff")
+
+
+class BackupManager:
+    """Online backups run by a background thread every 'interval' seconds.
+    The database is copied 'pages' pages at a time, with a pause between
+    two steps so that writers can take the database in the meantime.
+
+    The pause grows when a step takes longer than 'step_budget' or
+    when the database is busy, and the number of pages per step of the
+    next backup is adjusted accordingly (halved under contention, grown
+    by a quarter otherwise). The most recent 'generations' copies are kept"""
+    def __init__(self, dbc, directory, *, interval=3600, pages=256,
+                 pause=0.005, step_budget=0.005, generations=3,
+                 check=None, check_every=1, prefix=None,
+                 min_pages=16, max_pages=16384):
+        """
+        Init
+
+        [parameters]
+        - dbc: LiteDBC instance
+        - directory: directory where the copies are stored
+        - interval: time in seconds between two backups
+        - pages: initial number of pages copied per step
+        - pause: minimum time in seconds between two steps
+        - step_budget: time in seconds a step may take before it is
+            considered as contention
+        - generations: number of copies to keep
+        - check: None, "quick_check" or "integrity_check", the pragma
+            run on the copy before it replaces the oldest generation
+        - check_every: run the check every N backups
+        - prefix: prefix of the filenames of the copies,
+            defaults to the name of the database file
+        - min_pages: lower bound of the number of pages per step
+        - max_pages: upper bound of the number of pages per step
+        """
+        if check is not None and check not in CHECKS:
+            msg = "Invalid check '{}'. Expected one of: {}"
+            raise errors.ProgrammingError(msg.format(check, ", ".join(CHECKS)))
+        self._dbc = dbc
+        self._directory = os.fspath(directory)
+        self._interval = interval
+        self._pages = pages
+        self._pause = pause
+        self._step_budget = step_budget
+        self._generations = generations
+        self._check = check
+        self._check_every = check_every
+        self._prefix = prefix if prefix else _get_prefix(dbc.filename)
+        self._min_pages = min_pages
+        self._max_pages = max_pages
+        self._lock = threading.Lock()
+        self._run_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._is_closed = False
+        self._backups = 0
+        self._failures = 0
+        self._progress = None
+        self._last_duration = None
+        self._last_filename = None
+        self._last_error = None
+        self._last_success = None
+
+    @property
+    def dbc(self):
+        return self._dbc
+
+    @property
+    def directory(self):
+        return self._directory
+
+    @property
+    def interval(self):
+        return self._interval
+
+    @property
+    def pages(self):
+        """Number of pages per step of the next backup"""
+        return self._pages
+
+    @property
+    def generations(self):
+        return self._generations
+
+    @property
+    def check(self):
+        return self._check
+
+    @property
+    def is_closed(self):
+        with self._lock:
+            return self._is_closed
+
+    def start(self):
+        """Start the background thread. The first backup runs immediately"""
+        with self._lock:
+            if self._is_closed:
+                raise errors.ProgrammingError(CLOSED_MANAGER_MSG)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop,
+                                                name="litedbc-backup",
+                                                daemon=True)
+                self._thread.start()
+
+    def trigger(self):
+        """Ask the background thread to run a backup now"""
+        self._wakeup.set()
+
+    def run(self):
+        """
+        Run a backup in the current thread
+
+        [return]
+        Returns the filename of the new copy
+        """
+        with self._run_lock:
+            if self.is_closed:
+                raise errors.ProgrammingError(CLOSED_MANAGER_MSG)
+            os.makedirs(self._directory, exist_ok=True)
+            filename = self._get_filename()
+            tmp_filename = filename + ".tmp"
+            start = time.monotonic()
+            try:
+                contention = self._copy(tmp_filename)
+                if (self._check is not None
+                        and (self._backups + 1) % self._check_every == 0):
+                    _check_copy(tmp_filename, self._check)
+                os.replace(tmp_filename, filename)
+            except BaseException as e:
+                with self._lock:
+                    self._failures += 1
+                    self._last_error = e
+                    self._progress = None
+                _remove(tmp_filename)
+                raise
+            self._adjust_pages(contention)
+            with self._lock:
+                self._backups += 1
+                self._last_duration = time.monotonic() - start
+                self._last_filename = filename
+                self._last_error = None
+                self._last_success = time.monotonic()
+                self._progress = None
+            self._rotate()
+            return filename
+
+    def info(self):
+        """
+        Returns a BackupInfo namedtuple:
+            - backups: number of successful backups
+            - failures: number of failed backups
+            - pages: number of pages per step of the next backup
+            - progress: fraction (0 to 1) of the backup in progress, or None
+            - last_duration: duration in seconds of the last successful backup
+            - last_filename: filename of the last successful backup
+            - last_error: exception raised by the last backup if it failed
+            - lag: time in seconds since the end of the last successful
+                backup, None if there is none
+        """
+        with self._lock:
+            lag = None
+            if self._last_success is not None:
+                lag = time.monotonic() - self._last_success
+            return BackupInfo(self._backups, self._failures, self._pages,
+                              self._progress, self._last_duration,
+                              self._last_filename, self._last_error, lag)
+
+    def list_generations(self):
+        """Returns the filenames of the copies, from the oldest to the newest"""
+        try:
+            names = os.listdir(self._directory)
+        except FileNotFoundError:
+            return tuple()
+        start, end = self._prefix + "-", ".db"
+        size = len(start) + STAMP_SIZE + len(end)
+        names = sorted([name for name in names
+                        if name.startswith(start) and name.endswith(end)
+                        and len(name) == size])
+        return tuple([os.path.join(self._directory, name) for name in names])
+
+    def close(self):
+        """
+        Stop the background thread. A backup in progress is completed first
+
+        [return]
+        Returns a boolean
+        """
+        with self._lock:
+            if self._is_closed:
+                return False
+            self._is_closed = True
+            thread = self._thread
+        self._wakeup.set()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        return True
+
+    def _loop(self):
+        while not self.is_closed:
+            try:
+                self.run()
+            except Exception:
+                pass  # reported by 'info'
+            self._wakeup.wait(self._interval)
+            self._wakeup.clear()
+
+    def _copy(self, filename):
+        # returns True if contention was observed
+        contention = False
+        last = time.monotonic()
+
+        def progress(status, remaining, total):
+            nonlocal contention, last
+            duration = time.monotonic() - last
+            with self._lock:
+                self._progress = (total - remaining) / total if total else 1.0
+            if status in (sqlite.SQLITE_BUSY, sqlite.SQLITE_LOCKED):
+                contention = True  # the backup sleeps before the next step
+            elif remaining:
+                pause = self._pause
+                if duration > self._step_budget:
+                    contention = True
+                    # leave writers as much time as the step took
+                    pause = max(pause, min(duration, 1.0))
+                time.sleep(pause)
+            last = time.monotonic()
+
+        dst = sqlite.connect(filename)
+        try:
+            self._dbc.backup(dst, pages=self._pages, progress=progress)
+        finally:
+            dst.close()
+        return contention
+
+    def _adjust_pages(self, contention):
+        if contention:
+            pages = self._pages // 2
+        else:
+            pages = self._pages + max(1, self._pages // 4)
+        with self._lock:
+            self._pages = max(self._min_pages, min(self._max_pages, pages))
+
+    def _rotate(self):
+        filenames = self.list_generations()
+        for filename in filenames[:max(0, len(filenames) - self._generations)]:
+            _remove(filename)
+
+    def _get_filename(self):
+        stamp = datetime.datetime.now().strftime(STAMP_FORMAT)
+        name = "{}-{}.db".format(self._prefix, stamp)
+        return os.path.join(self._directory, name)
+
+
+def _get_prefix(filename):
+    if filename == ":memory:" or filename.startswith("file:"):
+        return "backup"
+    return os.path.splitext(os.path.basename(filename))[0]
+
+
+def _check_copy(filename, check):
+    conn = sqlite.connect(filename)
+    try:
+        rows = conn.execute("PRAGMA {}".format(check)).fetchall()
+    finally:
+        conn.close()
+    if rows != [("ok", )]:
+        msg = "The {} of the copy failed: {}"
+        raise errors.DatabaseError(msg.format(check, rows[0][0]))
+
+
+def _remove(filename):
+    try:
+        os.remove(filename)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,201 @@
+"""Streaming access to BLOB values"""
+import io
+import warnings
+import threading
+from litedbc import bulk, errors
+
+
+# size of the chunks yielded when iterating over a BlobReader
+CHUNK_SIZE = 64 * 1024
+
+
+class BlobReader(io.RawIOBase):
+    """Read-only binary file object over a BLOB value.
+    It works with shutil.copyfileobj and io.BufferedReader.
+    Iterating over it yields chunks of CHUNK_SIZE bytes"""
+    def __init__(self, blob):
+        """
+        Init
+
+        [parameters]
+        - blob: sqlite3.Blob instance opened in read-only mode
+        """
+        super().__init__()
+        self._blob = blob
+
+    @property
+    def size(self):
+        return len(self._blob)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        """Read up to len(buffer) bytes into a writable buffer
+        (bytearray, memoryview, array, ...) and return the number of bytes
+        read. Only a chunk of the size of the buffer is held in memory"""
+        with memoryview(buffer) as view, view.cast("B") as view:
+            data = self._blob.read(len(view))
+            n = len(data)
+            view[:n] = data
+        return n
+
+    def chunks(self, size=CHUNK_SIZE):
+        """Generator that yields the remaining content, 'size' bytes at a time"""
+        while True:
+            data = self._blob.read(size)
+            if not data:
+                return
+            yield data
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        self._blob.seek(offset, whence)
+        return self._blob.tell()
+
+    def tell(self):
+        return self._blob.tell()
+
+    def close(self):
+        if not self.closed:
+            self._blob.close()
+        super().close()
+
+    def __iter__(self):
+        return self.chunks()
+
+    def __len__(self):
+        return len(self._blob)
+
+
+class BlobWriter(io.RawIOBase):
+    """Write-only binary file object over a BLOB value. The BLOB can't grow:
+    its size is fixed by the value it holds, typically a zeroblob(N).
+    The writes are committed when the writer is closed, and rolled back
+    when its context manager exits with an exception. close() is the only
+    way to commit: a writer garbage collected without being closed rolls
+    back its writes. The write lock is held until then, so the writer
+    must be closed by the thread that opened it"""
+    def __init__(self, blob, transaction):
+        """
+        Init
+
+        [parameters]
+        - blob: sqlite3.Blob instance
+        - transaction: entered Transaction instance, exited on close
+        """
+        super().__init__()
+        self._blob = blob
+        self._transaction = transaction
+        self._thread_id = threading.get_ident()
+
+    @property
+    def size(self):
+        return len(self._blob)
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def write(self, data):
+        """Write a bytes-like object and return the number of bytes written"""
+        with memoryview(data) as view, view.cast("B") as view:
+            n = len(view)
+            if n > len(self._blob) - self._blob.tell():
+                msg = ("The data exceeds the size of the BLOB ({} bytes). "
+                       "Preallocate it with zeroblob().")
+                raise errors.DataError(msg.format(len(self._blob)))
+            self._blob.write(view)
+        return n
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        self._blob.seek(offset, whence)
+        return self._blob.tell()
+
+    def tell(self):
+        return self._blob.tell()
+
+    def close(self):
+        """Commit the writes"""
+        self._close(None, None, None)
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._close(exc_type, exc_val, exc_tb)
+
+    def __del__(self):
+        # io.IOBase.__del__ would call close() and commit
+        if getattr(self, "_transaction", None) is None or self.closed:
+            return
+        warnings.warn("Unclosed BlobWriter, its writes are rolled back",
+                      ResourceWarning, source=self)
+        if self._thread_id != threading.get_ident():
+            # the write lock can only be released by the thread owning it
+            return
+        error = errors.Error("BlobWriter garbage collected without being closed")
+        try:
+            self._close(type(error), error, None)
+        except Exception:
+            pass
+
+    def __len__(self):
+        return len(self._blob)
+
+    def _close(self, exc_type, exc_val, exc_tb):
+        if self.closed:
+            return
+        try:
+            self._blob.close()
+        finally:
+            super().close()
+            self._transaction.__exit__(exc_type, exc_val, exc_tb)
+
+
+def open_reader(conn, table, column, rowid, name="main"):
+    """Returns a BlobReader over the BLOB stored in
+    'table.column' at the given rowid"""
+    _ensure_support(conn)
+    blob = conn.blobopen(table, column, rowid, readonly=True, name=name)
+    return BlobReader(blob)
+
+
+def open_writer(conn, transaction, table, column, rowid, size=None,
+                name="main"):
+    """
+    Returns a BlobWriter over the BLOB stored in 'table.column'
+    at the given rowid
+
+    [parameters]
+    - conn: connection of the transaction
+    - transaction: Transaction instance, not entered yet
+    - table, column, rowid: location of the BLOB
+    - size: if set, the value is first replaced with a zeroblob of
+        'size' bytes, so that it can be filled without materializing
+        the whole value in memory
+    - name: name of the database (main, temp or an attached database)
+    """
+    _ensure_support(conn)
+    cur = transaction.__enter__()
+    try:
+        if size is not None:
+            sql = "UPDATE {}.{} SET {} = zeroblob(?) WHERE rowid = ?"
+            sql = sql.format(bulk.quote_identifier(name),
+                             bulk.quote_identifier(table),
+                             bulk.quote_identifier(column))
+            cur.execute(sql, (size, rowid))
+            if cur.rowcount != 1:
+                raise errors.Error("Non-existent row ({})".format(rowid))
+        blob = conn.blobopen(table, column, rowid, readonly=False, name=name)
+    except BaseException as e:
+        transaction.__exit__(type(e), e, e.__traceback__)
+        raise
+    return BlobWriter(blob, transaction)
+
+
+def _ensure_support(conn):
+    if not hasattr(conn, "blobopen"):
+        raise errors.NotSupportedError("Incremental BLOB I/O "
+                                       "requires Python 3.11 or newer.")
@@ -0,0 +1,107 @@
+"""High-throughput insertion of rows"""
+import functools
+import itertools
+import sqlite3 as sqlite
+from litedbc import errors
+
+
+# default number of rows per INSERT statement
+CHUNK_ROWS = 500
+# SQLITE_MAX_VARIABLE_NUMBER of SQLite versions prior to 3.32.0,
+# used when the connection can't report its actual limit
+MAX_VARIABLES = 999
+
+
+def bulk_insert(dbc, table, columns, rows, chunk_rows=None,
+                commit_every=None, on_conflict=None):
+    """
+    Insert rows with multi-row `INSERT ... VALUES (...), (...)` statements
+
+    [parameters]
+    - dbc: LiteDBC instance
+    - table: name of the table
+    - columns: sequence of column names
+    - rows: iterable (or generator) of sequences of values, each sequence
+        having exactly as many values as there are columns
+    - chunk_rows: maximum number of rows per statement. It is capped so that
+        a statement never exceeds the limit of variables of the connection
+    - commit_every: number of rows per transaction, None to insert
+        all rows in a single transaction
+    - on_conflict: optional upsert clause appended to the statement,
+        e.g. "ON CONFLICT(name) DO UPDATE SET size=excluded.size"
+
+    [return]
+    Returns the number of rows inserted or updated
+    """
+    if commit_every is not None and (not isinstance(commit_every, int)
+                                     or isinstance(commit_every, bool)
+                                     or commit_every < 1):
+        msg = "Invalid commit_every '{}'. Expected None or an integer >= 1."
+        raise errors.ProgrammingError(msg.format(commit_every))
+    columns = tuple(columns)
+    n_cols = len(columns)
+    if not n_cols:
+        raise errors.ProgrammingError("At least one column is required.")
+    max_rows = max(1, get_max_variables(dbc) // n_cols)
+    chunk_rows = CHUNK_ROWS if chunk_rows is None else chunk_rows
+    chunk_rows = max(1, min(chunk_rows, max_rows))
+    rows = iter(rows)
+    total = 0
+    chunk = _next_chunk(rows, chunk_rows, commit_every, 0)
+    while chunk:
+        with dbc.immediate_transaction() as cur:
+            pending = 0
+            while True:
+                sql = get_insert_stmt(table, columns, len(chunk), on_conflict)
+                cur.execute(sql, _flatten(chunk, n_cols))
+                total += cur.rowcount
+                pending += len(chunk)
+                if commit_every is not None and pending >= commit_every:
+                    chunk = None
+                    break
+                chunk = _next_chunk(rows, chunk_rows, commit_every, pending)
+                if not chunk:
+                    break
+        if chunk is None:
+            chunk = _next_chunk(rows, chunk_rows, commit_every, 0)
+    return total
+
+
+def get_max_variables(dbc):
+    """Returns the maximum number of variables per statement"""
+    try:
+        return dbc.getlimit(sqlite.SQLITE_LIMIT_VARIABLE_NUMBER)
+    except AttributeError:  # Python < 3.11
+        return MAX_VARIABLES
+
+
+@functools.lru_cache(maxsize=128)
+def get_insert_stmt(table, columns, n_rows, on_conflict=None):
+    """Returns the SQL text of an INSERT statement for 'n_rows' rows.
+    Since the text is cached, the compiled statement is reused
+    from the statement cache of the connection"""
+    names = ", ".join([quote_identifier(name) for name in columns])
+    values = "({})".format(", ".join("?" * len(columns)))
+    sql = "INSERT INTO {} ({}) VALUES {}".format(quote_identifier(table), names,
+                                                 ", ".join([values] * n_rows))
+    if on_conflict:
+        sql = "{} {}".format(sql, on_conflict)
+    return sql
+
+
+def quote_identifier(name):
+    return '"{}"'.format(name.replace('"', '""'))
+
+
+def _next_chunk(rows, chunk_rows, commit_every, pending):
+    if commit_every is not None:
+        chunk_rows = min(chunk_rows, commit_every - pending)
+    return list(itertools.islice(rows, chunk_rows))
+
+
+def _flatten(chunk, n_cols):
+    params = list(itertools.chain.from_iterable(chunk))
+    if len(params) != n_cols * len(chunk):
+        msg = "Each row must have {} values.".format(n_cols)
+        raise errors.ProgrammingError(msg)
+    return params
@@ -0,0 +1,139 @@
+"""Cache of query results"""
+import sys
+import time
+import threading
+from collections import OrderedDict, namedtuple
+
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "evictions",
+                                     "entries", "bytes"])
+
+# default bounds of the cache
+MAX_ENTRIES = 128
+MAX_BYTES = 8 * 1024 * 1024
+
+
+class QueryCache:
+    """LRU cache of query results, bounded by number of entries and
+    by an estimation of the memory used by the rows.
+
+    Each entry is stored with a token that describes the state of the
+    database when the rows were fetched. An entry is only returned
+    when the current token is equal to the stored one"""
+    def __init__(self, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES):
+        """
+        Init
+
+        [parameters]
+        - max_entries: maximum number of cached results
+        - max_bytes: maximum size in bytes of the cached results
+        """
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @property
+    def max_entries(self):
+        return self._max_entries
+
+    @property
+    def max_bytes(self):
+        return self._max_bytes
+
+    @property
+    def hits(self):
+        return self._hits
+
+    @property
+    def misses(self):
+        return self._misses
+
+    def info(self):
+        """Returns a CacheInfo namedtuple(hits, misses, evictions, entries, bytes)"""
+        with self._lock:
+            return CacheInfo(self._hits, self._misses, self._evictions,
+                             len(self._entries), self._bytes)
+
+    def get(self, key, token):
+        """Returns the cached rows, or None when there is no valid entry"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry_token, expiry, rows, size = entry
+                if (entry_token == token
+                        and (expiry is None or time.monotonic() < expiry)):
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    return rows
+                self._remove(key)
+            self._misses += 1
+            return None
+
+    def put(self, key, token, rows, ttl=None):
+        """
+        Store rows fetched while the database was in the state described
+        by 'token'. The entry expires after 'ttl' seconds if ttl is set.
+
+        [return]
+        Returns a boolean, False if the rows are too large to be cached
+        """
+        size = get_size(rows)
+        if size > self._max_bytes:
+            return False
+        expiry = None if ttl is None else time.monotonic() + ttl
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (token, expiry, rows, size)
+            self._bytes += size
+            while (len(self._entries) > self._max_entries
+                   or self._bytes > self._max_bytes):
+                self._remove(next(iter(self._entries)))
+                self._evictions += 1
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry[3]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+def get_size(rows):
+    """Estimate the memory used by a sequence of rows"""
+    size = sys.getsizeof(rows)
+    for row in rows:
+        size += sys.getsizeof(row)
+        for value in row:
+            size += sys.getsizeof(value)
+    return size
+
+
+def make_key(sql, params):
+    """Returns a hashable key made of the SQL statement (preferably
+    normalized) and its parameters, or None if the parameters
+    aren't hashable"""
+    if params is None:
+        params = tuple()
+    elif isinstance(params, dict):
+        params = tuple(sorted(params.items()))
+    else:
+        params = tuple(params)
+    key = (sql, params)
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
@@ -0,0 +1,133 @@
+"""Schema catalog, loaded with set-based queries"""
+import json
+import hashlib
+from collections import namedtuple
+
+
+ColumnInfo = namedtuple("ColumnInfo", ["cid", "name", "type",
+                                       "not_null", "default",
+                                       "primary_key", "foreign_key",
+                                       "index_info"])
+
+SCHEMA_VERSION_QUERY = "SELECT schema_version FROM pragma_schema_version"
+
+OBJECTS_QUERY = """
+SELECT name, type FROM sqlite_master WHERE type IN ('table', 'view')"""
+
+COLUMNS_QUERY = """
+SELECT m.name, p.cid, p.name, p.type, p."notnull", p.dflt_value, p.pk
+FROM sqlite_master AS m JOIN pragma_table_info(m.name) AS p
+WHERE m.type IN ('table', 'view')"""
+
+FOREIGN_KEYS_QUERY = """
+SELECT m.name, f.id, f.seq, f."table", f."from", f."to"
+FROM sqlite_master AS m JOIN pragma_foreign_key_list(m.name) AS f
+WHERE m.type = 'table'"""
+
+INDEXES_QUERY = """
+SELECT m.name, il.seq, il."unique", il.origin, ii.seqno, ii.cid, ii.name
+FROM sqlite_master AS m
+JOIN pragma_index_list(m.name) AS il
+JOIN pragma_index_info(il.name) AS ii
+WHERE m.type = 'table'"""
+
+
+class Catalog:
+    """Snapshot of the schema of the main database: tables, views,
+    and for each of them, the ColumnInfo of their columns"""
+    def __init__(self, schema_version, tables, views, columns):
+        """
+        Init
+
+        [parameters]
+        - schema_version: value of PRAGMA schema_version for this snapshot
+        - tables: tuple of table names, in the order of sqlite_master
+        - views: tuple of view names
+        - columns: dict, keys are lowercase table or view names,
+            values are tuples of ColumnInfo instances
+        """
+        self._schema_version = schema_version
+        self._tables = tables
+        self._views = views
+        self._columns = columns
+        self._fingerprint = None
+
+    @property
+    def schema_version(self):
+        return self._schema_version
+
+    @property
+    def tables(self):
+        """Tuple of table names, internal 'sqlite_' tables included"""
+        return self._tables
+
+    @property
+    def views(self):
+        return self._views
+
+    @property
+    def fingerprint(self):
+        """SHA-256 hex digest of the tables (internal 'sqlite_' tables
+        excluded) and their ColumnInfo. Two catalogs with the same
+        fingerprint have the same tables with the same columns"""
+        if self._fingerprint is None:
+            data = [[name, self._columns[name.lower()]]
+                    for name in sorted(self.list_tables())]
+            data = json.dumps(data, separators=(",", ":"))
+            self._fingerprint = hashlib.sha256(data.encode("utf-8")).hexdigest()
+        return self._fingerprint
+
+    def list_tables(self):
+        """Returns a tuple of table names, without internal 'sqlite_' tables"""
+        return tuple([name for name in self._tables
+                      if not name.lower().startswith("sqlite_")])
+
+    def get_columns(self, name):
+        """Returns the tuple of ColumnInfo of a table or a view,
+        or None if it doesn't exist"""
+        return self._columns.get(name.lower())
+
+    def __contains__(self, name):
+        return name.lower() in self._columns
+
+
+def load(conn):
+    """Load the catalog of the main database with a few set-based queries.
+    The queries are run again if the schema changes meanwhile"""
+    while True:
+        schema_version = get_schema_version(conn)
+        catalog = _load(conn, schema_version)
+        if get_schema_version(conn) == schema_version:
+            return catalog
+
+
+def get_schema_version(conn):
+    return conn.execute(SCHEMA_VERSION_QUERY).fetchone()[0]
+
+
+def _load(conn, schema_version):
+    tables, views = list(), list()
+    for name, kind in conn.execute(OBJECTS_QUERY).fetchall():
+        (tables if kind == "table" else views).append(name)
+    foreign_keys = dict()
+    for row in conn.execute(FOREIGN_KEYS_QUERY).fetchall():
+        table, fid, rank, foreign_table, local_name, foreign_name = row
+        foreign_keys.setdefault(table, dict())[local_name] = (fid, rank,
+                                                              foreign_table,
+                                                              foreign_name)
+    indexes = dict()
+    for row in conn.execute(INDEXES_QUERY).fetchall():
+        table, rank1, unique, spec, rank2, rank3, colname = row
+        if colname:
+            indexes.setdefault(table, dict())[colname] = (rank1, rank2, rank3,
+                                                          bool(unique), spec)
+    columns = dict()
+    for row in conn.execute(COLUMNS_QUERY).fetchall():
+        table, cid, name, dtype, not_null, default, pk = row
+        fk = foreign_keys.get(table, dict()).get(name)
+        index_info = indexes.get(table, dict()).get(name)
+        info = ColumnInfo(cid, name, dtype, bool(not_null), default, pk,
+                          fk, index_info)
+        columns.setdefault(table.lower(), list()).append(info)
+    columns = {table: tuple(infos) for table, infos in columns.items()}
+    return Catalog(schema_version, tuple(tables), tuple(views), columns)
@@ -0,0 +1,256 @@
+"""Background checkpoints of the WAL"""
+import os
+import time
+import threading
+import sqlite3 as sqlite
+from collections import namedtuple
+from litedbc import errors
+from litedbc.const import JournalMode
+
+
+CheckpointInfo = namedtuple("CheckpointInfo", ["checkpoints", "escalations",
+                                               "failures", "wal_size",
+                                               "wal_frames", "frames",
+                                               "last_mode", "last_duration",
+                                               "total_duration", "last_error"])
+
+CLOSED_MANAGER_MSG = "Cannot operate on a closed checkpoint manager."
+MODES = ("PASSIVE", "FULL", "RESTART", "TRUNCATE")
+ESCALATIONS = ("RESTART", "TRUNCATE")
+
+
+class CheckpointManager:
+    """Checkpoints run by a background thread, so that writers never pay
+    for them: the automatic checkpoints of the connections of the dbc
+    are disabled while the manager runs.
+
+    A PASSIVE checkpoint runs every 'interval' seconds, or as soon as the
+    WAL file reaches 'wal_size' bytes. When readers prevent a PASSIVE
+    checkpoint from emptying a WAL larger than 'escalate_size' bytes,
+    the manager escalates to 'escalate' (RESTART or TRUNCATE) if allowed,
+    so that the WAL stops growing"""
+    def __init__(self, dbc, *, interval=1.0, wal_size=4 * 1024 * 1024,
+                 poll=0.05, escalate=None, escalate_size=64 * 1024 * 1024,
+                 busy_timeout=0.1):
+        """
+        Init
+
+        [parameters]
+        - dbc: LiteDBC instance of a database in WAL mode
+        - interval: maximum time in seconds between two checkpoints
+        - wal_size: size in bytes of the WAL that triggers a checkpoint
+        - poll: time in seconds between two checks of the size of the WAL
+        - escalate: None (never escalate), "RESTART" or "TRUNCATE"
+        - escalate_size: size in bytes of the WAL above which
+            the manager escalates
+        - busy_timeout: time in seconds an escalated checkpoint waits
+            for readers and writers
+        """
+        if escalate is not None and escalate.upper() not in ESCALATIONS:
+            msg = "Invalid escalation '{}'. Expected one of: {}"
+            raise errors.ProgrammingError(msg.format(escalate,
+                                                     ", ".join(ESCALATIONS)))
+        self._dbc = dbc
+        self._interval = interval
+        self._wal_size = wal_size
+        self._poll = poll
+        self._escalate = None if escalate is None else escalate.upper()
+        self._escalate_size = escalate_size
+        self._busy_timeout = busy_timeout
+        self._wal_filename = dbc.filename + "-wal"
+        self._lock = threading.Lock()
+        self._run_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._conn = None
+        self._autocheckpoint = None
+        self._is_closed = False
+        self._checkpoints = 0
+        self._escalations = 0
+        self._failures = 0
+        self._wal_frames = 0
+        self._checkpointed = 0  # frames of the WAL checkpointed so far
+        self._frames = 0
+        self._last_mode = None
+        self._last_duration = None
+        self._total_duration = 0.0
+        self._last_error = None
+
+    @property
+    def dbc(self):
+        return self._dbc
+
+    @property
+    def interval(self):
+        return self._interval
+
+    @property
+    def wal_size(self):
+        """Size in bytes of the WAL that triggers a checkpoint"""
+        return self._wal_size
+
+    @property
+    def escalate(self):
+        return self._escalate
+
+    @property
+    def is_closed(self):
+        with self._lock:
+            return self._is_closed
+
+    def start(self):
+        """Disable the automatic checkpoints of the dbc
+        and start the background thread"""
+        with self._lock:
+            if self._is_closed:
+                raise errors.ProgrammingError(CLOSED_MANAGER_MSG)
+            if self._thread is not None:
+                return
+            if self._dbc.get_journal_mode() != JournalMode.WAL:
+                msg = "Checkpoints require the WAL journal mode."
+                raise errors.ProgrammingError(msg)
+            self._autocheckpoint = _set_autocheckpoint(self._dbc, 0)
+            self._thread = threading.Thread(target=self._loop,
+                                            name="litedbc-checkpoint",
+                                            daemon=True)
+            self._thread.start()
+
+    def trigger(self):
+        """Ask the background thread to run a checkpoint now"""
+        self._wakeup.set()
+
+    def run(self, mode="PASSIVE"):
+        """
+        Run a checkpoint in the current thread
+
+        [parameters]
+        - mode: one of "PASSIVE", "FULL", "RESTART" and "TRUNCATE"
+
+        [return]
+        Returns the (busy, log, checkpointed) row of PRAGMA wal_checkpoint:
+        busy is 1 if the checkpoint couldn't complete, log is the number
+        of frames of the WAL and checkpointed the number of frames
+        copied back into the database
+        """
+        mode = mode.upper()
+        if mode not in MODES:
+            msg = "Invalid mode '{}'. Expected one of: {}"
+            raise errors.ProgrammingError(msg.format(mode, ", ".join(MODES)))
+        with self._run_lock:
+            if self.is_closed:
+                raise errors.ProgrammingError(CLOSED_MANAGER_MSG)
+            conn = self._get_connection()
+            timeout = 0 if mode == "PASSIVE" else self._busy_timeout
+            conn.execute("PRAGMA busy_timeout={}".format(int(timeout * 1000)))
+            start = time.monotonic()
+            try:
+                cur = conn.execute("PRAGMA wal_checkpoint({})".format(mode))
+                busy, log, checkpointed = cur.fetchone()
+            except sqlite.Error as e:
+                with self._lock:
+                    self._failures += 1
+                    self._last_error = e
+                raise
+            duration = time.monotonic() - start
+            with self._lock:
+                self._checkpoints += 1
+                self._escalations += 0 if mode == "PASSIVE" else 1
+                log, checkpointed = max(log, 0), max(checkpointed, 0)
+                # the counts restart along with the WAL
+                if log >= self._wal_frames and checkpointed >= self._checkpointed:
+                    self._frames += checkpointed - self._checkpointed
+                else:
+                    self._frames += checkpointed
+                self._wal_frames, self._checkpointed = log, checkpointed
+                self._last_mode = mode
+                self._last_duration = duration
+                self._total_duration += duration
+                self._last_error = None
+            return busy, log, checkpointed
+
+    def info(self):
+        """
+        Returns a CheckpointInfo namedtuple:
+            - checkpoints: number of checkpoints run
+            - escalations: number of RESTART, TRUNCATE or FULL checkpoints
+            - failures: number of checkpoints that raised an error
+            - wal_size: current size in bytes of the WAL file
+            - wal_frames: number of frames in the WAL at the last checkpoint
+            - frames: total number of frames checkpointed
+            - last_mode: mode of the last checkpoint
+            - last_duration: duration in seconds of the last checkpoint
+            - total_duration: time in seconds spent in checkpoints
+            - last_error: exception raised by the last checkpoint if it failed
+        """
+        wal_size = self._get_wal_size()
+        with self._lock:
+            return CheckpointInfo(self._checkpoints, self._escalations,
+                                  self._failures, wal_size, self._wal_frames,
+                                  self._frames, self._last_mode,
+                                  self._last_duration, self._total_duration,
+                                  self._last_error)
+
+    def close(self):
+        """
+        Stop the background thread and restore
+        the automatic checkpoints of the dbc
+
+        [return]
+        Returns a boolean
+        """
+        with self._lock:
+            if self._is_closed:
+                return False
+            self._is_closed = True
+            thread = self._thread
+        self._wakeup.set()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        with self._run_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+        if thread is not None and not self._dbc.is_closed:
+            _set_autocheckpoint(self._dbc, self._autocheckpoint)
+        return True
+
+    def _loop(self):
+        last = time.monotonic()
+        while not self.is_closed:
+            triggered = self._wakeup.wait(self._poll)
+            self._wakeup.clear()
+            if self.is_closed:
+                return
+            wal_size = self._get_wal_size()
+            if (not triggered and wal_size < self._wal_size
+                    and time.monotonic() - last < self._interval):
+                continue
+            last = time.monotonic()
+            try:
+                busy, log, checkpointed = self.run("PASSIVE")
+                if (self._escalate is not None and log != checkpointed
+                        and self._get_wal_size() >= self._escalate_size):
+                    self.run(self._escalate)
+            except Exception:
+                pass  # reported by 'info'
+
+    def _get_connection(self):
+        if self._conn is None:
+            self._conn = self._dbc._create_secondary_connection()
+        return self._conn
+
+    def _get_wal_size(self):
+        try:
+            return os.path.getsize(self._wal_filename)
+        except OSError:
+            return 0
+
+
+def _set_autocheckpoint(dbc, pages):
+    # set wal_autocheckpoint on every connection of the dbc
+    # and return the previous value of the main connection
+    def hook(conn):
+        previous = conn.execute("PRAGMA wal_autocheckpoint").fetchone()[0]
+        conn.execute("PRAGMA wal_autocheckpoint={}".format(pages)).fetchall()
+        return previous
+    return dbc._register_conn_hook(("wal_autocheckpoint", ), hook)
@@ -0,0 +1,190 @@
+"""Columnar fetch of query results"""
+import array
+from collections import namedtuple
+from litedbc import errors
+
+try:
+    import numpy
+except ImportError:  # NumPy is optional
+    numpy = None
+
+
+__all__ = ["Columns", "fetch_columns", "OBJECT"]
+
+
+Columns = namedtuple("Columns", ["names", "data", "masks"])
+
+# default number of rows fetched at once
+CHUNK_SIZE = 4096
+# typecode for columns stored as lists of Python objects (TEXT, BLOB, mixed)
+OBJECT = "O"
+INTEGER = "q"
+REAL = "d"
+
+
+def fetch_columns(sqlite_cursor, dtypes=None, chunk_size=None, use_numpy=None):
+    """
+    Fetch the remaining rows of a cursor into per-column buffers
+
+    [parameters]
+    - sqlite_cursor: cursor on which a query has been executed
+    - dtypes: optional typecodes of the columns, either a sequence aligned
+        with the columns or a dict keyed by column name. A typecode is an
+        array.array typecode ('q', 'd', 'i', ...) or OBJECT ('O').
+        Missing typecodes are inferred from the first non-NULL values:
+        INTEGER ('q') for integers, REAL ('d') for numbers, otherwise OBJECT.
+        An inferred column is promoted if later values don't fit
+    - chunk_size: number of rows fetched at once
+    - use_numpy: boolean to convert buffers to NumPy arrays.
+        Defaults to True when NumPy is installed
+
+    [return]
+    Returns a Columns namedtuple(names, data, masks):
+        - names: tuple of column names
+        - data: tuple of buffers (array.array or list, or NumPy arrays)
+        - masks: tuple with, for each column, None if it doesn't contain
+            NULL values, otherwise a buffer of booleans (1 for NULL).
+            NULL values are stored as 0 in integer buffers, NaN in real ones
+    """
+    description = sqlite_cursor.description
+    if not description:
+        return Columns(tuple(), tuple(), tuple())
+    names = tuple([d[0] for d in description])
+    chunk_size = CHUNK_SIZE if chunk_size is None else chunk_size
+    use_numpy = (numpy is not None) if use_numpy is None else use_numpy
+    if use_numpy and numpy is None:
+        raise errors.NotSupportedError("NumPy isn't installed.")
+    builders = [_ColumnBuilder(name, typecode)
+                for name, typecode in zip(names, _get_typecodes(names, dtypes))]
+    rows = sqlite_cursor.fetchmany(chunk_size)
+    while rows:
+        for builder, values in zip(builders, zip(*rows)):
+            builder.extend(values)
+        rows = sqlite_cursor.fetchmany(chunk_size)
+    data, masks = list(), list()
+    for builder in builders:
+        column, mask = builder.build(use_numpy)
+        data.append(column)
+        masks.append(mask)
+    return Columns(names, tuple(data), tuple(masks))
+
+
+def _get_typecodes(names, dtypes):
+    if dtypes is None:
+        return [None] * len(names)
+    if isinstance(dtypes, dict):
+        return [dtypes.get(name) for name in names]
+    dtypes = list(dtypes)
+    if len(dtypes) != len(names):
+        msg = "Expected {} typecodes, got {}".format(len(names), len(dtypes))
+        raise errors.ProgrammingError(msg)
+    return dtypes
+
+
+def _infer_typecode(values):
+    typecode = None
+    for value in values:
+        if value is None:
+            continue
+        if isinstance(value, int):
+            typecode = typecode or INTEGER
+        elif isinstance(value, float):
+            typecode = REAL
+        else:
+            return OBJECT
+    return typecode
+
+
+class _ColumnBuilder:
+    def __init__(self, name, typecode):
+        self._name = name
+        self._is_inferred = typecode is None
+        self._typecode = typecode
+        self._buffer = None
+        self._mask = None
+        self._size = 0
+        if typecode is not None:
+            self._buffer = self._new_buffer(typecode)
+
+    def extend(self, values):
+        if self._is_inferred:
+            self._promote(_infer_typecode(values))
+        has_nulls = None in values
+        if has_nulls or self._mask is not None:
+            if self._mask is None:
+                self._mask = array.array("B", bytes(self._size))
+            self._mask.extend([value is None for value in values])
+        if self._typecode is not None:
+            items = values
+            if has_nulls:
+                null = self._null_value()
+                items = [null if value is None else value for value in values]
+            try:
+                self._buffer.extend(items)
+            except (TypeError, OverflowError) as e:
+                if not self._is_inferred:
+                    msg = "Column '{}' doesn't fit typecode '{}'"
+                    raise errors.DataError(msg.format(self._name,
+                                                      self._typecode)) from e
+                # integers too large for 64 bits
+                del self._buffer[self._size:]
+                self._promote(OBJECT)
+                self._buffer.extend(values)
+        self._size += len(values)
+
+    def build(self, use_numpy):
+        if self._typecode is None:
+            # NULL values only, or no rows at all
+            self._promote(OBJECT)
+        buffer, mask = self._buffer, self._mask
+        if use_numpy:
+            if self._typecode == OBJECT:
+                column = numpy.empty(len(buffer), dtype=object)
+                column[:] = buffer
+                buffer = column
+            else:
+                buffer = numpy.frombuffer(buffer, dtype=self._typecode)
+            if mask is not None:
+                mask = numpy.frombuffer(mask, dtype=bool)
+        return buffer, mask
+
+    def _promote(self, typecode):
+        if typecode is None or typecode == self._typecode:
+            return
+        if self._typecode == OBJECT or (self._typecode == REAL
+                                        and typecode == INTEGER):
+            return
+        if self._buffer is None:
+            # previous values were NULL
+            null = None if typecode == OBJECT else _NULL_VALUES[typecode]
+            self._buffer = self._new_buffer(typecode, [null] * self._size)
+        elif typecode == OBJECT:
+            values = self._buffer.tolist()
+            if self._mask is not None:
+                values = [None if is_null else value
+                          for value, is_null in zip(values, self._mask)]
+            self._buffer = values
+        else:
+            self._buffer = self._new_buffer(typecode, self._buffer)
+            if self._mask is not None:
+                null = _NULL_VALUES[typecode]
+                for i in range(self._size):
+                    if self._mask[i]:
+                        self._buffer[i] = null
+        self._typecode = typecode
+
+    def _null_value(self):
+        if self._typecode == OBJECT:
+            return None
+        return _NULL_VALUES.get(self._typecode, 0)
+
+    def _new_buffer(self, typecode, values=()):
+        if typecode == OBJECT:
+            return list(values)
+        return array.array(typecode, values)
+
+    def __repr__(self):
+        return "<_ColumnBuilder {} '{}'>".format(self._name, self._typecode)
+
+
+_NULL_VALUES = {INTEGER: 0, REAL: float("nan"), "f": float("nan")}
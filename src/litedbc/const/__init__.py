@@ -15,6 +15,9 @@ class TransactionMode(Enum):
     DEFERRED = "DEFERRED"
     IMMEDIATE = "IMMEDIATE"
     EXCLUSIVE = "EXCLUSIVE"
+    # IMMEDIATE for the call sites whose transactions are known to write,
+    # DEFERRED otherwise. See Transaction
+    AUTO = "AUTO"
 
 
 @unique
@@ -39,3 +42,40 @@ class JournalMode(Enum):
     MEMORY = "MEMORY"
     WAL = "WAL"
     OFF = "OFF"
+
+
+@unique
+class Profile(Enum):
+    """Sets of PRAGMA settings tuned for a kind of workload. The value of
+    a profile is a tuple of (pragma, value) pairs, applied in this order.
+    Note that page_size only applies to new databases (or after VACUUM)
+    and that busy_timeout replaces the 'timeout' of the connection"""
+    # concurrent short transactions: WAL, fsync at checkpoints only
+    OLTP = (("page_size", "4096"),
+            ("journal_mode", "WAL"),
+            ("synchronous", "NORMAL"),
+            ("cache_size", "-65536"),  # 64 MiB
+            ("mmap_size", "268435456"),  # 256 MiB
+            ("temp_store", "MEMORY"),
+            ("wal_autocheckpoint", "1000"),
+            ("journal_size_limit", "67108864"),  # 64 MiB
+            ("busy_timeout", "5000"))
+    # large imports on a database that can be recreated if the process dies
+    BULK_LOAD = (("journal_mode", "MEMORY"),
+                 ("synchronous", "OFF"),
+                 ("cache_size", "-262144"),  # 256 MiB
+                 ("temp_store", "MEMORY"))
+    # mostly readers: large cache and memory-mapped I/O
+    READ_MOSTLY = (("page_size", "8192"),
+                   ("journal_mode", "WAL"),
+                   ("synchronous", "NORMAL"),
+                   ("cache_size", "-131072"),  # 128 MiB
+                   ("mmap_size", "1073741824"),  # 1 GiB
+                   ("temp_store", "MEMORY"),
+                   ("wal_autocheckpoint", "4000"),
+                   ("busy_timeout", "5000"))
+    # constrained devices: small cache, no memory-mapped I/O
+    LOW_MEMORY = (("cache_size", "-1024"),  # 1 MiB
+                  ("mmap_size", "0"),
+                  ("temp_store", "FILE"),
+                  ("journal_size_limit", "1048576"))  # 1 MiB
@@ -1,16 +1,37 @@
+import time
 from litedbc.const import TransactionMode
-from litedbc import misc
+from litedbc import errors, misc, statement, columnar, metrics
 
 
 class Cursor:
     """When the cursor context is not nested, i.e., not created within a transaction,
-    it will `ROLLBACK` a pending transaction when you close it (the cursor)"""
-    def __init__(self, dbc, conn):
+    it will `ROLLBACK` a pending transaction when you close it (the cursor).
+
+    When a read pool is provided, SELECT and VALUES statements executed outside
+    a transaction run on a connection borrowed from the pool.
+    The connection is given back to the pool as soon as the rows are
+    exhausted, on the next execution, or when the cursor is closed
+    or garbage collected"""
+    def __init__(self, dbc, conn, pool=None):
         self._dbc = dbc
         self._conn = conn
+        self._pool = pool
         self._write_lock = dbc.write_lock
-        self._sqlite_cursor = self._conn.cursor()
+        self._writer_cursor = self._conn.cursor()
+        self._sqlite_cursor = self._writer_cursor
+        self._reader_conn = None
         self._is_nested = self._conn.in_transaction
+        self._metrics = dbc.metrics_registry
+        self._slow_log = dbc.slow_query_log
+        self._retry_policy = dbc.retry_policy
+        self._timed = self._metrics is not None or self._slow_log is not None
+        self._sql = None  # last executed statement, for the metrics
+        # True once a statement that might write ran, DDL included,
+        # see Transaction with TransactionMode.AUTO
+        self._has_written = False
+        # [sql, params, duration, rows] of the last statement
+        # until its rows are exhausted, for the slow query log
+        self._pending = None
 
     @property
     def dbc(self):
@@ -22,6 +43,7 @@ class Cursor:
 
     @arraysize.setter
     def arraysize(self, val):
+        self._writer_cursor.arraysize = val
         self._sqlite_cursor.arraysize = val
 
     @property
@@ -42,42 +64,44 @@ class Cursor:
 
     @row_factory.setter
     def row_factory(self, val):
+        self._writer_cursor.row_factory = val
         self._sqlite_cursor.row_factory = val
 
     def execute(self, sql, params=None, /):
         sql = sql.strip()
         params = tuple() if params is None else params
-        if misc.is_stmt("SELECT", sql):
-            self._sqlite_cursor.execute(sql, params)
-            return self
-        with self._write_lock:
-            self._sqlite_cursor.execute(sql, params)
-            return self
+        self._release_reader()
+        info = statement.get_stmt_info(sql)
+        self._check_write(info)
+        if (info.is_query and self._pool is not None
+                and not self._conn.in_transaction):
+            self._acquire_reader()
+        locked = not info.is_readonly
+        if self._retry_policy is None or self._conn.in_transaction:
+            return self._run(self._sqlite_cursor.execute, sql, params,
+                             locked=locked)
+        # outside of a transaction, the statement can be retried as a whole
+        return self._retry_policy.run(
+            lambda: self._run(self._sqlite_cursor.execute, sql, params,
+                              locked=locked))
 
     def executemany(self, sql, params=None, /):
         sql = sql.strip()
         params = tuple() if params is None else params
-        with self._write_lock:
-            self._sqlite_cursor.executemany(sql, params)
-            return self
+        self._release_reader()
+        self._check_write(statement.get_stmt_info(sql))
+        return self._run(self._sqlite_cursor.executemany, sql, params)
 
     def executescript(self, sql_script, /, transaction_mode=TransactionMode.DEFERRED):
-        with self._write_lock:
-            sql_script = sql_script.strip()
-            in_transaction = self._conn.in_transaction
-            transactional = False if transaction_mode is None else True
-            if transactional and not in_transaction:
-                start_transaction_stmt = misc.get_start_transaction_stmt(transaction_mode)
-                self._sqlite_cursor.execute(start_transaction_stmt)
-            self._sqlite_cursor.executescript(sql_script)
-            if transactional and not in_transaction:
-                self._sqlite_cursor.execute("COMMIT")
-            return self
+        self._release_reader()
+        self._has_written = True  # scripts are assumed to write
+        return self._run(self._executescript, sql_script, transaction_mode,
+                         sql=metrics.SCRIPT_SHAPE)
 
     def fetch(self, limit=None, buffer_size=None):
         limit = -1 if limit is None else limit
         buffer_size = self._sqlite_cursor.arraysize if buffer_size is None else buffer_size
-        rows = self._sqlite_cursor.fetchmany(buffer_size)
+        rows = self.fetchmany(buffer_size)
         i = 0
         while rows:
             for r in rows:
@@ -85,17 +109,59 @@ class Cursor:
                     return
                 yield r
                 i += 1
-            rows = self._sqlite_cursor.fetchmany(buffer_size)
+            rows = self.fetchmany(buffer_size)
+
+    def fetch_columns(self, dtypes=None, chunk_size=None, use_numpy=None):
+        """
+        Fetch the remaining rows into per-column buffers, array.array
+        instances or NumPy arrays, instead of a tuple per row.
+        See litedbc.columnar.fetch_columns
+
+        [return]
+        Returns a Columns namedtuple(names, data, masks)
+        """
+        start = time.perf_counter()
+        columns = columnar.fetch_columns(self._sqlite_cursor, dtypes=dtypes,
+                                         chunk_size=chunk_size,
+                                         use_numpy=use_numpy)
+        if self._timed:
+            rows = len(columns.data[0]) if columns.data else 0
+            self._record_fetch(rows, start, True)
+        self._release_reader_conn()
+        return columns
 
     def fetchone(self):
-        return self._sqlite_cursor.fetchone()
+        if not self._timed:
+            row = self._sqlite_cursor.fetchone()
+        else:
+            start = time.perf_counter()
+            row = self._sqlite_cursor.fetchone()
+            self._record_fetch(0 if row is None else 1, start, row is None)
+        if row is None:
+            self._release_reader_conn()
+        return row
 
     def fetchmany(self, size=None):
         size = self._sqlite_cursor.arraysize if size is None else size
-        return self._sqlite_cursor.fetchmany(size)
+        if not self._timed:
+            rows = self._sqlite_cursor.fetchmany(size)
+        else:
+            start = time.perf_counter()
+            rows = self._sqlite_cursor.fetchmany(size)
+            self._record_fetch(len(rows), start, len(rows) < size)
+        if len(rows) < size:
+            self._release_reader_conn()
+        return rows
 
     def fetchall(self):
-        return self._sqlite_cursor.fetchall()
+        if not self._timed:
+            rows = self._sqlite_cursor.fetchall()
+        else:
+            start = time.perf_counter()
+            rows = self._sqlite_cursor.fetchall()
+            self._record_fetch(len(rows), start, True)
+        self._release_reader_conn()
+        return rows
 
     def get_columns(self):
         columns = tuple()
@@ -112,10 +178,16 @@ class Cursor:
         pass
 
     def close(self):
-        with self._write_lock:
-            if not self._is_nested and self._conn.in_transaction:
-                self._sqlite_cursor.execute("ROLLBACK")
-            return self._sqlite_cursor.close()
+        if self._pending is not None:
+            self._log_pending()
+        self._release_reader()
+        if not self._is_nested and self._conn.in_transaction:
+            # checked again once the lock is held since the pending
+            # transaction might belong to another thread
+            with self._write_lock:
+                if self._conn.in_transaction:
+                    self._sqlite_cursor.execute("ROLLBACK")
+        return self._sqlite_cursor.close()
 
     def __enter__(self):
         return self
@@ -126,8 +198,122 @@ class Cursor:
     def __iter__(self):
         return self
 
+    def __del__(self):
+        # a statement whose rows weren't exhausted is logged
+        # when its cursor is garbage collected
+        if getattr(self, "_pending", None) is not None:
+            self._log_pending()
+        # the borrowed connection would otherwise never go back to the pool
+        if getattr(self, "_sqlite_cursor", None) is not None:
+            try:
+                self._release_reader()
+            except errors.Error:
+                pass  # the dbc and its pool are already closed
+
     def __next__(self):
-        r = self._sqlite_cursor.fetchone()
+        r = self.fetchone()
         if r is None:
             raise StopIteration
         return r
+
+    def _check_write(self, info):
+        if (not info.is_readonly
+                and info.keyword not in statement.TRANSACTION_KEYWORDS):
+            self._has_written = True
+
+    def _executescript(self, sql_script, transaction_mode):
+        sql_script = sql_script.strip()
+        in_transaction = self._conn.in_transaction
+        transactional = False if transaction_mode is None else True
+        if transactional and not in_transaction:
+            if transaction_mode is TransactionMode.AUTO:
+                transaction_mode = TransactionMode.IMMEDIATE  # scripts write
+            start_transaction_stmt = misc.get_start_transaction_stmt(transaction_mode)
+            self._sqlite_cursor.execute(start_transaction_stmt)
+        self._sqlite_cursor.executescript(sql_script)
+        if transactional and not in_transaction:
+            self._sqlite_cursor.execute("COMMIT")
+
+    def _run(self, func, arg1, arg2, locked=True, sql=None):
+        # call func(arg1, arg2), with the write lock held if 'locked' is True
+        sql = arg1 if sql is None else sql
+        self._sql = sql
+        if not self._timed:
+            if not locked:
+                func(arg1, arg2)
+                return self
+            with self._write_lock:
+                func(arg1, arg2)
+                return self
+        if self._pending is not None:
+            self._log_pending()
+        start = acquired = time.perf_counter()
+        lock_wait = None
+        error = True
+        try:
+            if locked:
+                with self._write_lock:
+                    acquired = time.perf_counter()
+                    lock_wait = acquired - start
+                    func(arg1, arg2)
+            else:
+                func(arg1, arg2)
+            error = False
+        finally:
+            duration = time.perf_counter() - acquired
+            rows = max(self._sqlite_cursor.rowcount, 0)
+            if self._metrics is not None:
+                self._metrics.record_execute(sql, duration, lock_wait,
+                                             rows, error)
+        if self._slow_log is not None and sql is not metrics.SCRIPT_SHAPE:
+            # parameters of executemany may be an iterator, already consumed
+            params = arg2 if func == self._sqlite_cursor.execute else None
+            self._pending = [sql, params, duration, rows]
+            if self._sqlite_cursor.description is None:
+                self._log_pending()
+        return self
+
+    def _record_fetch(self, rows, start, is_exhausted):
+        duration = time.perf_counter() - start
+        if self._metrics is not None and self._sql is not None:
+            self._metrics.record_fetch(self._sql, rows, duration)
+        pending = self._pending
+        if pending is not None:
+            pending[2] += duration
+            pending[3] += rows
+            if is_exhausted:
+                self._log_pending()
+
+    def _log_pending(self):
+        (sql, params, duration, rows), self._pending = self._pending, None
+        if duration >= self._slow_log.threshold:
+            self._slow_log.record(sql, params, duration, rows)
+
+    def _acquire_reader(self):
+        conn = self._pool.acquire()
+        if conn is None:
+            # pool exhausted, the writer connection will serve the query
+            return
+        sqlite_cursor = conn.cursor()
+        sqlite_cursor.arraysize = self._writer_cursor.arraysize
+        sqlite_cursor.row_factory = self._writer_cursor.row_factory
+        self._reader_conn = conn
+        self._sqlite_cursor = sqlite_cursor
+
+    def _release_reader(self):
+        if self._sqlite_cursor is self._writer_cursor:
+            return
+        try:
+            self._sqlite_cursor.close()
+        finally:
+            self._sqlite_cursor = self._writer_cursor
+            self._release_reader_conn()
+
+    def _release_reader_conn(self):
+        # give back the borrowed connection once the rows are exhausted.
+        # The exhausted cursor is kept until the next execution
+        # for its description and rowcount
+        if self._reader_conn is None:
+            return
+        conn, self._reader_conn = self._reader_conn, None
+        self._pool.release(conn)
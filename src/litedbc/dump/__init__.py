@@ -0,0 +1,289 @@
+"""SQL dumps, optionally parallel and compressed"""
+import os
+import io
+import contextlib
+import gzip
+import lzma
+import queue
+import shutil
+import tempfile
+import sqlite3 as sqlite
+from concurrent.futures import ThreadPoolExecutor
+from litedbc import errors, misc, statement
+from litedbc.const import Profile
+
+
+COMPRESSIONS = ("gzip", "lzma", "zstd")
+# filename extensions used to guess the compression
+EXTENSIONS = {".gz": "gzip", ".xz": "lzma", ".lzma": "lzma", ".zst": "zstd"}
+# size of the chunks copied from table segments to the destination
+COPY_SIZE = 1024 * 1024
+# number of statements between two calls of the progress callback
+PROGRESS_EVERY = 10000
+
+
+def dump(conns, dst=None, compression=None):
+    """
+    Dump a database in the format of sqlite3.Connection.iterdump().
+    Each connection should already be in a read transaction
+    on the same snapshot of the database
+
+    [parameters]
+    - conns: sequence of connections. With a single connection, the output
+        of its iterdump() method is written. With more connections, tables
+        are dumped in parallel, one thread per connection, into temporary
+        segments that are then concatenated in order
+    - dst: filename or file object. Leave it to None to get a string
+    - compression: one of "gzip", "lzma" and "zstd". By default, it is
+        guessed from the extension of the filename (.gz, .xz, .zst)
+
+    [return]
+    Returns a string of SQL code if dst isn't set
+    """
+    if dst is None:
+        file = io.StringIO()
+        _write(conns, file)
+        return file.getvalue()[:-1]
+    with open_file(dst, "w", compression) as file:
+        _write(conns, file)
+
+
+def restore(conn, src, compression=None, *, bulk_load=True,
+            defer_indexes=True, progress=None, progress_every=None):
+    """
+    Execute a SQL dump statement by statement, without loading
+    the whole script in memory
+
+    [parameters]
+    - conn: connection in autocommit mode
+    - src: filename or file object
+    - compression: one of "gzip", "lzma" and "zstd". By default, it is
+        guessed from the extension of the filename (.gz, .xz, .zst)
+    - bulk_load: boolean, True to apply Profile.BULK_LOAD during the
+        restore. The original settings are restored afterwards
+    - defer_indexes: boolean, True to create indexes right before
+        the end of the transaction (or of the dump) that defines them,
+        once the tables are filled
+    - progress: callback called every 'progress_every' statements and
+        at the end, with two arguments: the number of executed statements
+        and the number of characters read so far
+    - progress_every: number of statements between two calls of 'progress',
+        defaults to PROGRESS_EVERY
+
+    [return]
+    Returns the number of executed statements
+    """
+    if progress_every is None:
+        progress_every = PROGRESS_EVERY
+    settings = None
+    if bulk_load:
+        settings = misc.apply_pragmas(conn, Profile.BULK_LOAD.value)
+    n = size = reported = 0
+    indexes = list()
+    try:
+        with open_file(src, "r", compression) as file:
+            for sql in iter_statements(file):
+                size += len(sql)
+                if defer_indexes:
+                    keyword = statement.get_stmt_info(sql).keyword
+                    if keyword == "CREATE" and _is_create_index(sql):
+                        indexes.append(sql)
+                        continue
+                    if keyword in ("COMMIT", "END") and indexes:
+                        n += _execute_all(conn, indexes)
+                        indexes = list()
+                conn.execute(sql)
+                n += 1
+                if progress is not None and n - reported >= progress_every:
+                    progress(n, size)
+                    reported = n
+            n += _execute_all(conn, indexes)
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        if settings:
+            misc.restore_pragmas(conn, settings)
+    if progress is not None and n != reported:
+        progress(n, size)
+    return n
+
+
+def iter_statements(file):
+    """Generator that yields the complete SQL statements
+    found in a text file object"""
+    lines = list()
+    for line in file:
+        lines.append(line)
+        # a statement can only be complete on a line with a semicolon,
+        # so that long statements aren't joined again on each line
+        if ";" not in line:
+            continue
+        sql = "".join(lines) if len(lines) > 1 else line
+        if sqlite.complete_statement(sql):
+            yield sql
+            lines = list()
+    if "".join(lines).strip():
+        raise errors.ProgrammingError("Incomplete SQL statement at the end "
+                                      "of the dump.")
+
+
+@contextlib.contextmanager
+def open_file(file, mode, compression=None):
+    """
+    Context manager to open a file in text mode, UTF-8 encoded,
+    with transparent compression
+
+    [parameters]
+    - file: filename or file object. A file object is used as is unless
+        compression is set, in which case it must be a binary file object.
+        File objects aren't closed
+    - mode: "r" or "w"
+    - compression: one of None, "gzip", "lzma" and "zstd".
+        It is guessed from the extension of the filename if None
+    """
+    is_fileobj = hasattr(file, "read") or hasattr(file, "write")
+    if compression is None and not is_fileobj:
+        extension = os.path.splitext(os.fspath(file))[1].lower()
+        compression = EXTENSIONS.get(extension)
+    if compression is None:
+        if is_fileobj:
+            yield file
+            return
+        with open(os.fspath(file), mode, encoding="utf-8") as f:
+            yield f
+        return
+    opener = _get_opener(compression)
+    with opener(file, mode + "t", encoding="utf-8") as f:
+        yield f
+
+
+def _is_create_index(sql):
+    words = [text.upper() for kind, text in statement.tokenize(sql)
+             if kind == "word"][1:3]
+    return words[:1] == ["INDEX"] or words == ["UNIQUE", "INDEX"]
+
+
+def _execute_all(conn, statements):
+    for sql in statements:
+        conn.execute(sql)
+    return len(statements)
+
+
+def _get_opener(compression):
+    if compression == "gzip":
+        return gzip.open
+    if compression == "lzma":
+        return lzma.open
+    if compression == "zstd":
+        try:
+            from compression import zstd  # Python >= 3.14
+            return zstd.open
+        except ImportError:
+            pass
+        try:
+            import zstandard
+            return zstandard.open
+        except ImportError:
+            raise errors.Error("The zstd compression requires Python 3.14 "
+                               "or the 'zstandard' package.") from None
+    msg = "Unknown compression '{}'. Expected one of: {}"
+    raise errors.Error(msg.format(compression, ", ".join(COMPRESSIONS)))
+
+
+def _write(conns, file):
+    if len(conns) == 1:
+        for line in conns[0].iterdump():
+            file.write(line + "\n")
+        return
+    conn_queue = queue.SimpleQueue()
+    for conn in conns:
+        conn_queue.put(conn)
+    items = _get_plan(conns[0])
+    with ThreadPoolExecutor(max_workers=len(conns)) as executor:
+        futures = [executor.submit(_dump_table, conn_queue, item[1])
+                   if isinstance(item, tuple) else item for item in items]
+        try:
+            for future in futures:
+                if isinstance(future, str):
+                    file.write(future + "\n")
+                    continue
+                with future.result() as segment:
+                    segment.seek(0)
+                    shutil.copyfileobj(segment, file, COPY_SIZE)
+        except BaseException:
+            for future in futures:
+                if not isinstance(future, str):
+                    future.cancel()
+            raise
+
+
+def _get_plan(conn):
+    # Returns the lines of sqlite3.Connection.iterdump() in order, with
+    # ("table", name) tuples in place of the INSERT statements of each table
+    cur = conn.cursor()
+    cur.row_factory = None
+    plan = ["BEGIN TRANSACTION;"]
+    writable_schema = False
+    sqlite_sequence = list()
+    query = ('SELECT "name", "type", "sql" FROM "sqlite_master" '
+             'WHERE "sql" NOT NULL AND "type" == \'table\' ORDER BY "name"')
+    for name, _, sql in cur.execute(query).fetchall():
+        if name == "sqlite_sequence":
+            rows = cur.execute('SELECT * FROM "sqlite_sequence";').fetchall()
+            sqlite_sequence = ['DELETE FROM "sqlite_sequence";']
+            sqlite_sequence.extend(["INSERT INTO \"sqlite_sequence\" "
+                                    "VALUES('{}',{});".format(*row)
+                                    for row in rows])
+            continue
+        elif name == "sqlite_stat1":
+            plan.append('ANALYZE "sqlite_master";')
+        elif name.startswith("sqlite_"):
+            continue
+        elif sql.startswith("CREATE VIRTUAL TABLE"):
+            if not writable_schema:
+                writable_schema = True
+                plan.append("PRAGMA writable_schema=ON;")
+            plan.append("INSERT INTO sqlite_master(type,name,tbl_name,"
+                        "rootpage,sql)VALUES('table','{0}','{0}',0,'{1}');"
+                        .format(name.replace("'", "''"),
+                                sql.replace("'", "''")))
+        else:
+            plan.append("{};".format(sql))
+        plan.append(("table", name))
+    query = ('SELECT "name", "type", "sql" FROM "sqlite_master" '
+             'WHERE "sql" NOT NULL AND "type" IN (\'index\', \'trigger\', \'view\')')
+    for _, _, sql in cur.execute(query).fetchall():
+        plan.append("{};".format(sql))
+    if writable_schema:
+        plan.append("PRAGMA writable_schema=OFF;")
+    plan.extend(sqlite_sequence)
+    plan.append("COMMIT;")
+    return plan
+
+
+def _dump_table(conn_queue, name):
+    # write the INSERT statements of a table into a temporary segment
+    conn = conn_queue.get()
+    try:
+        cur = conn.cursor()
+        cur.row_factory = None
+        ident = name.replace('"', '""')
+        cur.execute('PRAGMA table_info("{}")'.format(ident))
+        columns = ",".join(["'||quote(\"{}\")||'".format(str(row[1]).replace('"', '""'))
+                            for row in cur.fetchall()])
+        cur.execute("SELECT 'INSERT INTO \"{0}\" VALUES({1})' FROM \"{0}\";"
+                    .format(ident, columns))
+        segment = tempfile.TemporaryFile("w+", encoding="utf-8", newline="")
+        try:
+            rows = cur.fetchmany(1000)
+            while rows:
+                segment.writelines([row[0] + ";\n" for row in rows])
+                rows = cur.fetchmany(1000)
+        except BaseException:
+            segment.close()
+            raise
+        return segment
+    finally:
+        conn_queue.put(conn)
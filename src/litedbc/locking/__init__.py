@@ -0,0 +1,189 @@
+"""Instrumented write lock, to diagnose contention"""
+import sys
+import time
+import logging
+import threading
+import traceback
+from collections import namedtuple
+from litedbc import misc
+
+
+LockHolder = namedtuple("LockHolder", ["thread_name", "thread_id",
+                                       "site", "held_for", "stack"])
+LockSiteStats = namedtuple("LockSiteStats", ["site", "acquisitions",
+                                             "total_hold", "max_hold",
+                                             "total_wait", "max_wait"])
+
+# maximum number of frames of the stacks reported by the watchdog
+STACK_LIMIT = 32
+
+logger = logging.getLogger("litedbc")
+
+
+class InstrumentedRLock:
+    """Reentrant lock with the interface of threading.RLock that records,
+    per call site, the time spent waiting for the lock and the time
+    it is held. The call site of an acquisition is the first frame
+    outside of the litedbc package.
+
+    An optional watchdog thread reports holders that keep the lock
+    longer than a threshold, with their current stack"""
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._stats_lock = threading.Lock()
+        self._owner = None
+        self._count = 0
+        self._since = None
+        self._site = None
+        self._reported = False
+        self._sites = dict()
+        self._watchdog = None
+        self._watchdog_stop = None
+
+    @property
+    def holder(self):
+        """LockHolder namedtuple(thread_name, thread_id, site, held_for, stack)
+        describing the thread holding the lock, or None.
+        The stack is the current stack of the holder"""
+        return self._get_holder()
+
+    def acquire(self, blocking=True, timeout=-1):
+        me = threading.get_ident()
+        if self._owner == me:
+            self._lock.acquire()
+            self._count += 1
+            return True
+        start = time.perf_counter()
+        if not self._lock.acquire(blocking, timeout):
+            return False
+        acquired = time.perf_counter()
+        site = misc.get_call_site()
+        self._owner, self._count = me, 1
+        self._since, self._site, self._reported = acquired, site, False
+        with self._stats_lock:
+            stats = self._get_stats(site)
+            wait = acquired - start
+            stats[0] += 1
+            stats[3] += wait
+            stats[4] = max(stats[4], wait)
+        return True
+
+    def release(self):
+        if self._owner != threading.get_ident():
+            raise RuntimeError("cannot release un-acquired lock")
+        self._count -= 1
+        if self._count:
+            self._lock.release()
+            return
+        held = time.perf_counter() - self._since
+        site = self._site
+        self._owner = self._since = self._site = None
+        self._lock.release()
+        with self._stats_lock:
+            stats = self._get_stats(site)
+            stats[1] += held
+            stats[2] = max(stats[2], held)
+
+    def report(self, top=10):
+        """Returns a tuple of LockSiteStats namedtuples(site, acquisitions,
+        total_hold, max_hold, total_wait, max_wait), the 'top' call sites
+        by total hold time. Times are in seconds"""
+        with self._stats_lock:
+            items = [LockSiteStats(site, *stats)
+                     for site, stats in self._sites.items()]
+        items.sort(key=lambda item: item.total_hold, reverse=True)
+        return tuple(items[:top])
+
+    def format_report(self, top=10):
+        """Returns the report as a text table"""
+        lines = ["{:>10} {:>12} {:>10} {:>12} {:>10}  {}".format(
+            "acquired", "total_hold", "max_hold", "total_wait",
+            "max_wait", "site")]
+        for item in self.report(top):
+            lines.append("{:>10} {:>12.6f} {:>10.6f} {:>12.6f} {:>10.6f}  {}"
+                         .format(item.acquisitions, item.total_hold,
+                                 item.max_hold, item.total_wait,
+                                 item.max_wait, item.site))
+        return "\n".join(lines)
+
+    def reset(self):
+        with self._stats_lock:
+            self._sites = dict()
+
+    def start_watchdog(self, threshold=1.0, callback=None, interval=None):
+        """
+        Start a thread that reports a holder once it has held the lock
+        for more than 'threshold' seconds. Each holding is reported once
+
+        [parameters]
+        - threshold: time in seconds
+        - callback: function called with a LockHolder instance.
+            By default, a warning is logged with the 'litedbc' logger
+        - interval: time in seconds between two checks,
+            defaults to a quarter of the threshold
+        """
+        self.stop_watchdog()
+        interval = threshold / 4 if interval is None else interval
+        callback = _log_long_hold if callback is None else callback
+        stop = threading.Event()
+        thread = threading.Thread(target=self._watch,
+                                  args=(stop, threshold, callback, interval),
+                                  name="litedbc-lock-watchdog", daemon=True)
+        self._watchdog, self._watchdog_stop = thread, stop
+        thread.start()
+
+    def stop_watchdog(self):
+        thread, stop = self._watchdog, self._watchdog_stop
+        self._watchdog = self._watchdog_stop = None
+        if thread is not None:
+            stop.set()
+            if thread is not threading.current_thread():
+                thread.join()
+
+    def _watch(self, stop, threshold, callback, interval):
+        while not stop.wait(interval):
+            since = self._since
+            if since is None or self._reported:
+                continue
+            if time.perf_counter() - since < threshold:
+                continue
+            holder = self._get_holder()
+            if holder is None or self._since != since:
+                continue
+            self._reported = True
+            try:
+                callback(holder)
+            except Exception:
+                logger.exception("Lock watchdog callback failed")
+
+    def _get_holder(self):
+        owner, since, site = self._owner, self._since, self._site
+        if owner is None or since is None:
+            return None
+        frame = sys._current_frames().get(owner)
+        stack = None
+        if frame is not None:
+            stack = traceback.extract_stack(frame, limit=STACK_LIMIT)
+        thread = threading._active.get(owner)
+        name = thread.name if thread is not None else str(owner)
+        return LockHolder(name, owner, site, time.perf_counter() - since,
+                          stack)
+
+    def _get_stats(self, site):
+        stats = self._sites.get(site)
+        if stats is None:
+            stats = self._sites[site] = [0, 0.0, 0.0, 0.0, 0.0]
+        return stats
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+
+def _log_long_hold(holder):
+    stack = "".join(holder.stack.format()) if holder.stack else ""
+    logger.warning("Thread %s holds the write lock for %.3fs "
+                   "(acquired at %s)\n%s", holder.thread_name,
+                   holder.held_for, holder.site, stack)
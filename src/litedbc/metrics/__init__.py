@@ -0,0 +1,304 @@
+"""Opt-in metrics of statements, write lock waits and transactions"""
+import os
+import time
+import bisect
+import logging
+import threading
+from collections import namedtuple
+from litedbc import statement
+
+
+# upper bounds in seconds of the buckets of the latency histograms
+BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+# maximum number of distinct statement shapes, the others are aggregated
+MAX_STATEMENTS = 1000
+# shape under which statements beyond MAX_STATEMENTS are aggregated
+OTHER_SHAPE = "<other>"
+# shape of the scripts run with executescript
+SCRIPT_SHAPE = "<script>"
+
+Histogram = namedtuple("Histogram", ["buckets", "counts", "count",
+                                     "sum", "max"])
+StatementMetrics = namedtuple("StatementMetrics", ["shape", "count", "errors",
+                                                   "rows", "total_time",
+                                                   "execute_time", "fetch_time",
+                                                   "lock_wait", "latency"])
+MetricsSnapshot = namedtuple("MetricsSnapshot", ["statements", "lock_wait",
+                                                 "transactions", "rollbacks",
+                                                 "uptime"])
+
+
+class Metrics:
+    """Thread-safe registry of metrics. Statements are grouped by shape,
+    that is, normalized with their literals replaced by '?'
+    (see litedbc.statement.get_shape)"""
+    def __init__(self, max_statements=MAX_STATEMENTS, buckets=BUCKETS):
+        """
+        Init
+
+        [parameters]
+        - max_statements: maximum number of distinct shapes. Statements
+            of other shapes are aggregated under OTHER_SHAPE
+        - buckets: sorted upper bounds in seconds of the histogram buckets
+        """
+        self._max_statements = max_statements
+        self._buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._start = time.monotonic()
+        self._statements = dict()
+        self._lock_wait = _Histogram(self._buckets)
+        self._transactions = _Histogram(self._buckets)
+        self._rollbacks = 0
+
+    @property
+    def max_statements(self):
+        return self._max_statements
+
+    @property
+    def buckets(self):
+        return self._buckets
+
+    def record_execute(self, sql, duration, lock_wait=None, rows=0,
+                       error=False):
+        """
+        Record the execution of a statement
+
+        [parameters]
+        - sql: SQL statement, or SCRIPT_SHAPE for scripts
+        - duration: execution time in seconds, lock wait excluded
+        - lock_wait: time in seconds spent waiting for the write lock,
+            None if the lock wasn't needed
+        - rows: number of rows modified
+        - error: boolean, True if the execution failed
+        """
+        shape = self._get_shape(sql)
+        with self._lock:
+            stats = self._get_stats(shape)
+            stats.count += 1
+            stats.errors += 1 if error else 0
+            stats.rows += rows
+            stats.execute_time += duration
+            stats.latency.add(duration)
+            if lock_wait is not None:
+                stats.lock_wait += lock_wait
+                self._lock_wait.add(lock_wait)
+
+    def record_fetch(self, sql, rows, duration):
+        """Record rows fetched from the result of a statement"""
+        shape = self._get_shape(sql)
+        with self._lock:
+            stats = self._get_stats(shape)
+            stats.rows += rows
+            stats.fetch_time += duration
+
+    def record_lock_wait(self, duration):
+        """Record time spent waiting for the write lock
+        outside of a statement, e.g. when a transaction starts"""
+        with self._lock:
+            self._lock_wait.add(duration)
+
+    def record_transaction(self, duration, committed=True):
+        """Record the duration of a transaction, from the acquisition
+        of the write lock to the commit or the rollback"""
+        with self._lock:
+            self._transactions.add(duration)
+            if not committed:
+                self._rollbacks += 1
+
+    def snapshot(self):
+        """
+        Returns a MetricsSnapshot namedtuple:
+            - statements: tuple of StatementMetrics, sorted by total time
+                (execute_time + fetch_time) in descending order
+            - lock_wait: Histogram of the write lock waits
+            - transactions: Histogram of the transaction durations
+            - rollbacks: number of transactions rolled back
+            - uptime: time in seconds since the creation or the reset
+                of the registry
+
+        A Histogram is a namedtuple(buckets, counts, count, sum, max)
+        where counts[i] is the number of values <= buckets[i] and
+        greater than buckets[i-1]. The last count is for the overflow
+        """
+        with self._lock:
+            statements = [stats.freeze() for stats in self._statements.values()]
+            statements.sort(key=lambda item: item.total_time, reverse=True)
+            return MetricsSnapshot(tuple(statements), self._lock_wait.freeze(),
+                                   self._transactions.freeze(), self._rollbacks,
+                                   time.monotonic() - self._start)
+
+    def reset(self):
+        with self._lock:
+            self._start = time.monotonic()
+            self._statements = dict()
+            self._lock_wait = _Histogram(self._buckets)
+            self._transactions = _Histogram(self._buckets)
+            self._rollbacks = 0
+
+    def _get_shape(self, sql):
+        if sql == SCRIPT_SHAPE:
+            return sql
+        return statement.get_shape(sql)
+
+    def _get_stats(self, shape):
+        stats = self._statements.get(shape)
+        if stats is None:
+            if len(self._statements) >= self._max_statements:
+                shape = OTHER_SHAPE
+                stats = self._statements.get(shape)
+            if stats is None:
+                stats = _StatementStats(shape, self._buckets)
+                self._statements[shape] = stats
+        return stats
+
+
+class LoggingExporter:
+    """Log a summary of a MetricsSnapshot: the top statements
+    by total time, the write lock waits and the transactions"""
+    def __init__(self, logger=None, level=logging.INFO, top=10):
+        """
+        Init
+
+        [parameters]
+        - logger: logging.Logger instance, defaults to the 'litedbc' logger
+        - level: logging level
+        - top: number of statements to log
+        """
+        self._logger = logging.getLogger("litedbc") if logger is None else logger
+        self._level = level
+        self._top = top
+
+    def export(self, snapshot):
+        log = self._logger.log
+        for item in snapshot.statements[:self._top]:
+            log(self._level, "statement count=%d errors=%d rows=%d "
+                "total=%.6fs lock_wait=%.6fs max=%.6fs sql=%s", item.count,
+                item.errors, item.rows, item.total_time, item.lock_wait,
+                item.latency.max, item.shape)
+        log(self._level, "write lock waits=%d total=%.6fs max=%.6fs",
+            snapshot.lock_wait.count, snapshot.lock_wait.sum,
+            snapshot.lock_wait.max)
+        log(self._level, "transactions count=%d rollbacks=%d "
+            "total=%.6fs max=%.6fs", snapshot.transactions.count,
+            snapshot.rollbacks, snapshot.transactions.sum,
+            snapshot.transactions.max)
+
+
+class PrometheusExporter:
+    """Write a MetricsSnapshot to a file in the Prometheus text format,
+    e.g. for the textfile collector of the node exporter.
+    The file is replaced atomically"""
+    def __init__(self, filename, prefix="litedbc"):
+        """
+        Init
+
+        [parameters]
+        - filename: destination filename
+        - prefix: prefix of the names of the metrics
+        """
+        self._filename = os.fspath(filename)
+        self._prefix = prefix
+
+    @property
+    def filename(self):
+        return self._filename
+
+    def export(self, snapshot):
+        tmp_filename = self._filename + ".tmp"
+        with open(tmp_filename, "w", encoding="utf-8") as file:
+            file.write(format_prometheus(snapshot, self._prefix))
+        os.replace(tmp_filename, self._filename)
+
+
+def format_prometheus(snapshot, prefix="litedbc"):
+    """Returns a MetricsSnapshot in the Prometheus text format"""
+    lines = list()
+    name = prefix + "_statement_duration_seconds"
+    lines.append("# HELP {} Execution time of the statements.".format(name))
+    lines.append("# TYPE {} histogram".format(name))
+    for item in snapshot.statements:
+        labels = 'statement="{}"'.format(_escape(item.shape))
+        lines.extend(_format_histogram(name, item.latency, labels))
+    for suffix, field, text in (("rows_total", "rows", "Rows modified or fetched."),
+                                ("errors_total", "errors", "Failed executions."),
+                                ("fetch_seconds_total", "fetch_time",
+                                 "Time spent fetching rows."),
+                                ("lock_wait_seconds_total", "lock_wait",
+                                 "Time spent waiting for the write lock.")):
+        metric = "{}_statement_{}".format(prefix, suffix)
+        lines.append("# HELP {} {}".format(metric, text))
+        lines.append("# TYPE {} counter".format(metric))
+        for item in snapshot.statements:
+            lines.append('{}{{statement="{}"}} {}'.format(
+                metric, _escape(item.shape), getattr(item, field)))
+    for suffix, histogram, text in (("lock_wait_seconds", snapshot.lock_wait,
+                                     "Time spent waiting for the write lock."),
+                                    ("transaction_duration_seconds",
+                                     snapshot.transactions,
+                                     "Duration of the transactions.")):
+        metric = "{}_{}".format(prefix, suffix)
+        lines.append("# HELP {} {}".format(metric, text))
+        lines.append("# TYPE {} histogram".format(metric))
+        lines.extend(_format_histogram(metric, histogram))
+    metric = prefix + "_transaction_rollbacks_total"
+    lines.append("# HELP {} Transactions rolled back.".format(metric))
+    lines.append("# TYPE {} counter".format(metric))
+    lines.append("{} {}".format(metric, snapshot.rollbacks))
+    return "\n".join(lines) + "\n"
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def freeze(self):
+        return Histogram(self.buckets, tuple(self.counts), self.count,
+                         self.sum, self.max)
+
+
+class _StatementStats:
+    def __init__(self, shape, buckets):
+        self.shape = shape
+        self.count = 0
+        self.errors = 0
+        self.rows = 0
+        self.execute_time = 0.0
+        self.fetch_time = 0.0
+        self.lock_wait = 0.0
+        self.latency = _Histogram(buckets)
+
+    def freeze(self):
+        return StatementMetrics(self.shape, self.count, self.errors, self.rows,
+                                self.execute_time + self.fetch_time,
+                                self.execute_time, self.fetch_time,
+                                self.lock_wait, self.latency.freeze())
+
+
+def _format_histogram(name, histogram, labels=""):
+    sep = "," if labels else ""
+    cumulative = 0
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        cumulative += count
+        yield '{}_bucket{{{}{}le="{}"}} {}'.format(name, labels, sep,
+                                                  bound, cumulative)
+    yield '{}_bucket{{{}{}le="+Inf"}} {}'.format(name, labels, sep,
+                                                histogram.count)
+    labels = "{{{}}}".format(labels) if labels else ""
+    yield "{}_sum{} {}".format(name, labels, histogram.sum)
+    yield "{}_count{} {}".format(name, labels, histogram.count)
+
+
+def _escape(value):
+    return (value.replace("\\", "\\\\").replace("\n", "\\n")
+            .replace('"', '\\"'))
@@ -1,8 +1,16 @@
 import os
+import sys
 import pathlib
+from concurrent.futures import ThreadPoolExecutor
 from litedbc import const, errors
 
 
+# pragmas that change the database file rather than the connection
+PERSISTENT_PRAGMAS = frozenset(("journal_mode", "page_size"))
+# frames from this directory are skipped to find a call site
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
 def is_stmt(name, sql):
     sql = sql.lstrip()
     if len(sql) < len(name):
@@ -13,6 +21,37 @@ def is_stmt(name, sql):
 def match(alpha_dbc, beta_dbc):
     """Match two database via their connectors.
     All tables defined in alpha_dbc should be in beta_dbc that might have additional tables."""
+    if alpha_dbc.schema_fingerprint() == beta_dbc.schema_fingerprint():
+        return True
+    return _match_tables(alpha_dbc, beta_dbc)
+
+
+def match_many(reference, dbcs, workers=None):
+    """
+    Match many databases against a reference database.
+    Fingerprints are compared first, tables are only compared
+    one by one when the fingerprints differ
+
+    [parameters]
+    - reference: connector of the reference database
+    - dbcs: sequence of connectors
+    - workers: number of threads, None to let ThreadPoolExecutor decide
+
+    [return]
+    Returns a tuple of booleans, in the order of 'dbcs'
+    """
+    fingerprint = reference.schema_fingerprint()
+
+    def check(dbc):
+        if dbc.schema_fingerprint() == fingerprint:
+            return True
+        return _match_tables(reference, dbc)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return tuple(executor.map(check, dbcs))
+
+
+def _match_tables(alpha_dbc, beta_dbc):
     for ref_table in alpha_dbc.list_tables():
         alpha_cols = alpha_dbc.inspect(ref_table)
         try:
@@ -50,8 +89,85 @@ def get_start_transaction_stmt(isolation_level):
     return "BEGIN {}".format(isolation_level)
 
 
+def get_call_site():
+    """Returns the location "filename:lineno in function" of the first
+    frame of the call stack that is outside of the litedbc package"""
+    prefix = PACKAGE_DIR + os.sep  # not a sibling such as litedbc_ext
+    frame = sys._getframe(1)
+    while frame is not None and frame.f_code.co_filename.startswith(prefix):
+        frame = frame.f_back
+    if frame is None:
+        return "<litedbc>"
+    code = frame.f_code
+    return "{}:{} in {}".format(code.co_filename, frame.f_lineno, code.co_name)
+
+
 def get_readonly_value(filename, is_readonly):
     if (filename.startswith("file:") and
             ("?mode=ro" in filename or "&mode=ro" in filename)):
         return True
     return is_readonly
+
+
+def get_profile_pragmas(profile):
+    """Returns the (pragma, value) pairs of a litedbc.const.Profile,
+    of the name of a profile, or of a dict {pragma: value}"""
+    if isinstance(profile, dict):
+        return tuple(profile.items())
+    if isinstance(profile, str):
+        try:
+            profile = const.Profile[profile.upper()]
+        except KeyError:
+            msg = "Invalid profile '{}'".format(profile)
+            raise errors.Error(msg) from None
+    return const.Profile(profile).value
+
+
+def apply_pragmas(conn, pragmas, persistent=True):
+    """
+    Set pragmas on a connection
+
+    [parameters]
+    - conn: sqlite connection
+    - pragmas: sequence of (pragma, value) pairs
+    - persistent: set it to False to skip PERSISTENT_PRAGMAS,
+        e.g. for secondary or read-only connections
+
+    [return]
+    Returns the (pragma, previous value) pairs of the pragmas that were set,
+    to be passed to restore_pragmas. Leaving the WAL journal mode
+    is skipped since it requires the other connections to be closed
+    """
+    previous = list()
+    for name, value in pragmas:
+        if not persistent and name in PERSISTENT_PRAGMAS:
+            continue
+        row = conn.execute("PRAGMA {}".format(name)).fetchone()
+        if row is None:
+            continue  # e.g. mmap_size without memory-mapped I/O support
+        current = row[0]
+        if str(current).upper() == str(value).upper():
+            continue
+        if name == "journal_mode" and current.upper() == "WAL":
+            continue
+        conn.execute("PRAGMA {}={}".format(name, value)).fetchall()
+        previous.append((name, current))
+    return tuple(previous)
+
+
+def restore_pragmas(conn, previous):
+    """
+    Set back the values returned by apply_pragmas, in reverse order.
+    Unlike apply_pragmas, the journal mode is restored even if it
+    means leaving the WAL journal mode
+
+    [parameters]
+    - conn: sqlite connection
+    - previous: sequence of (pragma, value) pairs returned by apply_pragmas
+    """
+    for name, value in reversed(previous):
+        rows = conn.execute("PRAGMA {}={}".format(name, value)).fetchall()
+        if name == "journal_mode" and rows[0][0].upper() != str(value).upper():
+            # SQLite leaves the journal mode unchanged when it can't switch
+            msg = "Cannot restore the journal mode '{}'".format(value)
+            raise errors.OperationalError(msg)
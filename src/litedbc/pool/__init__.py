@@ -0,0 +1,85 @@
+import queue
+import threading
+
+
+class ConnectionPool:
+    """Bounded pool of read-only connections.
+    Connections are created lazily by the factory, up to 'size' connections"""
+    def __init__(self, factory, size):
+        """
+        Init
+
+        [parameters]
+        - factory: callable that returns a new sqlite connection
+        - size: maximum number of connections held by the pool
+        """
+        self._factory = factory
+        self._size = size
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._conns = list()
+        self._is_closed = False
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def idle_count(self):
+        """Number of connections created and not borrowed"""
+        return self._idle.qsize()
+
+    @property
+    def is_closed(self):
+        with self._lock:
+            return self._is_closed
+
+    def acquire(self):
+        """
+        Returns an idle connection, creating it if needed.
+        Returns None when the pool is exhausted or closed, so that
+        the caller can fall back to another connection instead of waiting
+        """
+        with self._lock:
+            if self._is_closed:
+                return None
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._is_closed or len(self._conns) >= self._size:
+                return None
+            conn = self._factory()
+            self._conns.append(conn)
+            return conn
+
+    def release(self, conn):
+        """Give back a connection previously acquired"""
+        with self._lock:
+            if self._is_closed:
+                return
+            self._idle.put(conn)
+
+    def apply(self, func):
+        """Call func(conn) for each connection created so far"""
+        with self._lock:
+            conns = tuple(self._conns)
+        for conn in conns:
+            func(conn)
+
+    def close(self):
+        """
+        Closes the connections of the pool
+
+        [return]
+        Returns a boolean
+        """
+        with self._lock:
+            if self._is_closed:
+                return False
+            self._is_closed = True
+            conns, self._conns = self._conns, list()
+        for conn in conns:
+            conn.close()
+        return True
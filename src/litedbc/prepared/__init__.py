@@ -0,0 +1,110 @@
+from litedbc import statement
+
+
+class PreparedStatement:
+    """Reusable statement for hot loops. The classification of the
+    statement, its locking policy and the cursor allocation are done once,
+    then each execution goes straight to the sqlite3 statement cache.
+
+    Like a Cursor, an instance shouldn't be used by several threads at once"""
+    def __init__(self, dbc, conn, sql, pool=None):
+        """
+        Init
+
+        [parameters]
+        - dbc: LiteDBC instance
+        - conn: sqlite connection
+        - sql: the SQL statement
+        - pool: optional pool of read-only connections used by 'query'
+        """
+        self._dbc = dbc
+        self._conn = conn
+        self._sql = sql
+        info = statement.get_stmt_info(sql)
+        self._is_readonly = info.is_readonly
+        self._pool = pool if info.is_query else None
+        self._write_lock = None if info.is_readonly else dbc.write_lock
+        self._sqlite_cursor = conn.cursor()
+
+    @property
+    def dbc(self):
+        return self._dbc
+
+    @property
+    def sql(self):
+        return self._sql
+
+    @property
+    def is_readonly(self):
+        return self._is_readonly
+
+    @property
+    def description(self):
+        return self._sqlite_cursor.description
+
+    @property
+    def lastrowid(self):
+        return self._sqlite_cursor.lastrowid
+
+    @property
+    def rowcount(self):
+        return self._sqlite_cursor.rowcount
+
+    def run(self, params=(), /):
+        """Execute the statement. Returns self, thus
+        'lastrowid', 'rowcount' and the fetch methods can be used"""
+        if self._write_lock is None:
+            self._sqlite_cursor.execute(self._sql, params)
+            return self
+        with self._write_lock:
+            self._sqlite_cursor.execute(self._sql, params)
+            return self
+
+    def run_many(self, iterable, /):
+        """Execute the statement for each sequence of parameters. Returns self"""
+        with self._dbc.write_lock:
+            self._sqlite_cursor.executemany(self._sql, iterable)
+            return self
+
+    def query(self, params=(), /, buffer_size=None):
+        """Generator that executes the statement then yields the rows.
+        Each call uses its own cursor, thus several queries can be
+        consumed at the same time"""
+        conn = None
+        if self._pool is not None and not self._conn.in_transaction:
+            conn = self._pool.acquire()
+        sqlite_cursor = (self._conn if conn is None else conn).cursor()
+        buffer_size = sqlite_cursor.arraysize if buffer_size is None else buffer_size
+        try:
+            if self._write_lock is None:
+                sqlite_cursor.execute(self._sql, params)
+            else:
+                with self._write_lock:
+                    sqlite_cursor.execute(self._sql, params)
+            rows = sqlite_cursor.fetchmany(buffer_size)
+            while rows:
+                yield from rows
+                rows = sqlite_cursor.fetchmany(buffer_size)
+        finally:
+            sqlite_cursor.close()
+            if conn is not None:
+                self._pool.release(conn)
+
+    def fetchone(self):
+        return self._sqlite_cursor.fetchone()
+
+    def fetchmany(self, size=None):
+        size = self._sqlite_cursor.arraysize if size is None else size
+        return self._sqlite_cursor.fetchmany(size)
+
+    def fetchall(self):
+        return self._sqlite_cursor.fetchall()
+
+    def close(self):
+        return self._sqlite_cursor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,129 @@
+"""Retries of the operations that fail because the database is busy"""
+import time
+import random
+import threading
+from collections import namedtuple
+from litedbc import errors
+
+
+RetryInfo = namedtuple("RetryInfo", ["calls", "retries", "failures",
+                                     "busy_wait"])
+
+# primary result codes, sqlite3 only exposes them from Python 3.11
+SQLITE_BUSY = 5
+SQLITE_LOCKED = 6
+
+
+class RetryPolicy:
+    """Retry policy with exponential backoff and jitter for the operations
+    that fail with SQLITE_BUSY or SQLITE_LOCKED ('database is locked'),
+    once the busy timeout of the connection has expired.
+
+    The n-th retry waits for min(max_delay, delay * backoff ** n) seconds,
+    reduced by a random fraction (up to 'jitter') so that competing
+    processes don't retry in lockstep. The policy gives up after 'retries'
+    retries or once 'max_wait' seconds have been spent waiting.
+    A policy is thread-safe and can be shared by several dbc"""
+    def __init__(self, retries=10, delay=0.005, max_delay=0.5,
+                 backoff=2.0, jitter=0.5, max_wait=10.0):
+        """
+        Init
+
+        [parameters]
+        - retries: maximum number of retries of an operation
+        - delay: time in seconds before the first retry
+        - max_delay: upper bound in seconds of the time between two retries
+        - backoff: factor applied to the delay after each retry
+        - jitter: fraction (0 to 1) of the delay that is randomized
+        - max_wait: maximum time in seconds spent waiting by an operation
+        """
+        self._retries = retries
+        self._delay = delay
+        self._max_delay = max_delay
+        self._backoff = backoff
+        self._jitter = jitter
+        self._max_wait = max_wait
+        self._lock = threading.Lock()
+        self._calls = 0
+        self._retry_count = 0
+        self._failures = 0
+        self._busy_wait = 0.0
+
+    @property
+    def retries(self):
+        return self._retries
+
+    @property
+    def max_wait(self):
+        return self._max_wait
+
+    def get_delay(self, retry):
+        """Returns the time in seconds to wait before the retry
+        of rank 'retry' (starting from 0)"""
+        delay = min(self._max_delay, self._delay * self._backoff ** retry)
+        return delay * (1 - self._jitter * random.random())
+
+    def run(self, func, retries=None):
+        """
+        Call func() until it succeeds, fails with an error unrelated
+        to a busy database, or the policy gives up
+
+        [parameters]
+        - func: callable without arguments
+        - retries: maximum number of retries, defaults to the one
+            of the policy
+
+        [return]
+        Returns the result of func()
+        """
+        retries = self._retries if retries is None else retries
+        waited = 0.0
+        retry = 0
+        with self._lock:
+            self._calls += 1
+        while True:
+            try:
+                return func()
+            except errors.OperationalError as e:
+                if not is_busy_error(e):
+                    raise
+                delay = min(self.get_delay(retry), self._max_wait - waited)
+                if retry >= retries or delay <= 0:
+                    with self._lock:
+                        self._failures += 1
+                    raise
+            time.sleep(delay)
+            waited += delay
+            retry += 1
+            with self._lock:
+                self._retry_count += 1
+                self._busy_wait += delay
+
+    def info(self):
+        """
+        Returns a RetryInfo namedtuple:
+            - calls: number of operations run through the policy
+            - retries: total number of retries
+            - failures: number of operations given up
+                while the database was still busy
+            - busy_wait: time in seconds spent waiting between retries
+        """
+        with self._lock:
+            return RetryInfo(self._calls, self._retry_count, self._failures,
+                             self._busy_wait)
+
+    def reset(self):
+        with self._lock:
+            self._calls = self._retry_count = self._failures = 0
+            self._busy_wait = 0.0
+
+
+def is_busy_error(error):
+    """Returns True if the error is caused by a busy or locked database"""
+    if not isinstance(error, errors.OperationalError):
+        return False
+    code = getattr(error, "sqlite_errorcode", None)
+    if code is not None:
+        return code & 0xFF in (SQLITE_BUSY, SQLITE_LOCKED)
+    message = str(error)
+    return "is locked" in message or "is busy" in message
@@ -0,0 +1,97 @@
+from litedbc.const import TransactionMode
+from litedbc.cursor import Cursor
+from litedbc.prepared import PreparedStatement
+from litedbc.transaction import Transaction
+
+
+class Session:
+    """A connection owned by a single thread, with its own transaction state.
+    Writes are still serialized through the write lock of the dbc"""
+    def __init__(self, dbc, conn):
+        self._dbc = dbc
+        self._conn = conn
+        self._is_closed = False
+
+    @property
+    def dbc(self):
+        return self._dbc
+
+    @property
+    def in_transaction(self):
+        return self._conn.in_transaction
+
+    @property
+    def total_changes(self):
+        return self._conn.total_changes
+
+    @property
+    def is_closed(self):
+        return self._is_closed
+
+    def transaction(self, transaction_mode=TransactionMode.DEFERRED):
+        """Returns a context manager"""
+        return Transaction(self._dbc, self._conn, mode=transaction_mode)
+
+    def deferred_transaction(self):
+        """Returns a context manager"""
+        return Transaction(self._dbc, self._conn, mode=TransactionMode.DEFERRED)
+
+    def immediate_transaction(self):
+        """Returns a context manager"""
+        return Transaction(self._dbc, self._conn, mode=TransactionMode.IMMEDIATE)
+
+    def exclusive_transaction(self):
+        """Returns a context manager"""
+        return Transaction(self._dbc, self._conn, mode=TransactionMode.EXCLUSIVE)
+
+    def write_transaction(self):
+        """Returns a context manager for a transaction
+        that is known to write (IMMEDIATE mode)"""
+        return Transaction(self._dbc, self._conn, mode=TransactionMode.IMMEDIATE)
+
+    def cursor(self):
+        """Returns a context manager"""
+        return Cursor(self._dbc, self._conn)
+
+    def execute(self, sql, params=None, /):
+        cur = Cursor(self._dbc, self._conn)
+        return cur.execute(sql, params)
+
+    def executemany(self, sql, params=None, /):
+        cur = Cursor(self._dbc, self._conn)
+        return cur.executemany(sql, params)
+
+    def executescript(self, sql_script, /, transaction_mode=TransactionMode.DEFERRED):
+        cur = Cursor(self._dbc, self._conn)
+        return cur.executescript(sql_script, transaction_mode=transaction_mode)
+
+    def prepare(self, sql, /):
+        """Returns a PreparedStatement bound to the connection of this session"""
+        return PreparedStatement(self._dbc, self._conn, sql)
+
+    def apply(self, func):
+        """Call func(conn) with the connection of this session"""
+        if not self._is_closed:
+            func(self._conn)
+
+    def close(self):
+        """
+        Closes the connection of this session
+
+        [return]
+        Returns a boolean
+        """
+        if self._is_closed:
+            return False
+        self._is_closed = True
+        self._conn.close()
+        return True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __del__(self):
+        self.close()
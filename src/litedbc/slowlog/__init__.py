@@ -0,0 +1,154 @@
+"""Log of the statements slower than a threshold, with their query plan"""
+import os
+import json
+import time
+import threading
+from collections import deque, namedtuple
+
+
+SlowQuery = namedtuple("SlowQuery", ["timestamp", "sql", "params", "duration",
+                                     "rows", "plan", "full_scans"])
+
+# maximum number of entries kept in memory
+CAPACITY = 1000
+# value that replaces each parameter when redaction is enabled
+REDACTED = "?"
+
+
+class SlowQueryLog:
+    """Bounded ring buffer of the statements whose duration (execution
+    and fetching of the rows, lock wait excluded) reaches a threshold.
+    Each entry comes with the output of EXPLAIN QUERY PLAN and the tables
+    fully scanned, i.e., SCAN lines of the plan that don't use an index.
+    Entries can also be appended to a JSONL file"""
+    def __init__(self, threshold_ms, capacity=CAPACITY, filename=None,
+                 redact=False, explain=None):
+        """
+        Init
+
+        [parameters]
+        - threshold_ms: threshold in milliseconds
+        - capacity: maximum number of entries kept in memory,
+            the oldest entries are discarded first
+        - filename: if set, each entry is appended as a JSON line to this file
+        - redact: set it to True to replace each parameter with REDACTED,
+            or to a function that accepts and returns the parameters
+        - explain: function that accepts the SQL and its parameters
+            and returns the rows of EXPLAIN QUERY PLAN, or None.
+            LiteDBC runs it on a side read connection
+        """
+        self._threshold_ms = threshold_ms
+        self._threshold = threshold_ms / 1000
+        self._capacity = capacity
+        self._filename = None if filename is None else os.fspath(filename)
+        self._redact = redact
+        self._explain = explain
+        self._lock = threading.Lock()
+        self._entries = deque(maxlen=capacity)
+
+    @property
+    def threshold_ms(self):
+        return self._threshold_ms
+
+    @property
+    def threshold(self):
+        """Threshold in seconds"""
+        return self._threshold
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    @property
+    def filename(self):
+        return self._filename
+
+    @property
+    def redact(self):
+        return self._redact
+
+    def record(self, sql, params, duration, rows):
+        """
+        Record a statement if its duration reaches the threshold
+
+        [parameters]
+        - sql: SQL statement
+        - params: parameters of the statement, None if unknown
+        - duration: time in seconds
+        - rows: number of rows returned or modified
+
+        [return]
+        Returns the new SlowQuery namedtuple, or None
+        """
+        if duration < self._threshold:
+            return None
+        plan = None
+        if self._explain is not None:
+            try:
+                plan = self._explain(sql, tuple() if params is None else params)
+            except Exception:
+                plan = None  # e.g. temporary table unknown to the side connection
+        plan = None if plan is None else tuple([row[-1] for row in plan])
+        full_scans = None if plan is None else get_full_scans(plan)
+        entry = SlowQuery(time.time(), sql, self._redact_params(params),
+                          duration, rows, plan, full_scans)
+        with self._lock:
+            self._entries.append(entry)
+            if self._filename is not None:
+                with open(self._filename, "a", encoding="utf-8") as file:
+                    file.write(json.dumps(entry._asdict(),
+                                          default=_to_json) + "\n")
+        return entry
+
+    def entries(self, full_scans_only=False):
+        """Returns a tuple of SlowQuery namedtuples(timestamp, sql, params,
+        duration, rows, plan, full_scans), from the oldest to the newest.
+        The plan is a tuple of the 'detail' column of EXPLAIN QUERY PLAN
+        and full_scans is a tuple of table names. Both are None when
+        the plan couldn't be captured"""
+        with self._lock:
+            entries = tuple(self._entries)
+        if full_scans_only:
+            entries = tuple([entry for entry in entries if entry.full_scans])
+        return entries
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _redact_params(self, params):
+        if not self._redact or params is None:
+            return params
+        if self._redact is not True:
+            return self._redact(params)
+        if isinstance(params, dict):
+            return {key: REDACTED for key in params}
+        return tuple([REDACTED] * len(params))
+
+
+def get_full_scans(plan):
+    """Returns the names of the tables fully scanned according to the
+    'detail' lines of EXPLAIN QUERY PLAN, i.e., the SCAN lines without
+    an index (covering or not). Scans of subqueries and constant
+    rows are ignored"""
+    tables = list()
+    for detail in plan:
+        words = detail.split()
+        if not words or words[0] != "SCAN":
+            continue
+        words = words[1:]
+        if words and words[0] == "TABLE":  # SQLite < 3.36
+            words = words[1:]
+        if not words or words[0] in ("CONSTANT", "SUBQUERY") or words[0].startswith("("):
+            continue
+        if "USING" in words and "INDEX" in words[words.index("USING"):]:
+            continue
+        if words[0] not in tables:
+            tables.append(words[0])
+    return tuple(tables)
+
+
+def _to_json(obj):
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        return "<{} bytes>".format(len(obj))
+    return repr(obj)
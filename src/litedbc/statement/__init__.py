@@ -0,0 +1,188 @@
+"""Lexical analysis of SQL statements"""
+import functools
+from collections import namedtuple
+
+
+StmtInfo = namedtuple("StmtInfo", ["keyword", "is_readonly", "is_query"])
+
+# size of the LRU cache of classified statements
+CACHE_SIZE = 1024
+
+# statements that return rows computed from the database content only
+QUERY_KEYWORDS = frozenset(("SELECT", "VALUES"))
+# main keywords that might follow a WITH clause
+WITH_KEYWORDS = frozenset(("SELECT", "VALUES", "INSERT", "UPDATE",
+                           "DELETE", "REPLACE"))
+# statements that control the transaction, not the database content
+TRANSACTION_KEYWORDS = frozenset(("BEGIN", "COMMIT", "END", "ROLLBACK",
+                                  "SAVEPOINT", "RELEASE"))
+# pragmas that don't change anything even when they take an argument
+READONLY_PRAGMAS = frozenset(("table_info", "table_xinfo", "table_list",
+                              "index_info", "index_xinfo", "index_list",
+                              "foreign_key_list", "foreign_key_check",
+                              "integrity_check", "quick_check",
+                              "collation_list", "function_list",
+                              "module_list", "pragma_list",
+                              "database_list", "compile_options"))
+# pragmas that do something even without an argument
+WRITING_PRAGMAS = frozenset(("optimize", "shrink_memory",
+                             "incremental_vacuum", "wal_checkpoint"))
+
+
+def tokenize(sql):
+    """Generator that yields (kind, text) tuples. Comments and whitespace
+    are skipped. The kind is one of: 'word', 'string', 'identifier',
+    'number', 'parameter' and 'punctuation'"""
+    i, n = 0, len(sql)
+    while i < n:
+        c = sql[i]
+        if c.isspace():
+            i += 1
+        elif c == "-" and sql.startswith("--", i):
+            j = sql.find("\n", i)
+            i = n if j == -1 else j + 1
+        elif c == "/" and sql.startswith("/*", i):
+            j = sql.find("*/", i + 2)
+            i = n if j == -1 else j + 2
+        elif c in "'\"`[":
+            end = "]" if c == "[" else c
+            j = i + 1
+            while True:
+                j = sql.find(end, j)
+                if j == -1:
+                    j = n
+                    break
+                if end != "]" and sql.startswith(end * 2, j):
+                    j += 2  # escaped quote
+                    continue
+                j += 1
+                break
+            kind = "string" if c == "'" else "identifier"
+            yield kind, sql[i:j]
+            i = j
+        elif c.isalpha() or c == "_":
+            j = i + 1
+            while j < n and (sql[j].isalnum() or sql[j] in "_$"):
+                j += 1
+            yield "word", sql[i:j]
+            i = j
+        elif c.isdigit() or (c == "." and i + 1 < n and sql[i+1].isdigit()):
+            j = i + 1
+            while j < n and (sql[j].isalnum() or sql[j] == "."
+                             or (sql[j] in "+-" and sql[j-1] in "eE")):
+                j += 1
+            yield "number", sql[i:j]
+            i = j
+        elif c in "?:@$":
+            j = i + 1
+            while j < n and (sql[j].isalnum() or sql[j] == "_"):
+                j += 1
+            yield "parameter", sql[i:j]
+            i = j
+        else:
+            yield "punctuation", c
+            i += 1
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def get_stmt_info(sql):
+    """
+    Classify a SQL statement. Results are cached, keyed by the SQL string.
+
+    [return]
+    Returns a StmtInfo namedtuple:
+        - keyword: the main keyword in uppercase (SELECT, INSERT, PRAGMA, ...),
+            the keyword following the WITH clause for common table expressions
+        - is_readonly: boolean, True when the statement can't write to the database
+        - is_query: boolean, True for SELECT and VALUES statements
+    """
+    tokens = tokenize(sql)
+    keyword = _next_keyword(tokens)
+    if keyword == "WITH":
+        keyword = _get_with_keyword(tokens)
+    if keyword in QUERY_KEYWORDS:
+        return StmtInfo(keyword, True, True)
+    if keyword == "EXPLAIN":
+        return StmtInfo(keyword, True, False)
+    if keyword == "PRAGMA":
+        return StmtInfo(keyword, _is_readonly_pragma(tokens), False)
+    return StmtInfo(keyword, False, False)
+
+
+def is_readonly(sql):
+    """Returns True if the SQL statement can't write to the database"""
+    return get_stmt_info(sql).is_readonly
+
+
+def is_query(sql):
+    """Returns True if the SQL statement is a SELECT or a VALUES statement"""
+    return get_stmt_info(sql).is_query
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def normalize(sql):
+    """Returns the statement with comments removed, whitespace collapsed
+    and unquoted words in uppercase. Literals are left untouched"""
+    return " ".join([text.upper() if kind == "word" else text
+                     for kind, text in tokenize(sql)])
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def get_shape(sql):
+    """Returns the normalized statement with literals and parameters
+    replaced by '?'. Lists of placeholders are collapsed, so that
+    `IN (1, 2, 3)` becomes `IN ( ? )` and `VALUES (?, ?), (?, ?)`
+    becomes `VALUES ( ? )`"""
+    tokens = list()
+    for kind, text in tokenize(sql):
+        if kind in ("string", "number", "parameter"):
+            text = "?"
+        elif kind == "word":
+            text = text.upper()
+        tokens.append(text)
+        if tokens[-3:] == ["?", ",", "?"]:
+            del tokens[-2:]
+        elif tokens[-7:] == ["(", "?", ")", ",", "(", "?", ")"]:
+            del tokens[-4:]
+    return " ".join(tokens)
+
+
+def _next_keyword(tokens):
+    for kind, text in tokens:
+        if kind == "word":
+            return text.upper()
+        if kind != "punctuation" or text != "(":
+            return None
+    return None
+
+
+def _get_with_keyword(tokens):
+    depth = 0
+    for kind, text in tokens:
+        if kind == "punctuation":
+            if text == "(":
+                depth += 1
+            elif text == ")":
+                depth -= 1
+        elif kind == "word" and depth == 0:
+            keyword = text.upper()
+            if keyword in WITH_KEYWORDS:
+                return keyword
+    return None
+
+
+def _is_readonly_pragma(tokens):
+    name = None
+    for kind, text in tokens:
+        if kind == "punctuation":
+            if text == ".":
+                continue
+            if text == "=":
+                return False
+            if text == "(":
+                return name in READONLY_PRAGMAS
+            if text == ";":
+                break
+            return False
+        name = text.lower()
+    return name is not None and name not in WRITING_PRAGMAS
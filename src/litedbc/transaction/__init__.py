@@ -1,14 +1,34 @@
-from litedbc import misc
+import time
+from litedbc import misc, retry
+from litedbc.const import TransactionMode
 from litedbc.cursor import Cursor
 
 
 class Transaction:
+    """A transaction created while another one is pending on the same
+    connection is nested: it runs in a SAVEPOINT, released when the
+    context exits normally and rolled back to when an exception is raised.
+    An error in a nested transaction then only discards the work done
+    within it, and the outer transaction can go on.
+
+    With TransactionMode.AUTO, the transaction starts in IMMEDIATE mode
+    when a previous transaction created at the same call site wrote to the
+    database (changed rows or ran a statement that isn't read-only, such
+    as DDL) or failed because the database was busy, and in DEFERRED
+    mode otherwise. This avoids the SQLITE_BUSY errors raised when a read
+    transaction can't be upgraded to a write transaction"""
     def __init__(self, dbc, conn, mode):
         self._dbc = dbc
         self._conn = conn
         self._cur = None
         self._mode = mode
         self._is_nested = False
+        self._savepoint = None
+        self._start = None
+        self._site = None
+        self._changes = None
+        if mode is TransactionMode.AUTO:
+            self._site = misc.get_call_site()
 
     @property
     def dbc(self):
@@ -23,27 +43,86 @@ class Transaction:
         return self._cur
 
     def __enter__(self):
-        self._dbc.write_lock.acquire()
-        self._is_nested = True if self._conn.in_transaction else False
-        self._cur = Cursor(self._dbc, self._conn)
-        if not self._is_nested and self._mode is not None:
-            start_transaction_stmt = misc.get_start_transaction_stmt(self._mode)
-            self._cur.execute(start_transaction_stmt)
+        metrics = self._dbc.metrics_registry
+        if metrics is None:
+            self._dbc.write_lock.acquire()
+        else:
+            start = time.perf_counter()
+            self._dbc.write_lock.acquire()
+            self._start = time.perf_counter()
+            metrics.record_lock_wait(self._start - start)
+        try:
+            self._is_nested = True if self._conn.in_transaction else False
+            self._cur = Cursor(self._dbc, self._conn)
+            if self._is_nested:
+                self._dbc._savepoints += 1
+                self._savepoint = "litedbc_{}".format(self._dbc._savepoints)
+                self._cur.execute("SAVEPOINT {}".format(self._savepoint))
+            elif self._mode is not None:
+                mode = self._mode
+                if self._site is not None:
+                    mode = (TransactionMode.IMMEDIATE
+                            if self._dbc._is_write_site(self._site)
+                            else TransactionMode.DEFERRED)
+                    self._changes = self._conn.total_changes
+                start_transaction_stmt = misc.get_start_transaction_stmt(mode)
+                self._cur.execute(start_transaction_stmt)
+        except BaseException:
+            try:
+                if self._cur is not None:
+                    self._cur.close()
+            finally:
+                if self._savepoint is not None:
+                    self._dbc._savepoints -= 1
+                self._dbc.write_lock.release()
+            raise
         return self._cur
 
     def __exit__(self, exc_type, exc_val, exc_tb):
+        if self._changes is not None:
+            if (self._conn.total_changes != self._changes
+                    or self._cur._has_written
+                    or retry.is_busy_error(exc_val)):
+                self._dbc._add_write_site(self._site)
         try:
-            if not self._is_nested and self._conn.in_transaction:
+            if self._savepoint is not None:
+                self._exit_savepoint(exc_type)
+            elif not self._is_nested and self._conn.in_transaction:
                 with self._dbc.write_lock:
                     if exc_type is None:
-                        self._conn.execute("COMMIT")
+                        self._commit()
                     else:
                         self._conn.execute("ROLLBACK")
         finally:
             try:
                 self._cur.close()
             finally:
+                if self._savepoint is not None:
+                    self._dbc._savepoints -= 1
                 self._dbc.write_lock.release()
+                metrics = self._dbc.metrics_registry
+                if (metrics is not None and self._start is not None
+                        and not self._is_nested):
+                    metrics.record_transaction(time.perf_counter() - self._start,
+                                               committed=exc_type is None)
 
     def __del__(self):
-        self._cur.close()
+        if self._cur is not None:
+            self._cur.close()
+
+    def _exit_savepoint(self, exc_type):
+        # the savepoint is gone if an error rolled back the whole transaction
+        if not self._conn.in_transaction:
+            return
+        if exc_type is not None:
+            self._conn.execute("ROLLBACK TO SAVEPOINT {}".format(self._savepoint))
+        self._conn.execute("RELEASE SAVEPOINT {}".format(self._savepoint))
+
+    def _commit(self):
+        # a COMMIT that fails with SQLITE_BUSY can be retried,
+        # the transaction is still pending
+        policy = self._dbc.retry_policy
+        if policy is None:
+            self._conn.execute("COMMIT")
+        else:
+            policy.run(lambda: self._conn.execute("COMMIT"))
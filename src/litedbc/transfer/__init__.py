@@ -0,0 +1,282 @@
+"""Streaming import and export of CSV and JSON Lines data"""
+import os
+import csv
+import json
+import base64
+import contextlib
+from litedbc import bulk, errors, statement
+
+
+# number of rows per transaction for imports
+COMMIT_EVERY = 10000
+# number of rows fetched at once for exports
+BUFFER_SIZE = 1000
+
+
+def import_csv(dbc, table, src, columns=None, *, header=True, coerce=True,
+               chunk_rows=None, commit_every=COMMIT_EVERY,
+               encoding="utf-8", **fmtparams):
+    """
+    Import CSV data into an existing table
+
+    [parameters]
+    - dbc: LiteDBC instance
+    - table: name of the table
+    - src: filename or text file object
+    - columns: sequence of column names. Defaults to the header
+        if 'header' is True, otherwise to all columns of the table
+    - header: boolean to tell whether the first line is a header or not
+    - coerce: boolean to convert values according to the declared types
+        of the columns. Empty strings become NULL in non-text columns
+        and BLOB values are decoded from base64
+    - chunk_rows: maximum number of rows per INSERT statement
+    - commit_every: number of rows per transaction
+    - encoding: encoding of the file
+    - **fmtparams: formatting parameters passed to csv.reader
+
+    [return]
+    Returns the number of imported rows
+    """
+    with _open(src, "r", encoding) as file:
+        reader = csv.reader(file, **fmtparams)
+        if header:
+            names = next(reader, None)
+            columns = names if columns is None else columns
+        columns = _get_columns(dbc, table, columns)
+        rows = reader
+        if coerce:
+            converters = _get_converters(dbc, table, columns, from_text=True)
+            rows = _convert(rows, converters)
+        return bulk.bulk_insert(dbc, table, columns, rows,
+                                chunk_rows=chunk_rows,
+                                commit_every=commit_every)
+
+
+def import_jsonl(dbc, table, src, columns=None, *, coerce=True,
+                 chunk_rows=None, commit_every=COMMIT_EVERY,
+                 encoding="utf-8"):
+    """
+    Import JSON Lines data into an existing table.
+    Each line is either a JSON object keyed by column name
+    or a JSON array of values
+
+    [parameters]
+    - dbc: LiteDBC instance
+    - table: name of the table
+    - src: filename or text file object
+    - columns: sequence of column names. Defaults to the keys
+        of the first object, or to all columns of the table
+    - coerce: boolean to decode BLOB values from base64
+    - chunk_rows: maximum number of rows per INSERT statement
+    - commit_every: number of rows per transaction
+    - encoding: encoding of the file
+
+    [return]
+    Returns the number of imported rows
+    """
+    with _open(src, "r", encoding) as file:
+        records = (json.loads(line) for line in file if line.strip())
+        first = next(records, None)
+        if first is None:
+            return 0
+        if columns is None and isinstance(first, dict):
+            columns = tuple(first.keys())
+        columns = _get_columns(dbc, table, columns)
+        rows = _records_to_rows(first, records, columns)
+        if coerce:
+            converters = _get_converters(dbc, table, columns, from_text=False)
+            rows = _convert(rows, converters)
+        return bulk.bulk_insert(dbc, table, columns, rows,
+                                chunk_rows=chunk_rows,
+                                commit_every=commit_every)
+
+
+def export_csv(dbc, query, dst, params=None, *, header=True,
+               buffer_size=BUFFER_SIZE, encoding="utf-8", **fmtparams):
+    """
+    Export the result of a query as CSV. BLOB values are encoded in base64
+
+    [parameters]
+    - dbc: LiteDBC instance
+    - query: either a SELECT statement or the name of a table
+    - dst: filename or text file object
+    - params: parameters of the query
+    - header: boolean to tell whether the names of the columns
+        should be written or not
+    - buffer_size: number of rows fetched at once
+    - encoding: encoding of the file
+    - **fmtparams: formatting parameters passed to csv.writer
+
+    [return]
+    Returns the number of exported rows
+    """
+    with dbc.cursor() as cur, _open(dst, "w", encoding) as file:
+        cur.execute(_get_query(query), params)
+        writer = csv.writer(file, **fmtparams)
+        if header:
+            writer.writerow(cur.get_columns())
+        n = 0
+        rows = cur.fetchmany(buffer_size)
+        while rows:
+            writer.writerows(_encode_blobs(rows))
+            n += len(rows)
+            rows = cur.fetchmany(buffer_size)
+        return n
+
+
+def export_jsonl(dbc, query, dst, params=None, *,
+                 buffer_size=BUFFER_SIZE, encoding="utf-8"):
+    """
+    Export the result of a query as JSON Lines, one JSON object per row.
+    BLOB values are encoded in base64
+
+    [parameters]
+    - dbc: LiteDBC instance
+    - query: either a SELECT statement or the name of a table
+    - dst: filename or text file object
+    - params: parameters of the query
+    - buffer_size: number of rows fetched at once
+    - encoding: encoding of the file
+
+    [return]
+    Returns the number of exported rows
+    """
+    with dbc.cursor() as cur, _open(dst, "w", encoding) as file:
+        cur.execute(_get_query(query), params)
+        columns = cur.get_columns()
+        encoder = json.JSONEncoder(ensure_ascii=False, default=_encode_blob)
+        n = 0
+        rows = cur.fetchmany(buffer_size)
+        while rows:
+            file.writelines([encoder.encode(dict(zip(columns, row))) + "\n"
+                             for row in rows])
+            n += len(rows)
+            rows = cur.fetchmany(buffer_size)
+        return n
+
+
+@contextlib.contextmanager
+def _open(file, mode, encoding):
+    if hasattr(file, "read") or hasattr(file, "write"):
+        yield file
+        return
+    with open(os.fspath(file), mode, encoding=encoding, newline="") as f:
+        yield f
+
+
+def _get_query(query):
+    if statement.is_query(query):
+        return query
+    return "SELECT * FROM {}".format(bulk.quote_identifier(query))
+
+
+def _get_columns(dbc, table, columns):
+    if columns is None:
+        return tuple([info.name for info in dbc.inspect(table)])
+    return tuple(columns)
+
+
+def _records_to_rows(first, records, columns):
+    yield _record_to_row(first, columns)
+    for record in records:
+        yield _record_to_row(record, columns)
+
+
+def _record_to_row(record, columns):
+    if isinstance(record, dict):
+        return tuple([record.get(name) for name in columns])
+    return record
+
+
+def _get_converters(dbc, table, columns, from_text):
+    types = {info.name: info.type for info in dbc.inspect(table)}
+    converters = list()
+    for name in columns:
+        if name not in types:
+            msg = "Non-existent column ({}) in table ({})".format(name, table)
+            raise errors.Error(msg)
+        converters.append(_get_converter(types[name], from_text))
+    if not any(converters):
+        return None
+    return converters
+
+
+def _get_converter(declared_type, from_text):
+    # https://www.sqlite.org/datatype3.html#determination_of_column_affinity
+    declared_type = declared_type.upper()
+    if "INT" in declared_type:
+        return _to_int if from_text else None
+    if any(name in declared_type for name in ("CHAR", "CLOB", "TEXT")):
+        return None
+    if not declared_type:
+        return None
+    if "BLOB" in declared_type:
+        return _to_blob
+    if any(name in declared_type for name in ("REAL", "FLOA", "DOUB")):
+        return _to_float if from_text else None
+    return _to_number if from_text else None
+
+
+def _convert(rows, converters):
+    if converters is None:
+        yield from rows
+        return
+    for row in rows:
+        yield tuple([value if func is None else func(value)
+                     for func, value in zip(converters, row)])
+
+
+def _to_int(value):
+    if value == "":
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return _to_number(value)
+
+
+def _to_float(value):
+    if value == "":
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+def _to_number(value):
+    if value == "":
+        return None
+    for func in (int, float):
+        try:
+            return func(value)
+        except (TypeError, ValueError):
+            pass
+    return value
+
+
+def _to_blob(value):
+    if not isinstance(value, str):
+        return value
+    if value == "":
+        return None
+    try:
+        return base64.b64decode(value, validate=True)
+    except ValueError:
+        return value
+
+
+def _encode_blob(value):
+    # 'default' function of the JSON encoder
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return base64.b64encode(value).decode("ascii")
+    raise TypeError("Object of type {} is not JSON serializable".format(
+        type(value).__name__))
+
+
+def _encode_blobs(rows):
+    for row in rows:
+        if any(isinstance(value, bytes) for value in row):
+            row = [_encode_blob(value) if isinstance(value, bytes) else value
+                   for value in row]
+        yield row
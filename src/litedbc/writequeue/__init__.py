@@ -0,0 +1,185 @@
+import queue
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+from litedbc import errors
+
+
+WriteResult = namedtuple("WriteResult", ["lastrowid", "rowcount"])
+
+SAVEPOINT_NAME = "litedbc_write_queue"
+CLOSED_QUEUE_MSG = "Cannot operate on a closed write queue."
+
+_STOP = object()
+
+
+class WriteQueue:
+    """Group commit for small writes.
+    Statements submitted from any thread are executed by a background
+    writer thread that commits up to 'max_batch' statements, or the
+    statements received within 'max_delay' seconds, in a single
+    `BEGIN IMMEDIATE ... COMMIT`. Each statement runs inside its own
+    savepoint, so a failing statement doesn't affect the rest of the batch"""
+    def __init__(self, dbc, max_batch=256, max_delay=0.005):
+        """
+        Init
+
+        [parameters]
+        - dbc: LiteDBC instance
+        - max_batch: maximum number of statements per transaction
+        - max_delay: time in seconds spent waiting for more statements
+            once the first statement of a batch is received
+        """
+        self._dbc = dbc
+        self._max_batch = max_batch
+        self._max_delay = max_delay
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._is_closed = False
+        self._batches = 0
+        self._statements = 0
+
+    @property
+    def dbc(self):
+        return self._dbc
+
+    @property
+    def max_batch(self):
+        return self._max_batch
+
+    @property
+    def max_delay(self):
+        return self._max_delay
+
+    @property
+    def batches(self):
+        """Number of transactions committed so far"""
+        return self._batches
+
+    @property
+    def statements(self):
+        """Number of statements executed so far"""
+        return self._statements
+
+    @property
+    def is_closed(self):
+        with self._lock:
+            return self._is_closed
+
+    def submit(self, sql, params=None, /):
+        """
+        Submit a statement to the writer thread
+
+        [return]
+        Returns a concurrent.futures.Future that resolves with a
+        WriteResult(lastrowid, rowcount) once the batch is committed,
+        or with the exception raised by the statement
+        """
+        params = tuple() if params is None else params
+        future = Future()
+        self._put((sql, params, future))
+        return future
+
+    def flush(self, timeout=None):
+        """Block until every statement submitted so far is committed"""
+        future = Future()
+        self._put((None, None, future))
+        future.result(timeout)
+
+    def close(self):
+        """
+        Commits the pending statements then stops the writer thread
+
+        [return]
+        Returns a boolean
+        """
+        with self._lock:
+            if self._is_closed:
+                return False
+            self._is_closed = True
+            thread = self._thread
+            if thread is not None:
+                self._queue.put(_STOP)
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        return True
+
+    def _put(self, item):
+        with self._lock:
+            if self._is_closed:
+                raise errors.ProgrammingError(CLOSED_QUEUE_MSG)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run,
+                                                name="litedbc-write-queue",
+                                                daemon=True)
+                self._thread.start()
+            self._queue.put(item)
+
+    def _run(self):
+        while True:
+            batch, stop = self._collect_batch()
+            if batch:
+                self._commit(batch)
+            if stop:
+                return
+
+    def _collect_batch(self):
+        item = self._queue.get()
+        if item is _STOP:
+            return list(), True
+        batch = [item]
+        deadline = time.monotonic() + self._max_delay
+        while len(batch) < self._max_batch and batch[-1][0] is not None:
+            timeout = deadline - time.monotonic()
+            try:
+                if timeout > 0:
+                    item = self._queue.get(timeout=timeout)
+                else:
+                    item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _commit(self, batch):
+        # cancelled futures are dropped, barriers (flush) are resolved last
+        items = [item for item in batch
+                 if item[2].set_running_or_notify_cancel()]
+        statements = [item for item in items if item[0] is not None]
+        results = list()
+        try:
+            if statements:
+                results = self._execute(statements)
+        except BaseException as e:
+            for _, _, future in items:
+                future.set_exception(e)
+            return
+        self._batches += 1 if statements else 0
+        self._statements += len(statements)
+        for (_, _, future), (result, exception) in zip(statements, results):
+            if exception is None:
+                future.set_result(result)
+            else:
+                future.set_exception(exception)
+        for sql, _, future in items:
+            if sql is None:
+                future.set_result(None)
+
+    def _execute(self, statements):
+        results = list()
+        with self._dbc.immediate_transaction() as cur:
+            for sql, params, _ in statements:
+                cur.execute("SAVEPOINT {}".format(SAVEPOINT_NAME))
+                try:
+                    cur.execute(sql, params)
+                except Exception as e:
+                    cur.execute("ROLLBACK TO {}".format(SAVEPOINT_NAME))
+                    results.append((None, e))
+                else:
+                    results.append((WriteResult(cur.lastrowid, cur.rowcount), None))
+                cur.execute("RELEASE {}".format(SAVEPOINT_NAME))
+        return results
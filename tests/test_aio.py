@@ -0,0 +1,176 @@
+import os.path
+import asyncio
+import sqlite3
+import unittest
+import threading
+import tempfile
+from litedbc import JournalMode
+from litedbc.aio import AsyncLiteDBC, connect
+
+
+INIT_SCRIPT = """
+CREATE TABLE galaxy (
+    name TEXT PRIMARY KEY,
+    size INTEGER NOT NULL);
+"""
+
+INSERT_INTO_GALAXY = "INSERT INTO galaxy VALUES (?, ?)"
+SELECT_FROM_GALAXY = "SELECT * FROM galaxy ORDER BY size"
+
+
+class TestAsyncLiteDBC(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self._tempdir = tempfile.TemporaryDirectory()
+        self._filename = os.path.join(self._tempdir.name, "my.db")
+        self._adbc = await connect(self._filename, init_script=INIT_SCRIPT,
+                                   readers=2)
+        await self._adbc.run(lambda dbc: dbc.set_journal_mode(JournalMode.WAL))
+
+    async def asyncTearDown(self):
+        await self._adbc.close()
+        try:
+            self._tempdir.cleanup()
+        except Exception as e:
+            pass
+
+    async def test_execute(self):
+        cur = await self._adbc.execute(INSERT_INTO_GALAXY, ("aldebaran", 42))
+        with self.subTest():
+            self.assertEqual(1, cur.lastrowid)
+        await cur.close()
+        cur = await self._adbc.execute(SELECT_FROM_GALAXY)
+        with self.subTest():
+            self.assertEqual([("aldebaran", 42)], await cur.fetchall())
+        await cur.close()
+
+    async def test_transaction(self):
+        async with self._adbc.transaction() as cur:
+            await cur.executemany(INSERT_INTO_GALAXY,
+                                  [("galaxy-{}".format(i), i) for i in range(10)])
+        with self.subTest():
+            async with self._adbc.cursor() as cur:
+                await cur.execute(SELECT_FROM_GALAXY)
+                rows = [row async for row in cur.fetch(buffer_size=3)]
+                self.assertEqual(10, len(rows))
+        with self.subTest():
+            with self.assertRaises(ZeroDivisionError):
+                async with self._adbc.transaction() as cur:
+                    await cur.execute(INSERT_INTO_GALAXY, ("andromeda", 100))
+                    1 / 0
+            cur = await self._adbc.execute("SELECT COUNT(*) FROM galaxy")
+            self.assertEqual((10, ), await cur.fetchone())
+            await cur.close()
+
+    async def test_concurrent_transactions(self):
+        async def insert(i):
+            async with self._adbc.immediate_transaction() as cur:
+                await cur.execute(INSERT_INTO_GALAXY, ("galaxy-{}".format(i), i))
+                await asyncio.sleep(0)
+                await cur.execute("SELECT COUNT(*) FROM galaxy WHERE size=?", (i, ))
+                return (await cur.fetchone())[0]
+        r = await asyncio.gather(*[insert(i) for i in range(8)])
+        self.assertEqual([1] * 8, r)
+
+    async def test_execute_within_transaction(self):
+        async def run():
+            async with self._adbc.transaction() as cur:
+                await cur.execute(INSERT_INTO_GALAXY, ("aldebaran", 42))
+                # joins the pending transaction instead of waiting for it
+                cur2 = await self._adbc.execute(SELECT_FROM_GALAXY)
+                rows = await cur2.fetchall()
+                await cur2.close()
+                await self._adbc.execute(INSERT_INTO_GALAXY, ("andromeda", 100))
+                return rows
+        rows = await asyncio.wait_for(run(), timeout=5)
+        with self.subTest():
+            self.assertEqual([("aldebaran", 42)], rows)
+        with self.subTest():
+            cur = await self._adbc.execute("SELECT COUNT(*) FROM galaxy")
+            self.assertEqual((2, ), await cur.fetchone())
+            await cur.close()
+
+    async def test_nested_transaction(self):
+        async def run():
+            async with self._adbc.transaction() as cur:
+                await cur.execute(INSERT_INTO_GALAXY, ("aldebaran", 42))
+                with self.assertRaises(ZeroDivisionError):
+                    async with self._adbc.transaction() as cur2:
+                        await cur2.execute(INSERT_INTO_GALAXY, ("andromeda", 100))
+                        1 / 0
+                async with self._adbc.transaction() as cur2:
+                    await cur2.execute(INSERT_INTO_GALAXY, ("milky-way", 7))
+        await asyncio.wait_for(run(), timeout=5)
+        with self.subTest():
+            cur = await self._adbc.execute(SELECT_FROM_GALAXY)
+            # only the work of the failed nested transaction is discarded
+            self.assertEqual([("milky-way", 7), ("aldebaran", 42)],
+                             await cur.fetchall())
+            await cur.close()
+        with self.subTest():
+            self.assertFalse(self._adbc.in_transaction)
+
+    async def test_reader_cursors_stay_on_their_thread(self):
+        await self._adbc.executemany(INSERT_INTO_GALAXY,
+                                     [("galaxy-{}".format(i), i) for i in range(20)])
+        cursors = [await self._adbc.execute(SELECT_FROM_GALAXY) for _ in range(6)]
+        threads = [set() for _ in cursors]
+
+        def spy(cur, i):
+            fetchmany = cur.fetchmany
+
+            def func(*args):
+                threads[i].add(threading.get_ident())
+                return fetchmany(*args)
+            return func
+
+        for i, cur in enumerate(cursors):
+            cur._cursor.fetchmany = spy(cur._cursor, i)
+
+        async def fetch(cur):
+            return [row async for row in cur.fetch(buffer_size=2)]
+        r = await asyncio.gather(*[fetch(cur) for cur in cursors])
+        for cur in cursors:
+            await cur.close()
+        with self.subTest():
+            self.assertEqual([20] * 6, [len(rows) for rows in r])
+        with self.subTest():
+            self.assertEqual([1] * 6, [len(item) for item in threads])
+
+    async def test_cancelled_transaction(self):
+        # another process holds the write lock of the database
+        other = sqlite3.connect(self._filename, isolation_level=None)
+        other.execute("BEGIN IMMEDIATE")
+
+        async def run():
+            async with self._adbc.immediate_transaction() as cur:
+                await cur.execute(INSERT_INTO_GALAXY, ("aldebaran", 42))
+        task = asyncio.create_task(run())
+        await asyncio.sleep(0.1)  # BEGIN IMMEDIATE waits for the other process
+        task.cancel()
+        asyncio.get_running_loop().call_later(0.1,
+                                              lambda: other.execute("COMMIT"))
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        other.close()
+        with self.subTest():
+            # the transaction started after the cancellation was ended
+            self.assertTrue(self._adbc.dbc.write_lock.acquire(blocking=False))
+            self._adbc.dbc.write_lock.release()
+        with self.subTest():
+            self.assertFalse(self._adbc.in_transaction)
+        with self.subTest():
+            await self._adbc.execute(INSERT_INTO_GALAXY, ("andromeda", 100))
+            cur = await self._adbc.execute(SELECT_FROM_GALAXY)
+            self.assertEqual([("andromeda", 100)], await cur.fetchall())
+            await cur.close()
+
+    async def test_in_memory_database(self):
+        async with AsyncLiteDBC(init_script=INIT_SCRIPT, readers=2) as adbc:
+            self.assertEqual(0, adbc.readers)
+            await adbc.execute(INSERT_INTO_GALAXY, ("aldebaran", 42))
+            self.assertEqual(("galaxy", ), await adbc.list_tables())
+
+
+if __name__ == "__main__":
+    unittest.main()
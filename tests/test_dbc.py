@@ -1,8 +1,16 @@
+import io
 import os.path
+import time
+import array
+import shutil
 import unittest
+import threading
 import tempfile
-from litedbc import LiteDBC, LockingMode, ColumnInfo
-from litedbc.errors import Error, OperationalError, ProgrammingError
+from litedbc import (misc, dump, metrics, LiteDBC, LockingMode, JournalMode,
+                     TransactionMode, Profile, ColumnInfo, BackupManager,
+                     RetryPolicy, sqlite)
+from litedbc.errors import (Error, OperationalError, ProgrammingError,
+                            IntegrityError, DataError)
 
 
 INIT_SCRIPT = """
@@ -41,6 +49,12 @@ def populate_db(dbc):
         cur.execute(INSERT_INTO_PLANET, (GALAXY_NAME, PLANET_SIGNATURE))
 
 
+def get_pragma(dbc, name):
+    with dbc.cursor() as cur:
+        cur.execute("PRAGMA {}".format(name))
+        return cur.fetchone()[0]
+
+
 class TestEmptyDatabase(unittest.TestCase):
 
     def setUp(self):
@@ -463,9 +477,66 @@ class TestDeferredTransactionContext(unittest.TestCase):
             expected = ["BEGIN DEFERRED",
                         "INSERT INTO galaxy VALUES ('{}', {})".format(GALAXY_NAME,
                                                                       GALAXY_SIZE),
+                        "SAVEPOINT litedbc_1",
                         "SELECT * FROM galaxy",
+                        "RELEASE SAVEPOINT litedbc_1",
+                        "COMMIT"]
+            self.assertEqual(expected, log)
+
+    def test_nested_context_with_rollback(self):
+        log = list()
+        self._dbc.set_trace_callback(lambda query: log.append(query))
+        # the failure of an item only discards the work of this item
+        with self._dbc.transaction() as cur:
+            for i in range(3):
+                try:
+                    with self._dbc.transaction() as cur:
+                        cur.execute(INSERT_INTO_GALAXY, (str(i), GALAXY_SIZE))
+                        if i == 1:
+                            raise Exception
+                except Exception as e:
+                    pass
+        with self.subTest():
+            expected = ["BEGIN DEFERRED",
+                        "SAVEPOINT litedbc_1",
+                        "INSERT INTO galaxy VALUES ('0', {})".format(GALAXY_SIZE),
+                        "RELEASE SAVEPOINT litedbc_1",
+                        "SAVEPOINT litedbc_1",
+                        "INSERT INTO galaxy VALUES ('1', {})".format(GALAXY_SIZE),
+                        "ROLLBACK TO SAVEPOINT litedbc_1",
+                        "RELEASE SAVEPOINT litedbc_1",
+                        "SAVEPOINT litedbc_1",
+                        "INSERT INTO galaxy VALUES ('2', {})".format(GALAXY_SIZE),
+                        "RELEASE SAVEPOINT litedbc_1",
                         "COMMIT"]
             self.assertEqual(expected, log)
+        with self.subTest():
+            cur = self._dbc.execute("SELECT name FROM galaxy ORDER BY name")
+            self.assertEqual([("0", ), ("2", )], cur.fetchall())
+
+    def test_deeply_nested_context(self):
+        with self.assertRaises(Exception):
+            with self._dbc.transaction() as cur:
+                cur.execute(INSERT_INTO_GALAXY, ("a", GALAXY_SIZE))
+                with self._dbc.transaction() as cur:
+                    cur.execute(INSERT_INTO_GALAXY, ("b", GALAXY_SIZE))
+                    with self._dbc.transaction() as cur:
+                        cur.execute(INSERT_INTO_GALAXY, ("c", GALAXY_SIZE))
+                    with self.assertRaises(IntegrityError):
+                        with self._dbc.transaction() as cur:
+                            cur.execute(INSERT_INTO_GALAXY, ("d", GALAXY_SIZE))
+                            cur.execute(INSERT_INTO_GALAXY, ("a", GALAXY_SIZE))
+                cur = self._dbc.execute("SELECT name FROM galaxy ORDER BY name")
+                names = cur.fetchall()
+                raise Exception
+        with self.subTest():
+            self.assertEqual([("a", ), ("b", ), ("c", )], names)
+        # the outer transaction discards everything
+        with self.subTest():
+            cur = self._dbc.execute(SELECT_FROM_GALAXY)
+            self.assertEqual(0, len(cur.fetchall()))
+        with self.subTest():
+            self.assertFalse(self._dbc.in_transaction)
 
     def test_context_with_rollback(self):
         log = list()
@@ -537,7 +608,9 @@ class TestImmediateTransactionContext(unittest.TestCase):
             expected = ["BEGIN IMMEDIATE",
                         "INSERT INTO galaxy VALUES ('{}', {})".format(GALAXY_NAME,
                                                                       GALAXY_SIZE),
+                        "SAVEPOINT litedbc_1",
                         "SELECT * FROM galaxy",
+                        "RELEASE SAVEPOINT litedbc_1",
                         "COMMIT"]
             self.assertEqual(expected, log)
 
@@ -611,7 +684,9 @@ class TestExclusiveTransactionContext(unittest.TestCase):
             expected = ["BEGIN EXCLUSIVE",
                         "INSERT INTO galaxy VALUES ('{}', {})".format(GALAXY_NAME,
                                                                       GALAXY_SIZE),
+                        "SAVEPOINT litedbc_1",
                         "SELECT * FROM galaxy",
+                        "RELEASE SAVEPOINT litedbc_1",
                         "COMMIT"]
             self.assertEqual(expected, log)
 
@@ -634,12 +709,14 @@ class TestExclusiveTransactionContext(unittest.TestCase):
             self.assertEqual(expected, log)
 
 
-class TestMatchFunction(unittest.TestCase):
+class TestReadPool(unittest.TestCase):
 
     def setUp(self):
         self._tempdir = tempfile.TemporaryDirectory()
         self._filename = os.path.join(self._tempdir.name, "my.db")
-        self._dbc = LiteDBC(self._filename, init_script=INIT_SCRIPT)
+        self._dbc = LiteDBC(self._filename, init_script=INIT_SCRIPT,
+                            read_pool_size=2)
+        self._dbc.set_journal_mode(JournalMode.WAL)
 
     def tearDown(self):
         try:
@@ -648,48 +725,201 @@ class TestMatchFunction(unittest.TestCase):
             pass
         self._dbc.close()
 
-    def test(self):
-        new_dbc = LiteDBC(self._dbc.filename, init_script=INIT_SCRIPT)
-        r = self._dbc.match(new_dbc)
-        self.assertTrue(r)
+    def test_select_outside_transaction(self):
+        populate_db(self._dbc)
+        log = list()
+        self._dbc.set_trace_callback(lambda query: log.append(query))
+        with self._dbc.cursor() as cur:
+            cur.execute(SELECT_FROM_GALAXY)
+            r = cur.fetchall()
+        with self.subTest():
+            expected = [(GALAXY_NAME, GALAXY_SIZE)]
+            self.assertEqual(expected, r)
+        with self.subTest():
+            # the trace callback is replayed on the pooled connection
+            self.assertEqual([SELECT_FROM_GALAXY], log)
+        with self.subTest():
+            self.assertFalse(self._dbc.in_transaction)
 
+    def test_select_within_transaction(self):
+        with self._dbc.transaction() as cur:
+            cur.execute(INSERT_INTO_GALAXY, (GALAXY_NAME, GALAXY_SIZE))
+            # uncommitted data is only visible from the writer connection
+            cur.execute(SELECT_FROM_GALAXY)
+            r = cur.fetchall()
+            self.assertEqual([(GALAXY_NAME, GALAXY_SIZE)], r)
+
+    def test_pooled_connection_is_readonly(self):
+        conn = self._dbc.read_pool.acquire()
+        try:
+            with self.assertRaises(OperationalError):
+                conn.execute(INSERT_INTO_GALAXY, (GALAXY_NAME, GALAXY_SIZE))
+        finally:
+            self._dbc.read_pool.release(conn)
+
+    def test_exhausted_pool(self):
+        populate_db(self._dbc)
+        cursors = [self._dbc.execute(SELECT_FROM_GALAXY) for _ in range(3)]
+        for cur in cursors:
+            self.assertEqual([(GALAXY_NAME, GALAXY_SIZE)], cur.fetchall())
+            cur.close()
+
+    def test_cursors_not_closed(self):
+        populate_db(self._dbc)
+        # the rows are exhausted
+        for _ in range(5):
+            r = self._dbc.execute(SELECT_FROM_GALAXY).fetchall()
+            self.assertEqual([(GALAXY_NAME, GALAXY_SIZE)], r)
+        with self.subTest():
+            self.assertEqual(1, self._dbc.read_pool.idle_count)
+        # the cursors are dropped before their rows are exhausted
+        for _ in range(5):
+            cur = self._dbc.execute(SELECT_FROM_GALAXY)
+            self.assertEqual((GALAXY_NAME, GALAXY_SIZE), cur.fetchone())
+        del cur
+        with self.subTest():
+            # a cursor is dropped once the next one has borrowed a connection
+            self.assertEqual(2, self._dbc.read_pool.idle_count)
+        with self.subTest():
+            cur = self._dbc.execute(SELECT_FROM_GALAXY)
+            self.assertEqual([(GALAXY_NAME, GALAXY_SIZE)], cur.fetchall())
+            self.assertEqual(("name", "size"), cur.get_columns())
+            self.assertEqual([], cur.fetchall())
+            self.assertIsNone(cur.fetchone())
 
-class TestGetColumnsFunction(unittest.TestCase):
+
+class TestSession(unittest.TestCase):
 
     def setUp(self):
         self._tempdir = tempfile.TemporaryDirectory()
         self._filename = os.path.join(self._tempdir.name, "my.db")
         self._dbc = LiteDBC(self._filename, init_script=INIT_SCRIPT)
+        self._dbc.set_journal_mode(JournalMode.WAL)
 
     def tearDown(self):
-        # the Try/Except is needed here because I can only
-        # benefit from the constructor's "ignore_cleanup_errors=True"
-        # from Python 3.10
         try:
             self._tempdir.cleanup()
         except Exception as e:
             pass
         self._dbc.close()
 
-    def test(self):
-        populate_db(self._dbc)
-        # select from galaxy
+    def test_session_per_thread(self):
+        session = self._dbc.session()
         with self.subTest():
-            with self._dbc.cursor() as cur:
+            self.assertIs(session, self._dbc.session())
+        with self.subTest():
+            sessions = list()
+            thread = threading.Thread(target=lambda: sessions.append(self._dbc.session()))
+            thread.start()
+            thread.join()
+            self.assertIsNot(session, sessions[0])
+
+    def test_isolation(self):
+        started, done = threading.Event(), threading.Event()
+        result = list()
+
+        def reader():
+            started.wait()
+            with self._dbc.session().cursor() as cur:
                 cur.execute(SELECT_FROM_GALAXY)
-                r = cur.get_columns()
-                expected = ("name", "size")
-                self.assertEqual(expected, r)
-        # select from planet
+                result.extend(cur.fetchall())
+            done.set()
+
+        thread = threading.Thread(target=reader)
+        thread.start()
+        with self._dbc.transaction() as cur:
+            cur.execute(INSERT_INTO_GALAXY, (GALAXY_NAME, GALAXY_SIZE))
+            started.set()
+            # the reader isn't blocked by the pending transaction
+            self.assertTrue(done.wait(5))
+        thread.join()
+        self.assertEqual(list(), result)
+
+    def test_session_transaction(self):
+        with self._dbc.session().transaction() as cur:
+            cur.execute(INSERT_INTO_GALAXY, (GALAXY_NAME, GALAXY_SIZE))
+            self.assertFalse(self._dbc.in_transaction)
+        with self._dbc.cursor() as cur:
+            cur.execute(SELECT_FROM_GALAXY)
+            self.assertEqual([(GALAXY_NAME, GALAXY_SIZE)], cur.fetchall())
+
+    def test_closed_dbc(self):
+        session = self._dbc.session()
+        self._dbc.close()
+        with self.subTest():
+            self.assertTrue(session.is_closed)
+        with self.subTest():
+            with self.assertRaises(ProgrammingError):
+                self._dbc.session()
+
+    def test_in_memory_database(self):
+        with self.assertRaises(Error):
+            LiteDBC().session()
+
+
+class TestWriteQueue(unittest.TestCase):
+
+    def setUp(self):
+        self._tempdir = tempfile.TemporaryDirectory()
+        self._filename = os.path.join(self._tempdir.name, "my.db")
+        self._dbc = LiteDBC(self._filename, init_script=INIT_SCRIPT,
+                            write_batch_size=64, write_batch_delay=0.05)
+
+    def tearDown(self):
+        try:
+            self._tempdir.cleanup()
+        except Exception as e:
+            pass
+        self._dbc.close()
+
+    def test_submit(self):
+        futures = list()
+        threads = list()
+        for i in range(4):
+            def target(i=i):
+                for j in range(16):
+                    name = "galaxy-{}-{}".format(i, j)
+                    futures.append(self._dbc.submit(INSERT_INTO_GALAXY, (name, j)))
+            threads.append(threading.Thread(target=target))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        results = [future.result(5) for future in futures]
+        with self.subTest():
+            self.assertEqual(64, len({r.lastrowid for r in results}))
+            self.assertTrue(all(r.rowcount == 1 for r in results))
+        with self.subTest():
+            self.assertEqual(64, self._dbc.write_queue.statements)
+            self.assertLess(self._dbc.write_queue.batches, 64)
+
+    def test_error_isolation(self):
+        future_1 = self._dbc.submit(INSERT_INTO_GALAXY, (GALAXY_NAME, GALAXY_SIZE))
+        future_2 = self._dbc.submit(INSERT_INTO_GALAXY, (GALAXY_NAME, GALAXY_SIZE))
+        future_3 = self._dbc.submit(INSERT_INTO_PLANET, (GALAXY_NAME, PLANET_SIGNATURE))
+        self._dbc.flush(5)
+        with self.subTest():
+            self.assertEqual(1, future_1.result().rowcount)
+            self.assertEqual(1, future_3.result().lastrowid)
+        with self.subTest():
+            with self.assertRaises(IntegrityError):
+                future_2.result()
         with self.subTest():
             with self._dbc.cursor() as cur:
-                cur.execute(SELECT_FROM_PLANET)
-                r = cur.get_columns()
-                expected = ("id", "signature", "galaxy_name")
-                self.assertEqual(expected, r)
+                cur.execute(SELECT_FROM_GALAXY)
+                self.assertEqual([(GALAXY_NAME, GALAXY_SIZE)], cur.fetchall())
+
+    def test_close(self):
+        future = self._dbc.submit(INSERT_INTO_GALAXY, (GALAXY_NAME, GALAXY_SIZE))
+        self._dbc.close()
+        with self.subTest():
+            self.assertEqual(1, future.result(5).lastrowid)
+        with self.subTest():
+            with self.assertRaises(ProgrammingError):
+                self._dbc.submit(INSERT_INTO_GALAXY, (GALAXY_NAME, GALAXY_SIZE))
 
 
-class TestFetchFunction(unittest.TestCase):
+class TestPreparedStatement(unittest.TestCase):
 
     def setUp(self):
         self._tempdir = tempfile.TemporaryDirectory()
@@ -697,40 +927,149 @@ class TestFetchFunction(unittest.TestCase):
         self._dbc = LiteDBC(self._filename, init_script=INIT_SCRIPT)
 
     def tearDown(self):
-        # the Try/Except is needed here because I can only
-        # benefit from the constructor's "ignore_cleanup_errors=True"
-        # from Python 3.10
         try:
             self._tempdir.cleanup()
         except Exception as e:
             pass
         self._dbc.close()
 
-    def test(self):
+    def test_run(self):
+        with self._dbc.prepare(INSERT_INTO_GALAXY) as stmt:
+            with self.subTest():
+                self.assertFalse(stmt.is_readonly)
+            with self.subTest():
+                for i in range(3):
+                    r = stmt.run(("galaxy-{}".format(i), i))
+                    self.assertEqual(i + 1, r.lastrowid)
+            with self.subTest():
+                stmt.run_many([("galaxy-{}".format(i), i) for i in range(3, 6)])
+                self.assertEqual(3, stmt.rowcount)
+
+    def test_query(self):
         populate_db(self._dbc)
-        # select from galaxy
+        stmt = self._dbc.prepare("SELECT size FROM galaxy WHERE name=?")
+        with self.subTest():
+            self.assertTrue(stmt.is_readonly)
+        with self.subTest():
+            self.assertEqual([(GALAXY_SIZE, )], list(stmt.query((GALAXY_NAME, ))))
+            self.assertEqual([], list(stmt.query(("andromeda", ))))
+        with self.subTest():
+            self.assertEqual((GALAXY_SIZE, ), stmt.run((GALAXY_NAME, )).fetchone())
+        stmt.close()
+
+
+class TestFetchColumnsFunction(unittest.TestCase):
+
+    def setUp(self):
+        self._dbc = LiteDBC()
+        with self._dbc.transaction() as cur:
+            cur.execute("CREATE TABLE item (id INTEGER, weight REAL, label TEXT)")
+            cur.executemany("INSERT INTO item VALUES (?, ?, ?)",
+                            [(1, 1, "a"), (2, None, "b"),
+                             (3, 2.5, None), ("x", 4.0, "d")])
+
+    def tearDown(self):
+        self._dbc.close()
+
+    def test_inferred_types(self):
+        with self._dbc.cursor() as cur:
+            cur.execute("SELECT * FROM item")
+            r = cur.fetch_columns(chunk_size=2, use_numpy=False)
+        with self.subTest():
+            self.assertEqual(("id", "weight", "label"), r.names)
+        with self.subTest():
+            # promoted to a list of objects by the last chunk
+            self.assertEqual([1, 2, 3, "x"], r.data[0])
+            self.assertIsNone(r.masks[0])
+        with self.subTest():
+            weight, mask = r.data[1], r.masks[1]
+            self.assertEqual("d", weight.typecode)
+            self.assertEqual([1.0, 2.5, 4.0], [weight[i] for i in (0, 2, 3)])
+            self.assertEqual([0, 1, 0, 0], list(mask))
+        with self.subTest():
+            self.assertEqual(["a", "b", None, "d"], r.data[2])
+            self.assertEqual([0, 0, 1, 0], list(r.masks[2]))
+
+    def test_explicit_types(self):
+        with self._dbc.cursor() as cur:
+            cur.execute("SELECT id, weight FROM item WHERE id <> 'x'")
+            r = cur.fetch_columns(dtypes={"id": "i"}, use_numpy=False)
+            self.assertEqual(array.array("i", [1, 2, 3]), r.data[0])
         with self.subTest():
             with self._dbc.cursor() as cur:
-                cur.execute(SELECT_FROM_GALAXY)
-                r = tuple(cur.fetch())  # 'fetch' is a generator
-                expected = ((GALAXY_NAME, GALAXY_SIZE), )
-                self.assertEqual(expected, r)
-        # select from planet
+                cur.execute("SELECT label FROM item")
+                with self.assertRaises(DataError):
+                    cur.fetch_columns(dtypes=("q", ), use_numpy=False)
+
+
+class TestBulkInsertMethod(unittest.TestCase):
+
+    def setUp(self):
+        self._tempdir = tempfile.TemporaryDirectory()
+        self._filename = os.path.join(self._tempdir.name, "my.db")
+        self._dbc = LiteDBC(self._filename, init_script=INIT_SCRIPT)
+
+    def tearDown(self):
+        try:
+            self._tempdir.cleanup()
+        except Exception as e:
+            pass
+        self._dbc.close()
+
+    def test_bulk_insert(self):
+        log = list()
+        self._dbc.set_trace_callback(lambda query: log.append(query))
+        rows = (("galaxy-{}".format(i), i) for i in range(10))
+        r = self._dbc.bulk_insert("galaxy", ("name", "size"), rows,
+                                  chunk_rows=4, commit_every=6)
+        with self.subTest():
+            self.assertEqual(10, r)
+        with self.subTest():
+            self.assertEqual(2, log.count("BEGIN IMMEDIATE"))
+            self.assertEqual(2, log.count("COMMIT"))
+            inserts = [query for query in log if query.startswith("INSERT")]
+            self.assertEqual(3, len(inserts))
         with self.subTest():
             with self._dbc.cursor() as cur:
-                cur.execute(SELECT_FROM_PLANET)
-                r = tuple(cur.fetch())  # 'fetch' is a generator
-                expected = ((1, PLANET_SIGNATURE, GALAXY_NAME), )
-                self.assertEqual(expected, r)
+                cur.execute("SELECT SUM(size) FROM galaxy")
+                self.assertEqual((45, ), cur.fetchone())
+
+    def test_upsert(self):
+        columns = ("name", "size")
+        self._dbc.bulk_insert("galaxy", columns, [(GALAXY_NAME, 1)])
+        r = self._dbc.bulk_insert("galaxy", columns, [(GALAXY_NAME, GALAXY_SIZE)],
+                                  on_conflict="ON CONFLICT(name) DO UPDATE "
+                                              "SET size=excluded.size")
+        with self.subTest():
+            self.assertEqual(1, r)
+        with self.subTest():
+            with self._dbc.cursor() as cur:
+                cur.execute(SELECT_FROM_GALAXY)
+                self.assertEqual([(GALAXY_NAME, GALAXY_SIZE)], cur.fetchall())
 
+    def test_invalid_rows(self):
+        with self.assertRaises(ProgrammingError):
+            self._dbc.bulk_insert("galaxy", ("name", "size"), [(GALAXY_NAME, )])
+        self.assertEqual((), tuple(self._dbc.execute(SELECT_FROM_GALAXY)))
+
+    def test_invalid_commit_every(self):
+        rows = [(GALAXY_NAME, GALAXY_SIZE)]
+        for commit_every in (0, -1):
+            with self.subTest(commit_every=commit_every):
+                with self.assertRaises(ProgrammingError):
+                    self._dbc.bulk_insert("galaxy", ("name", "size"), rows,
+                                          commit_every=commit_every)
+        self.assertEqual((), tuple(self._dbc.execute(SELECT_FROM_GALAXY)))
 
-class TestBackupMethod(unittest.TestCase):
+
+class TestImportExportMethods(unittest.TestCase):
 
     def setUp(self):
         self._tempdir = tempfile.TemporaryDirectory()
         self._filename = os.path.join(self._tempdir.name, "my.db")
-        self._backup_filename = os.path.join(self._tempdir.name, "backup.db")
         self._dbc = LiteDBC(self._filename, init_script=INIT_SCRIPT)
+        populate_db(self._dbc)
+        self._new_dbc = LiteDBC(init_script=INIT_SCRIPT)
 
     def tearDown(self):
         try:
@@ -738,28 +1077,53 @@ class TestBackupMethod(unittest.TestCase):
         except Exception as e:
             pass
         self._dbc.close()
+        self._new_dbc.close()
+
+    def test_csv(self):
+        filename = os.path.join(self._tempdir.name, "planet.csv")
+        for table in ("galaxy", "planet"):
+            with self.subTest(table=table):
+                r = self._dbc.export_csv(table, filename)
+                self.assertEqual(1, r)
+                r = self._new_dbc.import_csv(table, filename)
+                self.assertEqual(1, r)
+        with self.subTest():
+            r = tuple(self._new_dbc.execute(SELECT_FROM_PLANET))
+            expected = ((1, PLANET_SIGNATURE, GALAXY_NAME), )
+            self.assertEqual(expected, r)
 
-    def test(self):
-        self._dbc.backup(self._backup_filename)
-        new_dbc = LiteDBC(self._backup_filename)
+    def test_jsonl(self):
+        for table in ("galaxy", "planet"):
+            with self.subTest(table=table):
+                file = io.StringIO()
+                self._dbc.export_jsonl(table, file)
+                file.seek(0)
+                self._new_dbc.import_jsonl(table, file)
         with self.subTest():
-            r = self._dbc.match(new_dbc)
-            self.assertTrue(r)
+            r = tuple(self._new_dbc.execute(SELECT_FROM_GALAXY))
+            self.assertEqual(((GALAXY_NAME, GALAXY_SIZE), ), r)
         with self.subTest():
-            with new_dbc.transaction() as cur:
-                cur.execute("DROP TABLE planet")
-                self.assertEqual(-1, cur.rowcount)
-                r = self._dbc.match(new_dbc)
-                self.assertFalse(r)
+            r = tuple(self._new_dbc.execute(SELECT_FROM_PLANET))
+            expected = ((1, PLANET_SIGNATURE, GALAXY_NAME), )
+            self.assertEqual(expected, r)
 
+    def test_export_query(self):
+        file = io.StringIO()
+        r = self._dbc.export_csv("SELECT size FROM galaxy WHERE name=?", file,
+                                 (GALAXY_NAME, ), header=False)
+        with self.subTest():
+            self.assertEqual(1, r)
+        with self.subTest():
+            self.assertEqual("42\r\n", file.getvalue())
 
-class TestDumpMethod(unittest.TestCase):
+
+class TestCachedQueryMethod(unittest.TestCase):
 
     def setUp(self):
         self._tempdir = tempfile.TemporaryDirectory()
         self._filename = os.path.join(self._tempdir.name, "my.db")
-        self._export_filename = os.path.join(self._tempdir.name, "export.sql")
         self._dbc = LiteDBC(self._filename, init_script=INIT_SCRIPT)
+        populate_db(self._dbc)
 
     def tearDown(self):
         try:
@@ -768,21 +1132,1080 @@ class TestDumpMethod(unittest.TestCase):
             pass
         self._dbc.close()
 
-    def test_dump_to_file(self):
-        with self._dbc.transaction() as cur:
-            cur.execute(INSERT_INTO_GALAXY, (GALAXY_NAME, GALAXY_SIZE))
-        self._dbc.dump(self._export_filename)
-        with open(self._export_filename, "r", encoding="utf-8") as file:
-            text = file.read()
-        expected = "\n".join(self._dbc.iterdump()) + "\n"
-        self.assertEqual(expected, text)
+    def test_hit(self):
+        r1 = self._dbc.cached_query(SELECT_FROM_GALAXY)
+        r2 = self._dbc.cached_query("select *  from galaxy -- comment")
+        with self.subTest():
+            self.assertEqual(((GALAXY_NAME, GALAXY_SIZE), ), r1)
+            self.assertIs(r1, r2)
+        with self.subTest():
+            info = self._dbc.query_cache.info()
+            self.assertEqual((1, 1, 1), (info.hits, info.misses, info.entries))
 
-    def test_dump(self):
-        with self._dbc.transaction() as cur:
-            cur.execute(INSERT_INTO_GALAXY, (GALAXY_NAME, GALAXY_SIZE))
-        r = self._dbc.dump()
-        expected = "\n".join(self._dbc.iterdump())
-        self.assertEqual(expected, r)
+    def test_local_write(self):
+        self._dbc.cached_query(SELECT_FROM_GALAXY)
+        self._dbc.execute(INSERT_INTO_GALAXY, ("andromeda", 100))
+        r = self._dbc.cached_query(SELECT_FROM_GALAXY)
+        self.assertEqual(2, len(r))
+
+    def test_write_from_another_connection(self):
+        self._dbc.cached_query(SELECT_FROM_GALAXY)
+        new_dbc = self._dbc.copy()
+        new_dbc.execute(INSERT_INTO_GALAXY, ("andromeda", 100))
+        new_dbc.close()
+        r = self._dbc.cached_query(SELECT_FROM_GALAXY)
+        self.assertEqual(2, len(r))
+
+    def test_ttl_and_params(self):
+        query = "SELECT size FROM galaxy WHERE name=?"
+        with self.subTest():
+            r = self._dbc.cached_query(query, (GALAXY_NAME, ), ttl=0)
+            self.assertEqual(((GALAXY_SIZE, ), ), r)
+            self._dbc.cached_query(query, (GALAXY_NAME, ), ttl=0)
+            self.assertEqual(0, self._dbc.query_cache.hits)
+        with self.subTest():
+            r = self._dbc.cached_query(query, ("andromeda", ))
+            self.assertEqual(tuple(), r)
+
+
+class TestCatalog(unittest.TestCase):
+
+    def setUp(self):
+        self._tempdir = tempfile.TemporaryDirectory()
+        self._filename = os.path.join(self._tempdir.name, "my.db")
+        self._dbc = LiteDBC(self._filename, init_script=INIT_SCRIPT)
+
+    def tearDown(self):
+        try:
+            self._tempdir.cleanup()
+        except Exception as e:
+            pass
+        self._dbc.close()
+
+    def test_reuse(self):
+        catalog = self._dbc.get_catalog()
+        with self.subTest():
+            self.assertIs(catalog, self._dbc.get_catalog())
+        with self.subTest():
+            self.assertEqual(("galaxy", "planet"), catalog.list_tables())
+            self.assertIs(catalog.get_columns("PLANET"),
+                          self._dbc.inspect("planet"))
+
+    def test_schema_change(self):
+        catalog = self._dbc.get_catalog()
+        self._dbc.execute("CREATE INDEX idx_size ON galaxy(size)")
+        with self.subTest():
+            self.assertIsNot(catalog, self._dbc.get_catalog())
+        with self.subTest():
+            info = self._dbc.inspect("galaxy")[1]
+            self.assertEqual((0, 0, 1, False, "c"), info.index_info)
+
+    def test_schema_change_from_another_connection(self):
+        self._dbc.list_tables()
+        new_dbc = self._dbc.copy()
+        new_dbc.execute("CREATE TABLE star (name TEXT)")
+        new_dbc.close()
+        self.assertEqual(("galaxy", "planet", "star"), self._dbc.list_tables())
+
+    def test_rolled_back_schema_change(self):
+        with self._dbc.transaction():
+            self._dbc.execute("CREATE TABLE star (name TEXT)")
+            self.assertIn("star", self._dbc.list_tables())
+            self._dbc.execute("ROLLBACK")
+        self.assertNotIn("star", self._dbc.list_tables())
+
+    def test_temporary_table(self):
+        self._dbc.execute("CREATE TEMP TABLE star (name TEXT UNIQUE)")
+        with self.subTest():
+            self.assertNotIn("star", self._dbc.list_tables())
+        with self.subTest():
+            info = self._dbc.inspect("star")[0]
+            self.assertEqual((0, 0, 0, True, "u"), info.index_info)
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self._tempdir = tempfile.TemporaryDirectory()
+        self._filename = os.path.join(self._tempdir.name, "my.db")
+        self._dbc = LiteDBC(self._filename, init_script=INIT_SCRIPT,
+                            metrics=True)
+        self._dbc.metrics_registry.reset()
+
+    def tearDown(self):
+        self._dbc.close()
+        try:
+            self._tempdir.cleanup()
+        except Exception as e:
+            pass
+
+    def test_statements(self):
+        for i in range(3):
+            self._dbc.execute(INSERT_INTO_GALAXY, ("galaxy-{}".format(i), i))
+        self._dbc.execute("SELECT * FROM galaxy WHERE size > 0").fetchall()
+        self._dbc.execute("SELECT * FROM galaxy WHERE size > 1").fetchall()
+        snapshot = self._dbc.metrics()
+        items = {item.shape: item for item in snapshot.statements}
+        with self.subTest():
+            item = items["INSERT INTO GALAXY VALUES ( ? )"]
+            self.assertEqual((3, 0, 3), (item.count, item.errors, item.rows))
+            self.assertEqual(3, item.latency.count)
+        with self.subTest():
+            item = items["SELECT * FROM GALAXY WHERE SIZE > ?"]
+            self.assertEqual((2, 3), (item.count, item.rows))
+        with self.subTest():
+            self.assertEqual(3, snapshot.lock_wait.count)
+
+    def test_errors_and_transactions(self):
+        with self.assertRaises(IntegrityError):
+            with self._dbc.transaction() as cur:
+                cur.execute(INSERT_INTO_GALAXY, (GALAXY_NAME, GALAXY_SIZE))
+                cur.execute(INSERT_INTO_GALAXY, (GALAXY_NAME, GALAXY_SIZE))
+        populate_db(self._dbc)
+        snapshot = self._dbc.metrics()
+        with self.subTest():
+            self.assertEqual((2, 1), (snapshot.transactions.count,
+                                      snapshot.rollbacks))
+        with self.subTest():
+            item = [item for item in snapshot.statements
+                    if item.shape.startswith("INSERT INTO GALAXY")][0]
+            self.assertEqual((3, 1), (item.count, item.errors))
+
+    def test_exporters(self):
+        populate_db(self._dbc)
+        filename = os.path.join(self._tempdir.name, "litedbc.prom")
+        metrics.PrometheusExporter(filename).export(self._dbc.metrics())
+        with open(filename, "r", encoding="utf-8") as file:
+            text = file.read()
+        with self.subTest():
+            line = ('litedbc_statement_duration_seconds_count'
+                    '{statement="INSERT INTO GALAXY VALUES ( ? )"} 1')
+            self.assertIn(line, text.splitlines())
+        with self.subTest():
+            self.assertIn("litedbc_transaction_duration_seconds_count 1",
+                          text.splitlines())
+        with self.subTest():
+            with self.assertLogs("litedbc") as logs:
+                metrics.LoggingExporter().export(self._dbc.metrics())
+            self.assertEqual(5, len(logs.output))
+
+    def test_disabled(self):
+        dbc = LiteDBC()
+        self.assertIsNone(dbc.metrics())
+
+
+class TestLockProfiling(unittest.TestCase):
+
+    def setUp(self):
+        self._tempdir = tempfile.TemporaryDirectory()
+        self._filename = os.path.join(self._tempdir.name, "my.db")
+        self._dbc = LiteDBC(self._filename, init_script=INIT_SCRIPT,
+                            lock_profiling=True)
+        self._dbc.write_lock.reset()
+
+    def tearDown(self):
+        self._dbc.close()
+        try:
+            self._tempdir.cleanup()
+        except Exception as e:
+            pass
+
+    def test_report(self):
+        with self._dbc.transaction() as cur:
+            cur.execute(INSERT_INTO_GALAXY, (GALAXY_NAME, GALAXY_SIZE))
+            time.sleep(0.02)
+        self._dbc.execute(INSERT_INTO_GALAXY, ("galaxy-2", GALAXY_SIZE))
+        report = self._dbc.lock_report()
+        with self.subTest():
+            self.assertEqual(2, len(report))
+        with self.subTest():
+            # the transaction holds the lock the longest
+            self.assertIn(__file__, report[0].site)
+            self.assertIn("test_report", report[0].site)
+            self.assertEqual(1, report[0].acquisitions)
+            self.assertGreaterEqual(report[0].total_hold, 0.02)
+        with self.subTest():
+            text = self._dbc.write_lock.format_report()
+            self.assertEqual(3, len(text.splitlines()))
+
+    def test_reentrancy(self):
+        lock = self._dbc.write_lock
+        with lock:
+            with lock:
+                self.assertIsNotNone(lock.holder)
+            self.assertIsNotNone(lock.holder)
+        self.assertIsNone(lock.holder)
+        self.assertEqual(1, lock.report()[0].acquisitions)
+        with self.assertRaises(RuntimeError):
+            lock.release()
+
+    def test_wait_time(self):
+        lock = self._dbc.write_lock
+        acquired = threading.Event()
+
+        def hold():
+            with lock:
+                acquired.set()
+                time.sleep(0.05)
+
+        thread = threading.Thread(target=hold)
+        thread.start()
+        acquired.wait()
+        self._dbc.execute(INSERT_INTO_GALAXY, (GALAXY_NAME, GALAXY_SIZE))
+        thread.join()
+        total_wait = sum(item.total_wait for item in lock.report())
+        self.assertGreater(total_wait, 0.01)
+
+    def test_watchdog(self):
+        holders = list()
+        lock = self._dbc.write_lock
+        lock.start_watchdog(threshold=0.02, callback=holders.append,
+                            interval=0.005)
+        with self._dbc.transaction():
+            time.sleep(0.1)
+        lock.stop_watchdog()
+        with self.subTest():
+            # each holding is reported once
+            self.assertEqual(1, len(holders))
+        with self.subTest():
+            holder = holders[0]
+            self.assertEqual(threading.current_thread().name,
+                             holder.thread_name)
+            self.assertGreaterEqual(holder.held_for, 0.02)
+            self.assertEqual("test_watchdog", holder.stack[-1].name)
+
+    def test_disabled(self):
+        dbc = LiteDBC()
+        self.assertIsNone(dbc.lock_report())
+        dbc.close()
+
+
+class TestSlowQueryLog(unittest.TestCase):
+
+    def setUp(self):
+        self._tempdir = tempfile.TemporaryDirectory()
+        self._filename = os.path.join(self._tempdir.name, "my.db")
+        self._jsonl = os.path.join(self._tempdir.name, "slow.jsonl")
+        self._dbc = LiteDBC(self._filename, init_script=INIT_SCRIPT,
+                            slow_query_ms=0, slow_query_file=self._jsonl)
+        populate_db(self._dbc)
+        self._dbc.slow_query_log.clear()
+        os.remove(self._jsonl)
+
+    def tearDown(self):
+        self._dbc.close()
+        try:
+            self._tempdir.cleanup()
+        except Exception as e:
+            pass
+
+    def test_entries(self):
+        self._dbc.execute("SELECT * FROM galaxy WHERE size > ?", (0, )).fetchall()
+        self._dbc.execute("SELECT * FROM galaxy WHERE name = ?",
+                          (GALAXY_NAME, )).fetchone()
+        entries = self._dbc.slow_queries()
+        with self.subTest():
+            self.assertEqual(2, len(entries))
+        with self.subTest():
+            entry = entries[0]
+            self.assertEqual((0, ), entry.params)
+            self.assertEqual(1, entry.rows)
+            self.assertEqual(("galaxy", ), entry.full_scans)
+        with self.subTest():
+            # the primary key index is used
+            self.assertEqual(tuple(), entries[1].full_scans)
+        with self.subTest():
+            entries = self._dbc.slow_queries(full_scans_only=True)
+            self.assertEqual(1, len(entries))
+        with self.subTest():
+            with open(self._jsonl) as file:
+                lines = file.readlines()
+            self.assertEqual(2, len(lines))
+
+    def test_write_statement(self):
+        self._dbc.execute(INSERT_INTO_GALAXY, ("galaxy-2", GALAXY_SIZE))
+        entry = self._dbc.slow_queries()[-1]
+        self.assertEqual(INSERT_INTO_GALAXY, entry.sql)
+        self.assertEqual(1, entry.rows)
+
+    def test_threshold_and_redaction(self):
+        dbc = LiteDBC(self._filename, slow_query_ms=60000,
+                      slow_query_redact=True)
+        dbc.execute("SELECT * FROM galaxy").fetchall()
+        with self.subTest():
+            self.assertEqual(tuple(), dbc.slow_queries())
+        with self.subTest():
+            entry = dbc.slow_query_log.record("SELECT * FROM galaxy "
+                                              "WHERE name = ?",
+                                              ("secret", ), 61.0, 1)
+            self.assertEqual(("?", ), entry.params)
+        dbc.close()
+
+    def test_disabled(self):
+        dbc = LiteDBC()
+        self.assertIsNone(dbc.slow_queries())
+        dbc.close()
+
+
+class TestIndexAdvisor(unittest.TestCase):
+
+    def setUp(self):
+        self._tempdir = tempfile.TemporaryDirectory()
+        self._filename = os.path.join(self._tempdir.name, "my.db")
+        self._dbc = LiteDBC(self._filename, init_script=INIT_SCRIPT,
+                            metrics=True)
+        populate_db(self._dbc)
+        self._dbc.metrics_registry.reset()
+
+    def tearDown(self):
+        self._dbc.close()
+        try:
+            self._tempdir.cleanup()
+        except Exception as e:
+            pass
+
+    def test_observed_workload(self):
+        for i in range(3):
+            self._dbc.execute(DELETE_PLANETS, ("galaxy-{}".format(i), ))
+        self._dbc.execute("SELECT * FROM galaxy WHERE size > ?",
+                          (0, )).fetchall()
+        # the primary key is already indexed
+        self._dbc.execute("SELECT * FROM galaxy WHERE name = ?",
+                          (GALAXY_NAME, )).fetchall()
+        candidates = self._dbc.advise_indexes()
+        with self.subTest():
+            self.assertEqual(2, len(candidates))
+        with self.subTest():
+            candidate = candidates[0]
+            self.assertEqual(("planet", ("galaxy_name", ), None, "single", 3),
+                             (candidate.table, candidate.columns,
+                              candidate.where, candidate.kind,
+                              candidate.score))
+            self.assertIsNone(candidate.scans_removed)
+        with self.subTest():
+            self.assertEqual(("galaxy", ("size", )),
+                             (candidates[1].table, candidates[1].columns))
+
+    def test_what_if(self):
+        workload = {"SELECT * FROM planet WHERE galaxy_name = ? "
+                    "ORDER BY signature": 5,
+                    "SELECT * FROM planet WHERE signature IS NOT NULL": 2}
+        candidates = self._dbc.advise_indexes(workload, what_if=True)
+        with self.subTest():
+            self.assertEqual(2, len(candidates))
+        with self.subTest():
+            candidate = candidates[0]
+            self.assertEqual(("galaxy_name", "signature"), candidate.columns)
+            self.assertEqual("composite", candidate.kind)
+            self.assertEqual(5, candidate.scans_removed)
+            self.assertIn("SCAN", candidate.plans_before[0][0])
+            self.assertIn("idx_planet_galaxy_name_signature",
+                          candidate.plans_after[0][0])
+        with self.subTest():
+            self.assertEqual("partial", candidates[1].kind)
+        with self.subTest():
+            # the candidates were created on a copy of the schema
+            indexes = self._dbc.execute("SELECT name FROM sqlite_master "
+                                        "WHERE type = 'index' AND name "
+                                        "LIKE 'idx_%'").fetchall()
+            self.assertEqual(list(), indexes)
+
+    def test_no_workload(self):
+        dbc = LiteDBC()
+        with self.assertRaises(ProgrammingError):
+            dbc.advise_indexes()
+        dbc.close()
+
+
+class TestProfiles(unittest.TestCase):
+
+    def setUp(self):
+        self._tempdir = tempfile.TemporaryDirectory()
+        self._filename = os.path.join(self._tempdir.name, "my.db")
+
+    def tearDown(self):
+        try:
+            self._tempdir.cleanup()
+        except Exception as e:
+            pass
+
+    def test_construction(self):
+        dbc = LiteDBC(self._filename, init_script=INIT_SCRIPT,
+                      profile=Profile.READ_MOSTLY, read_pool_size=1)
+        with self.subTest():
+            self.assertEqual(JournalMode.WAL, dbc.get_journal_mode())
+        with self.subTest():
+            self.assertEqual(8192, get_pragma(dbc, "page_size"))
+            self.assertEqual(-131072, get_pragma(dbc, "cache_size"))
+        with self.subTest():
+            # pooled connections get the profile too
+            cur = dbc.execute("SELECT cache_size FROM pragma_cache_size")
+            self.assertEqual([(-131072, )], cur.fetchall())
+            cur.close()
+        with self.subTest():
+            new_dbc = dbc.copy()
+            self.assertEqual(-131072, get_pragma(new_dbc, "cache_size"))
+            new_dbc.close()
+        dbc.close()
+
+    def test_context_manager(self):
+        dbc = LiteDBC(self._filename, init_script=INIT_SCRIPT)
+        cache_size = get_pragma(dbc, "cache_size")
+        with dbc.profile("bulk_load"):
+            with self.subTest():
+                self.assertEqual(JournalMode.MEMORY, dbc.get_journal_mode())
+                self.assertEqual(0, get_pragma(dbc, "synchronous"))
+                self.assertEqual(-262144, get_pragma(dbc, "cache_size"))
+            populate_db(dbc)
+        with self.subTest():
+            self.assertEqual(JournalMode.DELETE, dbc.get_journal_mode())
+            self.assertEqual(2, get_pragma(dbc, "synchronous"))
+            self.assertEqual(cache_size, get_pragma(dbc, "cache_size"))
+        with self.subTest():
+            with dbc.profile({"cache_size": 100}):
+                self.assertEqual(100, get_pragma(dbc, "cache_size"))
+            self.assertEqual(cache_size, get_pragma(dbc, "cache_size"))
+        for profile in (Profile.OLTP, Profile.READ_MOSTLY):
+            with self.subTest(profile=profile):
+                with dbc.profile(profile):
+                    self.assertEqual(JournalMode.WAL, dbc.get_journal_mode())
+                    self.assertEqual(1, get_pragma(dbc, "synchronous"))
+                    dbc.execute("UPDATE galaxy SET size=size+1").close()
+                self.assertEqual(JournalMode.DELETE, dbc.get_journal_mode())
+                self.assertEqual(2, get_pragma(dbc, "synchronous"))
+                self.assertEqual(cache_size, get_pragma(dbc, "cache_size"))
+        with self.subTest():
+            # a database already in WAL mode stays in WAL mode
+            dbc.set_journal_mode(JournalMode.WAL)
+            with dbc.profile(Profile.BULK_LOAD):
+                self.assertEqual(JournalMode.WAL, dbc.get_journal_mode())
+            self.assertEqual(JournalMode.WAL, dbc.get_journal_mode())
+        dbc.close()
+
+    def test_invalid_profile(self):
+        with self.assertRaises(Error):
+            LiteDBC(profile="fast")
+
+
+class TestCheckpointManager(unittest.TestCase):
+
+    def setUp(self):
+        self._tempdir = tempfile.TemporaryDirectory()
+        self._filename = os.path.join(self._tempdir.name, "my.db")
+        self._dbc = LiteDBC(self._filename, init_script=INIT_SCRIPT)
+        self._dbc.set_journal_mode(JournalMode.WAL)
+
+    def tearDown(self):
+        self._dbc.close()
+        try:
+            self._tempdir.cleanup()
+        except Exception as e:
+            pass
+
+    def test_size_threshold(self):
+        manager = self._dbc.checkpoint_manager(interval=3600, wal_size=1,
+                                               poll=0.01)
+        with self.subTest():
+            # writers don't checkpoint anymore
+            self.assertEqual(0, get_pragma(self._dbc, "wal_autocheckpoint"))
+        populate_db(self._dbc)
+        deadline = time.monotonic() + 5
+        while manager.info().checkpoints == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        info = manager.info()
+        with self.subTest():
+            self.assertEqual("PASSIVE", info.last_mode)
+            self.assertGreater(info.frames, 0)
+            self.assertEqual(0, info.failures)
+        manager.close()
+        with self.subTest():
+            self.assertEqual(1000, get_pragma(self._dbc, "wal_autocheckpoint"))
+
+    def test_run(self):
+        manager = self._dbc.checkpoint_manager(interval=3600)
+        populate_db(self._dbc)
+        busy, log, checkpointed = manager.run("TRUNCATE")
+        with self.subTest():
+            self.assertEqual((0, 0, 0), (busy, log, checkpointed))
+            self.assertEqual(0, manager.info().wal_size)
+        with self.subTest():
+            self.assertEqual(1, manager.info().escalations)
+        with self.subTest():
+            with self.assertRaises(ProgrammingError):
+                self._dbc.checkpoint_manager()
+        with self.subTest():
+            with self.assertRaises(ProgrammingError):
+                manager.run("FAST")
+
+    def test_requires_wal(self):
+        dbc = LiteDBC()
+        with self.assertRaises(ProgrammingError):
+            dbc.checkpoint_manager()
+        dbc.close()
+
+
+class TestRetryPolicy(unittest.TestCase):
+
+    def setUp(self):
+        self._tempdir = tempfile.TemporaryDirectory()
+        self._filename = os.path.join(self._tempdir.name, "my.db")
+        self._policy = RetryPolicy(retries=100, delay=0.005, max_delay=0.01,
+                                   max_wait=5)
+        self._dbc = LiteDBC(self._filename, init_script=INIT_SCRIPT,
+                            timeout=0, retry_policy=self._policy)
+        # connection of another process
+        self._other = sqlite.connect(self._filename, isolation_level=None,
+                                     check_same_thread=False)
+
+    def tearDown(self):
+        self._other.close()
+        self._dbc.close()
+        try:
+            self._tempdir.cleanup()
+        except Exception as e:
+            pass
+
+    def _lock_database(self, duration):
+        self._other.execute("BEGIN EXCLUSIVE")
+        timer = threading.Timer(duration,
+                                lambda: self._other.execute("COMMIT"))
+        timer.start()
+        return timer
+
+    def test_statement(self):
+        timer = self._lock_database(0.05)
+        self._dbc.execute(INSERT_INTO_GALAXY, (GALAXY_NAME, GALAXY_SIZE))
+        timer.join()
+        info = self._policy.info()
+        with self.subTest():
+            self.assertGreater(info.retries, 0)
+            self.assertGreater(info.busy_wait, 0)
+            self.assertEqual(0, info.failures)
+        with self.subTest():
+            cur = self._dbc.execute(SELECT_FROM_GALAXY)
+            self.assertEqual(1, len(cur.fetchall()))
+
+    def test_run_transaction(self):
+        calls = list()
+
+        def body(cur):
+            calls.append(None)
+            cur.execute(SELECT_FROM_GALAXY).fetchall()
+            if len(calls) == 1:
+                # another writer takes the database before the lock upgrade
+                self._other.execute("BEGIN IMMEDIATE")
+                self._other.execute(INSERT_INTO_GALAXY, ("other", GALAXY_SIZE))
+                threading.Timer(0.05,
+                                lambda: self._other.execute("COMMIT")).start()
+            cur.execute(INSERT_INTO_GALAXY, (GALAXY_NAME, GALAXY_SIZE))
+            return "done"
+
+        result = self._dbc.run_transaction(body)
+        with self.subTest():
+            self.assertEqual("done", result)
+            self.assertGreater(len(calls), 1)
+        with self.subTest():
+            cur = self._dbc.execute(SELECT_FROM_GALAXY)
+            self.assertEqual(2, len(cur.fetchall()))
+
+    def test_give_up(self):
+        self._other.execute("BEGIN EXCLUSIVE")
+        with self.assertRaises(OperationalError):
+            self._dbc.run_transaction(lambda cur: cur.execute(SELECT_FROM_GALAXY),
+                                      retries=2)
+        self._other.execute("COMMIT")
+        info = self._policy.info()
+        with self.subTest():
+            self.assertEqual((2, 1), (info.retries, info.failures))
+        with self.subTest():
+            # the write lock was released
+            self._dbc.execute(INSERT_INTO_GALAXY, (GALAXY_NAME, GALAXY_SIZE))
+
+
+class TestAutoTransactionMode(unittest.TestCase):
+
+    def setUp(self):
+        self._tempdir = tempfile.TemporaryDirectory()
+        self._filename = os.path.join(self._tempdir.name, "my.db")
+        self._dbc = LiteDBC(self._filename, init_script=INIT_SCRIPT)
+        # connection of another process
+        self._other = sqlite.connect(self._filename, isolation_level=None,
+                                     timeout=0)
+
+    def tearDown(self):
+        self._other.close()
+        self._dbc.close()
+        try:
+            self._tempdir.cleanup()
+        except Exception as e:
+            pass
+
+    def _is_write_locked(self):
+        try:
+            self._other.execute("BEGIN IMMEDIATE")
+        except OperationalError:
+            return True
+        self._other.execute("ROLLBACK")
+        return False
+
+    def test_learning(self):
+        locked = list()
+        for i in range(3):
+            with self._dbc.transaction(TransactionMode.AUTO) as cur:
+                locked.append(self._is_write_locked())
+                cur.execute(INSERT_INTO_GALAXY, (str(i), GALAXY_SIZE))
+        with self.subTest():
+            # DEFERRED first, IMMEDIATE once the call site is known to write
+            self.assertEqual([False, True, True], locked)
+        with self.subTest():
+            self.assertEqual(1, len(self._dbc.write_sites))
+            site = tuple(self._dbc.write_sites)[0]
+            self.assertIn("test_learning", site)
+
+    def test_ddl(self):
+        locked = list()
+        for i in range(3):
+            with self._dbc.transaction(TransactionMode.AUTO) as cur:
+                locked.append(self._is_write_locked())
+                # DDL doesn't change total_changes
+                cur.execute("CREATE TABLE t{} (x INTEGER)".format(i))
+        with self.subTest():
+            self.assertEqual([False, True, True], locked)
+        with self.subTest():
+            self.assertEqual(1, len(self._dbc.write_sites))
+
+    def test_read_only_site(self):
+        locked = list()
+        for _ in range(2):
+            with self._dbc.transaction(TransactionMode.AUTO) as cur:
+                locked.append(self._is_write_locked())
+                cur.execute(SELECT_FROM_GALAXY).fetchall()
+        with self.subTest():
+            self.assertEqual([False, False], locked)
+        with self.subTest():
+            self.assertEqual(frozenset(), self._dbc.write_sites)
+
+    def test_write_transaction(self):
+        with self._dbc.write_transaction() as cur:
+            locked = self._is_write_locked()
+            cur.execute(INSERT_INTO_GALAXY, (GALAXY_NAME, GALAXY_SIZE))
+        with self.subTest():
+            self.assertTrue(locked)
+        with self.subTest():
+            cur = self._dbc.execute(SELECT_FROM_GALAXY)
+            self.assertEqual(1, len(cur.fetchall()))
+
+    def test_run_transaction(self):
+        locked = list()
+
+        def body(cur):
+            locked.append(self._is_write_locked())
+            cur.execute(INSERT_INTO_GALAXY, (str(len(locked)), GALAXY_SIZE))
+
+        for _ in range(2):
+            self._dbc.run_transaction(body,
+                                      transaction_mode=TransactionMode.AUTO)
+        self.assertEqual([False, True], locked)
+
+
+class TestMatchFunction(unittest.TestCase):
+
+    def setUp(self):
+        self._tempdir = tempfile.TemporaryDirectory()
+        self._filename = os.path.join(self._tempdir.name, "my.db")
+        self._dbc = LiteDBC(self._filename, init_script=INIT_SCRIPT)
+
+    def tearDown(self):
+        try:
+            self._tempdir.cleanup()
+        except Exception as e:
+            pass
+        self._dbc.close()
+
+    def test(self):
+        new_dbc = LiteDBC(self._dbc.filename, init_script=INIT_SCRIPT)
+        r = self._dbc.match(new_dbc)
+        self.assertTrue(r)
+
+    def test_match_many(self):
+        dbcs = [LiteDBC(init_script=INIT_SCRIPT) for _ in range(3)]
+        dbcs[1].execute("CREATE TABLE star (name TEXT)")
+        dbcs[2].execute("ALTER TABLE galaxy ADD COLUMN age INTEGER")
+        with self.subTest():
+            self.assertEqual(self._dbc.schema_fingerprint(),
+                             dbcs[0].schema_fingerprint())
+            self.assertNotEqual(self._dbc.schema_fingerprint(),
+                                dbcs[1].schema_fingerprint())
+        with self.subTest():
+            r = misc.match_many(self._dbc, dbcs, workers=2)
+            self.assertEqual((True, True, False), r)
+
+
+class TestGetCallSiteFunction(unittest.TestCase):
+
+    def test_sibling_directory(self):
+        # frames of a sibling directory such as litedbc_ext aren't skipped
+        filename = os.path.join(misc.PACKAGE_DIR + "_ext", "module.py")
+        code = compile("site = get_call_site()", filename, "exec")
+        namespace = {"get_call_site": misc.get_call_site}
+        exec(code, namespace)
+        self.assertEqual("{}:1 in <module>".format(filename),
+                         namespace["site"])
+
+
+class TestGetColumnsFunction(unittest.TestCase):
+
+    def setUp(self):
+        self._tempdir = tempfile.TemporaryDirectory()
+        self._filename = os.path.join(self._tempdir.name, "my.db")
+        self._dbc = LiteDBC(self._filename, init_script=INIT_SCRIPT)
+
+    def tearDown(self):
+        # the Try/Except is needed here because I can only
+        # benefit from the constructor's "ignore_cleanup_errors=True"
+        # from Python 3.10
+        try:
+            self._tempdir.cleanup()
+        except Exception as e:
+            pass
+        self._dbc.close()
+
+    def test(self):
+        populate_db(self._dbc)
+        # select from galaxy
+        with self.subTest():
+            with self._dbc.cursor() as cur:
+                cur.execute(SELECT_FROM_GALAXY)
+                r = cur.get_columns()
+                expected = ("name", "size")
+                self.assertEqual(expected, r)
+        # select from planet
+        with self.subTest():
+            with self._dbc.cursor() as cur:
+                cur.execute(SELECT_FROM_PLANET)
+                r = cur.get_columns()
+                expected = ("id", "signature", "galaxy_name")
+                self.assertEqual(expected, r)
+
+
+class TestFetchFunction(unittest.TestCase):
+
+    def setUp(self):
+        self._tempdir = tempfile.TemporaryDirectory()
+        self._filename = os.path.join(self._tempdir.name, "my.db")
+        self._dbc = LiteDBC(self._filename, init_script=INIT_SCRIPT)
+
+    def tearDown(self):
+        # the Try/Except is needed here because I can only
+        # benefit from the constructor's "ignore_cleanup_errors=True"
+        # from Python 3.10
+        try:
+            self._tempdir.cleanup()
+        except Exception as e:
+            pass
+        self._dbc.close()
+
+    def test(self):
+        populate_db(self._dbc)
+        # select from galaxy
+        with self.subTest():
+            with self._dbc.cursor() as cur:
+                cur.execute(SELECT_FROM_GALAXY)
+                r = tuple(cur.fetch())  # 'fetch' is a generator
+                expected = ((GALAXY_NAME, GALAXY_SIZE), )
+                self.assertEqual(expected, r)
+        # select from planet
+        with self.subTest():
+            with self._dbc.cursor() as cur:
+                cur.execute(SELECT_FROM_PLANET)
+                r = tuple(cur.fetch())  # 'fetch' is a generator
+                expected = ((1, PLANET_SIGNATURE, GALAXY_NAME), )
+                self.assertEqual(expected, r)
+
+
+class TestBackupMethod(unittest.TestCase):
+
+    def setUp(self):
+        self._tempdir = tempfile.TemporaryDirectory()
+        self._filename = os.path.join(self._tempdir.name, "my.db")
+        self._backup_filename = os.path.join(self._tempdir.name, "backup.db")
+        self._dbc = LiteDBC(self._filename, init_script=INIT_SCRIPT)
+
+    def tearDown(self):
+        try:
+            self._tempdir.cleanup()
+        except Exception as e:
+            pass
+        self._dbc.close()
+
+    def test(self):
+        self._dbc.backup(self._backup_filename)
+        new_dbc = LiteDBC(self._backup_filename)
+        with self.subTest():
+            r = self._dbc.match(new_dbc)
+            self.assertTrue(r)
+        with self.subTest():
+            with new_dbc.transaction() as cur:
+                cur.execute("DROP TABLE planet")
+                self.assertEqual(-1, cur.rowcount)
+                r = self._dbc.match(new_dbc)
+                self.assertFalse(r)
+
+
+class TestBackupManager(unittest.TestCase):
+
+    def setUp(self):
+        self._tempdir = tempfile.TemporaryDirectory()
+        self._filename = os.path.join(self._tempdir.name, "my.db")
+        self._directory = os.path.join(self._tempdir.name, "backups")
+        self._dbc = LiteDBC(self._filename, init_script=INIT_SCRIPT)
+        populate_db(self._dbc)
+
+    def tearDown(self):
+        self._dbc.close()
+        try:
+            self._tempdir.cleanup()
+        except Exception as e:
+            pass
+
+    def test_generations(self):
+        manager = BackupManager(self._dbc, self._directory, pages=1,
+                                pause=0, generations=2, check="quick_check")
+        filenames = [manager.run() for _ in range(3)]
+        with self.subTest():
+            self.assertEqual(tuple(filenames[1:]), manager.list_generations())
+        with self.subTest():
+            info = manager.info()
+            self.assertEqual((3, 0, filenames[-1]),
+                             (info.backups, info.failures, info.last_filename))
+            self.assertGreater(manager.pages, 1)
+        with self.subTest():
+            new_dbc = LiteDBC(filenames[-1])
+            self.assertEqual(self._dbc.dump(), new_dbc.dump())
+            new_dbc.close()
+
+    def test_background_thread(self):
+        manager = self._dbc.backup_manager(self._directory, interval=0.01)
+        deadline = time.monotonic() + 5
+        while len(manager.list_generations()) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self._dbc.close()
+        with self.subTest():
+            self.assertTrue(manager.is_closed)
+        with self.subTest():
+            self.assertGreaterEqual(manager.info().backups, 2)
+            self.assertLessEqual(len(manager.list_generations()), 3)
+
+
+class TestDumpMethod(unittest.TestCase):
+
+    def setUp(self):
+        self._tempdir = tempfile.TemporaryDirectory()
+        self._filename = os.path.join(self._tempdir.name, "my.db")
+        self._export_filename = os.path.join(self._tempdir.name, "export.sql")
+        self._dbc = LiteDBC(self._filename, init_script=INIT_SCRIPT)
+
+    def tearDown(self):
+        try:
+            self._tempdir.cleanup()
+        except Exception as e:
+            pass
+        self._dbc.close()
+
+    def test_iter_statements(self):
+        text = ("CREATE TRIGGER t AFTER INSERT ON galaxy BEGIN\n"
+                "    DELETE FROM planet;\n"
+                "END;\n"
+                "INSERT INTO galaxy VALUES\n"
+                "    ('a;b', 1),\n"
+                "    ('c', 2); -- comment\n")
+        statements = list(dump.iter_statements(io.StringIO(text)))
+        with self.subTest():
+            self.assertEqual(2, len(statements))
+            self.assertTrue(statements[1].startswith("INSERT"))
+        with self.subTest():
+            with self.assertRaises(ProgrammingError):
+                list(dump.iter_statements(io.StringIO("SELECT\n1\n")))
+
+    def test_concurrent_writer(self):
+        # default journal mode (DELETE) and a short busy timeout
+        filename = os.path.join(self._tempdir.name, "other.db")
+        dbc = LiteDBC(filename, init_script=INIT_SCRIPT, timeout=0.2)
+        populate_db(dbc)
+        started = threading.Event()
+        failures = list()
+
+        class SlowFile(io.StringIO):
+            def write(self, s):
+                if not started.is_set():
+                    started.set()
+                    time.sleep(0.5)
+                return super().write(s)
+
+        def insert():
+            started.wait()
+            try:
+                dbc.execute(INSERT_INTO_GALAXY, ("andromeda", 100)).close()
+            except Exception as e:
+                failures.append(e)
+
+        thread = threading.Thread(target=insert)
+        thread.start()
+        file = SlowFile()
+        for workers in (1, 2):
+            with self.subTest(workers=workers):
+                dbc.dump(file, workers=workers)
+        thread.join()
+        with self.subTest():
+            # the writer waited for the dump instead of failing
+            self.assertEqual([], failures)
+        with self.subTest():
+            self.assertNotIn("andromeda", file.getvalue().split("COMMIT;")[0])
+            cur = dbc.execute(SELECT_FROM_GALAXY)
+            self.assertEqual(2, len(cur.fetchall()))
+        dbc.close()
+
+    def test_dump_to_file(self):
+        with self._dbc.transaction() as cur:
+            cur.execute(INSERT_INTO_GALAXY, (GALAXY_NAME, GALAXY_SIZE))
+        self._dbc.dump(self._export_filename)
+        with open(self._export_filename, "r", encoding="utf-8") as file:
+            text = file.read()
+        expected = "\n".join(self._dbc.iterdump()) + "\n"
+        self.assertEqual(expected, text)
+
+    def test_dump(self):
+        with self._dbc.transaction() as cur:
+            cur.execute(INSERT_INTO_GALAXY, (GALAXY_NAME, GALAXY_SIZE))
+        r = self._dbc.dump()
+        expected = "\n".join(self._dbc.iterdump())
+        self.assertEqual(expected, r)
+
+    def test_parallel_dump(self):
+        populate_db(self._dbc)
+        self._dbc.execute("CREATE INDEX idx_size ON galaxy(size)")
+        r = self._dbc.dump(workers=3)
+        expected = "\n".join(self._dbc.iterdump())
+        self.assertEqual(expected, r)
+
+    def test_dump_while_writing(self):
+        populate_db(self._dbc)
+        self._dbc.set_journal_mode(JournalMode.WAL)
+        file = io.StringIO()
+        with self._dbc.transaction() as cur:
+            cur.execute(INSERT_INTO_GALAXY, ("andromeda", 100))
+            # the uncommitted row isn't part of the dump
+            self._dbc.dump(file, workers=2)
+        self.assertEqual(1, file.getvalue().count("INSERT INTO \"galaxy\""))
+
+    def test_compressed_dump_and_restore(self):
+        populate_db(self._dbc)
+        for extension in (".gz", ".xz"):
+            filename = self._export_filename + extension
+            with self.subTest(extension):
+                self._dbc.dump(filename, workers=2)
+                new_dbc = LiteDBC()
+                self.assertEqual(8, new_dbc.restore(filename))
+                self.assertEqual(self._dbc.dump(), new_dbc.dump())
+                new_dbc.close()
+
+    def test_bulk_load_restore(self):
+        populate_db(self._dbc)
+        self._dbc.execute("CREATE INDEX idx_size ON galaxy(size)")
+        self._dbc.dump(self._export_filename)
+        new_dbc = LiteDBC(os.path.join(self._tempdir.name, "new.db"))
+        new_dbc.execute("PRAGMA cache_size=-1000")
+        calls = list()
+        progress = lambda n, size: calls.append(n)
+        with self.subTest():
+            r = new_dbc.restore(self._export_filename, progress=progress,
+                                progress_every=4)
+            self.assertEqual(9, r)
+            self.assertEqual([4, 9], calls)
+            self.assertEqual(self._dbc.dump(), new_dbc.dump())
+        with self.subTest():
+            r = new_dbc.execute("SELECT * FROM pragma_cache_size, "
+                                "pragma_synchronous, pragma_journal_mode")
+            self.assertEqual((-1000, 2, "delete"), r.fetchone())
+        new_dbc.close()
+
+    def test_restore_failure(self):
+        file = io.StringIO("BEGIN TRANSACTION;\n"
+                           "CREATE TABLE star (name TEXT);\n"
+                           "INSERT INTO star VALUES('sun'")
+        new_dbc = LiteDBC()
+        with self.assertRaises(ProgrammingError):
+            new_dbc.restore(file)
+        self.assertFalse(new_dbc.in_transaction)
+        self.assertEqual(tuple(), new_dbc.list_tables())
+
+
+class TestBlobStreams(unittest.TestCase):
+
+    def setUp(self):
+        self._tempdir = tempfile.TemporaryDirectory()
+        self._filename = os.path.join(self._tempdir.name, "my.db")
+        self._dbc = LiteDBC(self._filename, init_script=INIT_SCRIPT)
+        populate_db(self._dbc)
+        self._data = bytes(range(256)) * 1000
+
+    def tearDown(self):
+        self._dbc.close()
+        try:
+            self._tempdir.cleanup()
+        except Exception as e:
+            pass
+
+    def test_write_then_read(self):
+        with self._dbc.blob_writer("planet", "signature", 1,
+                                   size=len(self._data)) as writer:
+            shutil.copyfileobj(io.BytesIO(self._data), writer, 1000)
+        with self.subTest():
+            self.assertFalse(self._dbc.in_transaction)
+        with self._dbc.blob_reader("planet", "signature", 1) as reader:
+            with self.subTest():
+                buffer = bytearray(100)
+                self.assertEqual(100, reader.readinto(memoryview(buffer)))
+                self.assertEqual(self._data[:100], buffer)
+            with self.subTest():
+                chunks = list(reader.chunks(4096))
+                self.assertEqual(4096, len(chunks[0]))
+                self.assertEqual(self._data[100:], b"".join(chunks))
+            with self.subTest():
+                reader.seek(0)
+                file = io.BytesIO()
+                shutil.copyfileobj(reader, file)
+                self.assertEqual(self._data, file.getvalue())
+
+    def test_failed_write(self):
+        with self.subTest():
+            with self.assertRaises(DataError):
+                with self._dbc.blob_writer("planet", "signature", 1,
+                                           size=10) as writer:
+                    writer.write(b"0123456789")
+                    writer.write(b"0")
+        with self.subTest():
+            self.assertFalse(self._dbc.in_transaction)
+            r = self._dbc.execute("SELECT signature FROM planet").fetchone()
+            self.assertEqual((PLANET_SIGNATURE, ), r)
+        with self.subTest():
+            with self.assertRaises(Error):
+                self._dbc.blob_writer("planet", "signature", 42, size=10)
+            self.assertFalse(self._dbc.in_transaction)
+
+    def test_unclosed_writer(self):
+        writer = self._dbc.blob_writer("planet", "signature", 1, size=10)
+        writer.write(b"0123456789")
+        with self.assertWarns(ResourceWarning):
+            del writer
+        with self.subTest():
+            # the writes are rolled back, not committed
+            self.assertFalse(self._dbc.in_transaction)
+            r = self._dbc.execute("SELECT signature FROM planet").fetchone()
+            self.assertEqual((PLANET_SIGNATURE, ), r)
+        with self.subTest():
+            # the write lock was released
+            self._dbc.execute(INSERT_INTO_GALAXY, ("andromeda", 100)).close()
 
 
 class TestCopyDbcMethod(unittest.TestCase):
@@ -8,13 +8,22 @@ class TestImports(unittest.TestCase):
             # import classes
             from litedbc import LiteDBC
             from litedbc import ColumnInfo
+            from litedbc import Catalog
             from litedbc import Transaction
             from litedbc import Cursor
+            from litedbc import Session
+            from litedbc import PreparedStatement
+            from litedbc import WriteQueue
+            from litedbc import WriteResult
+            from litedbc import BackupManager
+            from litedbc import CheckpointManager
+            from litedbc import RetryPolicy
             # import enums
             from litedbc import TransactionMode
             from litedbc import LockingMode
             from litedbc import JournalMode
             from litedbc import SyncMode
+            from litedbc import Profile
             # import errors
             from litedbc.errors import Error
             from litedbc.errors import InterfaceError
@@ -0,0 +1,64 @@
+import unittest
+from litedbc import statement
+
+
+class TestStmtInfo(unittest.TestCase):
+
+    def test_readonly_statements(self):
+        statements = ("SELECT * FROM galaxy",
+                      "  \n select 1",
+                      "-- comment\n/* block\ncomment */ SELECT 1",
+                      "VALUES (1, 2), (3, 4)",
+                      "WITH t(x) AS (SELECT 1) SELECT x FROM t",
+                      "WITH RECURSIVE t AS (SELECT 1 UNION SELECT 2) SELECT * FROM t",
+                      "EXPLAIN QUERY PLAN DELETE FROM galaxy",
+                      "PRAGMA journal_mode",
+                      "PRAGMA main.table_info('galaxy')",
+                      "PRAGMA quick_check;")
+        for sql in statements:
+            with self.subTest(sql=sql):
+                self.assertTrue(statement.is_readonly(sql))
+
+    def test_writing_statements(self):
+        statements = ("INSERT INTO galaxy VALUES (?, ?)",
+                      "/* SELECT */ UPDATE galaxy SET size=1",
+                      "WITH t(x) AS (SELECT 1) INSERT INTO galaxy SELECT x, x FROM t",
+                      "WITH \"select\" AS (SELECT 1) DELETE FROM galaxy",
+                      "PRAGMA journal_mode=WAL",
+                      "PRAGMA cache_size(100)",
+                      "PRAGMA optimize",
+                      "BEGIN IMMEDIATE",
+                      "CREATE TABLE t (x)",
+                      "")
+        for sql in statements:
+            with self.subTest(sql=sql):
+                self.assertFalse(statement.is_readonly(sql))
+
+    def test_stmt_info(self):
+        with self.subTest():
+            r = statement.get_stmt_info("WITH t AS (VALUES (1)) SELECT * FROM t")
+            self.assertEqual(statement.StmtInfo("SELECT", True, True), r)
+        with self.subTest():
+            r = statement.get_stmt_info("PRAGMA table_info(galaxy)")
+            self.assertEqual(statement.StmtInfo("PRAGMA", True, False), r)
+
+
+class TestShape(unittest.TestCase):
+
+    def test_literals_are_stripped(self):
+        r1 = statement.get_shape("select * from galaxy where name='x' and size > 10")
+        r2 = statement.get_shape("SELECT *  FROM galaxy WHERE name=? AND size > :size")
+        self.assertEqual("SELECT * FROM GALAXY WHERE NAME = ? AND SIZE > ?", r1)
+        self.assertEqual(r1, r2)
+
+    def test_lists_are_collapsed(self):
+        with self.subTest():
+            r = statement.get_shape("DELETE FROM galaxy WHERE size IN (1, 2, 3)")
+            self.assertEqual("DELETE FROM GALAXY WHERE SIZE IN ( ? )", r)
+        with self.subTest():
+            r = statement.get_shape("INSERT INTO galaxy VALUES (?, ?), ('x', 1)")
+            self.assertEqual("INSERT INTO GALAXY VALUES ( ? )", r)
+
+
+if __name__ == "__main__":
+    unittest.main()